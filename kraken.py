@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 import hmac, base64, hashlib
 import time
 import pandas as pd
+import numpy as np
 import websocket
 import sqlite3
 from pathlib import Path
@@ -14,6 +15,39 @@ from datetime import datetime
 from tqdm import tqdm
 import sys
 import math
+import threading
+import collections
+import asyncio
+import bisect
+import zlib
+import functools
+import queue
+import multiprocessing
+import shutil
+import atexit
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+# orjson is optional, but it decodes the websocket messages several times faster than the standard json library
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# pyarrow is optional, it is only needed for the Parquet backend of KrakenData (see KrakenData(backend='parquet'))
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pa_dataset
+    import pyarrow.parquet as pq
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+# duckdb is optional, when it is installed .ohlcv_df() aggregates Parquet datasets inside duckdb instead of in pandas
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
 
 # load the .env file that your Kraken keys are stored in (must be at or above this library level)
 load_dotenv()
@@ -798,22 +832,38 @@ class PublicKraken:
 
         return bids['bids']
 
-    def get_current_bid(self):
+    def get_current_bid(self, live=True):
         # returns the current bid for a selected pair
         '''
+        args:
+            * Optional: live = read the bid from a connected KrakenWS.top_of_book() feed when there is one
+                - Default is set to True
+
         returns: 
             - A list of current bid info -- [price, volume, timestamp]
         '''
+        live_book = live_top_of_book.get(pair_key(self.asset)) if live else None
+        if live_book is not None:
+            return list(live_book[1])
+
         bid = self.get_order_book()
 
         return bid['bids'][0]
 
-    def get_current_ask(self):
+    def get_current_ask(self, live=True):
         # returns the current bid for a selected pair
         '''
+        args:
+            * Optional: live = read the ask from a connected KrakenWS.top_of_book() feed when there is one
+                - Default is set to True
+
         returns: 
             - A list of current ask info -- [price, volume, timestamp]
         '''
+        live_book = live_top_of_book.get(pair_key(self.asset)) if live else None
+        if live_book is not None:
+            return list(live_book[2])
+
         ask = self.get_order_book()
 
         return ask['asks'][0]
@@ -1894,397 +1944,2501 @@ class PrivateKraken:
         return message
 
 
-class KrakenWS:
+class KrakenExecution:
+    '''
+    Execution scheduler that splits a large "parent" order into smaller "child" orders spread out over time.
+        - 'twap' = time weighted, every child order is the same size
+        - 'vwap' = volume weighted, child orders follow the historical intraday volume profile from the KrakenData database
 
-    def __init__(self, asset=None):
-        self.asset = asset
-    
-    def ping_pong(auth):
-        # wrapper function to be sure server is responsive before sending any traffic
+    Several parent orders can run at the same time, each one in its own thread.  All of them share the same private rate limiter.
+
+    args:
+        * Optional: userref = the user reference id to place the child orders under
+        * Optional: rate_limiter = RateLimiter used for the private API calls
+            - Default is the module wide 'private_rate_limiter'
+    '''
+
+    def __init__(self, userref=None, rate_limiter=None):
+        self.userref = userref
+        self.rate_limiter = rate_limiter
+        self.parents = {}
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def submit(self, asset, side, volume, duration, slices=10, schedule='twap', db_path=None, lookback_days=30, ordertype='market', price_offset=0, validate=False):
         '''
         args:
-            - auth = Authenticated websocket (True) or non-Authenticated (False)
+            - asset = trading pair to execute (i.e.- 'ethusd', 'XBT/USD')
+            - side = 'buy' or 'sell'
+            - volume = total volume of the parent order (in base currency)
+            - duration = number of seconds to spread the parent order over
+            * Optional: slices = number of child orders to split the parent order into
+                - Default is set to 10
+            * Optional: schedule = 'twap' or 'vwap'
+                - Default is set to 'twap'.  'vwap' requires 'db_path'
+            * Optional: db_path = path to the KrakenData sqlite database (only used for 'vwap')
+            * Optional: lookback_days = days of trade history used to build the 'vwap' volume profile
+                - Default is set to 30
+            * Optional: ordertype = 'market' or 'limit'
+                - Default is set to 'market'.  Limit child orders are placed at the touch plus 'price_offset'
+            * Optional: price_offset = amount (in quote currency) added to the bid (buys) or subtracted from the ask (sells) for limit child orders
+                - Default is set to 0
+            * Optional: validate = True or False, when set to True the child orders are only validated by Kraken and not sent to the book
+
+        returns:
+            - The parent order id, which can be passed to .progress(), .wait() or .cancel()
         '''
-        def wrapper(*args, **kwargs):
-            if auth == True:
-                ws = websocket.create_connection('wss://ws-auth.kraken.com')
-            else:
-                ws = websocket.create_connection('wss://ws.kraken.com')
-            
-            payload = {
-                'event': 'ping'
+        if side != 'buy' and side != 'sell':
+            raise Exception({'input_error':"'side' must be either 'buy' or 'sell'"})
+
+        if float(volume) <= 0:
+            raise Exception({'input_error':'Must enter in a positive volume for the parent order'})
+
+        if schedule not in ('twap', 'vwap'):
+            raise Exception({'input_error':"'schedule' must be either 'twap' or 'vwap'"})
+
+        if schedule == 'vwap' and db_path is None:
+            raise Exception({'input_error':"'db_path' is required to build a 'vwap' schedule"})
+
+        if ordertype not in ('market', 'limit'):
+            raise Exception({'input_error':"'ordertype' must be either 'market' or 'limit'"})
+
+        # pull in the precision and minimums for the pair so every child order is a valid Kraken order
+        public_rate_limiter.acquire()
+        pair_info = PublicKraken(asset).get_pair_info()
+        lot_decimals = int(pair_info['lot_decimals'])
+        pair_decimals = int(pair_info['pair_decimals'])
+        base_min = float(pair_info['ordermin'])
+
+        # build the weights for each slice
+        if schedule == 'twap':
+            weights = [1 / slices] * slices
+        else:
+            weights = KrakenData(asset).volume_profile(db_path, duration=duration, slices=slices, lookback_days=lookback_days)
+
+        child_volumes = self.child_volumes(volume, weights, lot_decimals, base_min)
+
+        # the arrival price is the mid price when the parent order is submitted, this is what implementation shortfall is measured against
+        arrival_price = self._mid_price(asset)
+
+        start = time.time()
+        step = duration / slices
+
+        with self._lock:
+            self._count += 1
+            parent_id = f'{asset.upper()}-{side}-{self._count}'
+
+            parent = {
+                'parent_id': parent_id,
+                'asset': asset,
+                'side': side,
+                'volume': float(volume),
+                'schedule': schedule,
+                'ordertype': ordertype,
+                'price_offset': price_offset,
+                'pair_decimals': pair_decimals,
+                'validate': validate,
+                'arrival_price': arrival_price,
+                'last_price': arrival_price,
+                # each child is [send_time, volume]
+                'children': [[start + (i * step), vol] for i, vol in enumerate(child_volumes) if vol > 0],
+                'txids': [],
+                'sent_volume': 0.0,
+                'filled_volume': 0.0,
+                'filled_cost': 0.0,
+                'status': 'running',
+                'error': None,
+                'cancel': threading.Event()
             }
+            self.parents[parent_id] = parent
 
-            ws.send(json.dumps(payload))
+        thread = threading.Thread(target=self._run_parent, args=(parent,), daemon=True)
+        parent['thread'] = thread
+        thread.start()
 
-            # start an infinite loop until the server returns a 'pong'
-            i = True
-            while i == True:
-                ping = json.loads(ws.recv())
-                print('yes')
-                # once 'pong' is recieved, then kill the loop and allow function to occur
-                if ping['event'] == 'pong':
-                    i = False
-        return wrapper
+        return parent_id
 
-    def get_ws_token(self):
+    @staticmethod
+    def child_volumes(volume, weights, lot_decimals, base_min=0):
         '''
+        args:
+            - volume = total parent volume
+            - weights = list of weights for each slice (will be normalized)
+            - lot_decimals = maximum decimals allowed for the volume of the pair
+            * Optional: base_min = minimum order volume for the pair
+
         returns:
-            - An authenticated websocket token
-            * NOTICE: if not used, the token will expire within 15 minutes and a new token will have to be requested
+            - A list of child volumes that add up to 'volume'.  Slices smaller than 'base_min' are rolled into the next slice.
         '''
-        # will return the wwebsockets token that is needed for all ws function calls
-
-        # create an empty 'data' dictionary since there are no fields to pass through
-        data = {}
+        total_weight = float(sum(weights))
+        if total_weight <= 0:
+            weights = [1] * len(weights)
+            total_weight = float(len(weights))
+
+        # the split is done in whole lots (integers), so no volume is lost to float rounding along the way
+        scale = 10 ** lot_decimals
+        total = int(round(float(volume) * scale))
+
+        lots = []
+        allocated = 0
+        carry = 0
+        cumulative_weight = 0.0
+        for i, weight in enumerate(weights):
+            # each slice is the difference of the floored running totals, so the slices always add up to 'total'
+            cumulative_weight += weight
+            target = total if i == len(weights) - 1 else min(total, int(math.floor(total * cumulative_weight / total_weight)))
+            child = target - allocated + carry
+            allocated = target
+
+            # if the slice is too small to be a valid order, push it into the next slice
+            if child / scale < base_min:
+                carry = child
+                lots.append(0)
+            else:
+                carry = 0
+                lots.append(child)
+
+        # whatever is left over (a too small last slice) is added to the last valid child order
+        for i in reversed(range(len(lots))):
+            if lots[i] > 0:
+                lots[i] += carry
+                break
+        else:
+            lots[-1] = total
 
-        # use the private function 'authenticate' to request a token from the REST API
-        token = PrivateKraken().authenticate('GetWebSocketsToken', data)['token']
+        return [round(child / scale, lot_decimals) for child in lots]
 
-        # return the token
-        return token
+    def progress(self, parent_id=None):
+        '''
+        args:
+            * Optional: parent_id = parent order to report on
+                - Default is set to 'None' which returns all parent orders
 
-    def ws_name(self):
-        '''        
         returns:
-            - wsname of specified trading pair/pairs
+            - A dictionary of fill progress for the parent order(s):
+                status = 'running', 'done', 'cancelled' or 'error'
+                volume = total parent volume
+                sent_volume = volume sent to Kraken so far
+                filled_volume = volume filled so far
+                fill_pct = percent of the parent volume filled
+                avg_price = average fill price
+                arrival_price = mid price when the parent was submitted
+                shortfall_bps = implementation shortfall in basis points (execution cost on the filled volume plus opportunity cost on the unfilled volume)
         '''
-        # takes in any name and returns the wsname
-            # can take a list (for multiple pairs) or a single string
-        # this will mainly be used as a helper function within other functions to minimize naming convention errors
-        
-        url = 'https://api.kraken.com/0/public/AssetPairs'
-        res = requests.get(url).json()
+        if parent_id is None:
+            return {pid: self.progress(pid) for pid in list(self.parents)}
+
+        parent = self.parents[parent_id]
+
+        with self._lock:
+            filled = parent['filled_volume']
+            cost = parent['filled_cost']
+            avg_price = cost / filled if filled > 0 else None
+            arrival = parent['arrival_price']
+            sign = 1 if parent['side'] == 'buy' else -1
+
+            # execution cost on the filled volume plus the opportunity cost of what is still unfilled, relative to the arrival price
+            unfilled = parent['volume'] - filled
+            execution_cost = sign * (cost - (filled * arrival))
+            opportunity_cost = sign * (parent['last_price'] - arrival) * unfilled
+            shortfall_bps = ((execution_cost + opportunity_cost) / (arrival * parent['volume'])) * 10000
+
+            return {
+                'status': parent['status'],
+                'volume': parent['volume'],
+                'sent_volume': parent['sent_volume'],
+                'filled_volume': filled,
+                'fill_pct': (filled / parent['volume']) * 100,
+                'avg_price': avg_price,
+                'arrival_price': arrival,
+                'shortfall_bps': shortfall_bps,
+                'children_left': len(parent['children']),
+                'error': parent['error']
+            }
 
-        # instantiate the list we will return from this funtion (if given a list), along with the naming classification dictionaries we will need.
-        ws_names = []
-        wsdict = {}
-        altdict = {}
+    def wait(self, parent_id=None):
+        '''
+        Blocks until the parent order (or all parent orders if no parent_id is given) has finished.
+        '''
+        parent_ids = list(self.parents) if parent_id is None else [parent_id]
+        for pid in parent_ids:
+            self.parents[pid]['thread'].join()
 
-        pair = self.asset
+        return self.progress(parent_id)
 
-        # as long as Kraken is not returning an error, start the logic on converting the names to wsnames
-        if not res['error']:
-            # populate the wsdict and altdict with the wsnames and alternative names and then create a list of the key/value pairs so that we can index them later
-            for coin in res['result']:
-                try:
-                    wsdict[coin] = res['result'][coin]['wsname']
-                except KeyError: continue
+    def cancel(self, parent_id):
+        '''
+        Stops sending new child orders for the parent order and cancels any child orders still resting on the book.
+        '''
+        parent = self.parents[parent_id]
+        parent['cancel'].set()
+        parent['thread'].join()
 
-            for coin in res['result']:
+        if not parent['validate']:
+            for txid in parent['txids']:
+                self._limiter().acquire()
                 try:
-                    altdict[coin] = res['result'][coin]['altname']
-                except KeyError: continue
-            
-            # don't actually need the keys for wsdict here, since the value is what we are trying to return any how.  
-            wsdictvals = list(wsdict.values())
+                    PrivateKraken(parent['asset'], self.userref).cancel_single_order(txid)
+                except Exception:
+                    # orders that are already filled or closed cannot be cancelled
+                    continue
+
+        return self.progress(parent_id)
+
+    def _limiter(self):
+        # the rate limiter is looked up lazily so the module wide limiter can be defined at the bottom of this file
+        if self.rate_limiter is None:
+            return private_rate_limiter
+        return self.rate_limiter
+
+    def _mid_price(self, asset):
+        # public call, so it shares the public rate limiter with everything else in this process
+        public_rate_limiter.acquire()
+        ticker = PublicKraken(asset).get_ticker_info()
+        ticker = list(ticker.values())[0]
+        return (float(ticker['a'][0]) + float(ticker['b'][0])) / 2
+
+    def _run_parent(self, parent):
+        # places each child order at its scheduled time until the parent order is finished or cancelled
+        try:
+            while parent['children']:
+                send_time, child_volume = parent['children'][0]
+
+                # wait for the scheduled send time (or stop right away if the parent order is cancelled)
+                if parent['cancel'].wait(max(0, send_time - time.time())):
+                    parent['status'] = 'cancelled'
+                    break
+
+                price = None
+                if parent['ordertype'] == 'limit':
+                    public_rate_limiter.acquire()
+                    ticker = list(PublicKraken(parent['asset']).get_ticker_info().values())[0]
+                    if parent['side'] == 'buy':
+                        price = float(ticker['b'][0]) + parent['price_offset']
+                    else:
+                        price = float(ticker['a'][0]) - parent['price_offset']
+                    price = str(round(price, parent['pair_decimals']))
+
+                self._limiter().acquire()
+                message = PrivateKraken(parent['asset'], self.userref).add_standard_order(
+                    side=parent['side'],
+                    volume=str(child_volume),
+                    ordertype=parent['ordertype'],
+                    price=price,
+                    validate=parent['validate']
+                )
 
-            altdictkeys = list(altdict.keys())
-            altdictvals = list(altdict.values())
+                with self._lock:
+                    parent['children'].pop(0)
+                    parent['sent_volume'] += child_volume
+                    # validated orders never get a txid, so there is nothing to track fills on
+                    parent['txids'].extend(message.get('txid', []))
 
-            # first thing to check is if the entered pair data is a list or not, if it is a list, return a list
-            if type(pair) == list:
-                for coin in pair:
-                    coin = coin.upper()
-                    # since BTC/USD is a common form people will use, but Kraken does not recognize, we will need to make a manual case for this one
-                    if coin=='BTCUSD' or coin=='BTC/USD':
-                        ws_names.append('XBT/USD')
-                    # if the name entered is already in the Kraken trading format (i.e.- 'XETHZUSD') then return the wsname for it, otherwise we need to find the match
-                    elif coin in res['result']:
-                        ws_names.append(res['result'][coin]['wsname'])
-                    else:
-                        # if the name already exists in the wsname dictionary values, then the name is already in wsname format and we will add that to the list to return
-                        if coin in wsdictvals:
-                            ws_names.append(coin)
-                        # otherwise, if the name is an alternative name we need to convert it to the wsname
-                        elif coin in altdictvals:
-                            pos = altdictvals.index(coin)
-                            kname = altdictkeys[pos]
-                            ws_names.append(wsdict[kname])
-                        else:
-                            raise Exception(f'Error Message: {coin} is not a recognized trading pair by Kraken.')
-                            
-                return ws_names
+                self._update_fills(parent)
 
-                # if the entered pair is not a list, then return a string following the same logic from above (just returning the values instead of adding them to a list)
-            else:
-                pair = pair.upper()
+            # market orders fill right away, but limit orders may still be resting so poll one last time
+            self._update_fills(parent)
 
-                if pair=='BTCUSD' or pair=='BTC/USD':
-                    return 'XBT/USD'
+            if parent['status'] == 'running':
+                parent['status'] = 'done'
 
-                elif pair in res['result']:
-                    return res['result'][pair]['wsname']
-                else:
+        except Exception as e:
+            parent['status'] = 'error'
+            parent['error'] = e
 
-                    if pair in wsdictvals:
-                        return pair
+    def _update_fills(self, parent):
+        # query the child orders and recalculate the filled volume and cost of the parent order
+        last_price = self._mid_price(parent['asset'])
 
-                    elif pair in altdictvals:
-                        pos = altdictvals.index(pair)
-                        kname = altdictkeys[pos]
-                        return wsdict[kname]
-                    else:
-                        raise Exception(f'Error Message: {pair} is not a recognized trading pair by Kraken.')
+        if not parent['txids']:
+            with self._lock:
+                parent['last_price'] = last_price
+            return
 
-        # if Kraken returns an error, then have the function return it as well
-        else:
-            raise Exception(res['error'])
+        filled = 0.0
+        cost = 0.0
+        # QueryOrders only takes up to 50 txids at a time
+        for i in range(0, len(parent['txids']), 50):
+            self._limiter().acquire()
+            data = PublicKraken().make_api_data(txid=','.join(parent['txids'][i:i + 50]))
+            orders = PrivateKraken(parent['asset'], self.userref).authenticate('QueryOrders', data)
 
-    def ws_ticker(self, reqid=None):
-        '''        
-        returns:
-            -Dictionary of websocket data (see Kraken Websocket docs for full data definitioins)
-        '''
+            for order in orders.values():
+                filled += float(order['vol_exec'])
+                cost += float(order['cost'])
 
-        # create a function that will open a websockets connection to the Kraken websocket API and pull in the 'ticker' channel
-        # this is a bunch of info about a ticker that comes in - if more specific data is needed, it is suggested to look at the other channels:
-            # OHLC
-            # Trades
-            # Spread
-            # Book
+        with self._lock:
+            parent['filled_volume'] = filled
+            parent['filled_cost'] = cost
+            parent['last_price'] = last_price
 
-        # first, be sure the servers are online or at least in post_only mode
-        PublicKraken().guarantee_online()
 
-        # initiate our connection
-        ws = websocket.create_connection('wss://ws.kraken.com/')
+# typed records yielded by the websocket streams (see KrakenWS.stream)
+# namedtuples are used because they have empty __slots__, so every record is a plain tuple with no per-record dictionary
+TickerRecord = collections.namedtuple('TickerRecord', ['pair', 'ask', 'ask_volume', 'bid', 'bid_volume', 'last', 'last_volume', 'volume', 'vwap', 'trades', 'low', 'high', 'open'])
+TradeRecord = collections.namedtuple('TradeRecord', ['pair', 'price', 'volume', 'time', 'side', 'ordertype', 'misc'])
+OHLCRecord = collections.namedtuple('OHLCRecord', ['pair', 'time', 'end_time', 'open', 'high', 'low', 'close', 'vwap', 'volume', 'count', 'interval'])
+SpreadRecord = collections.namedtuple('SpreadRecord', ['pair', 'bid', 'ask', 'time', 'bid_volume', 'ask_volume'])
 
-        # be sure 'pair' is in wsname format
-        pair = self.ws_name()
+# numpy layout for trades, side is 1 for buys and -1 for sells and ordertype is 0 for market and 1 for limit orders
+TRADE_DTYPE = np.dtype([('time', 'f8'), ('price', 'f8'), ('volume', 'f8'), ('side', 'i1'), ('ordertype', 'i1')])
 
-        # be sure 'pair' is a list
-        if type(pair)==list:
-            pair = pair
-        else:
-            pair = [pair]
 
-        # create the payload to be sent to the websocket API
-        if reqid==None:
-            payload = json.dumps({
-                'event': 'subscribe',
-                'pair': pair,
-                'subscription': {
-                    'name': 'ticker'
-                }           
-            })
-        else:
-            payload = json.dumps({
-                'event': 'subscribe',
-                'pair': pair,
-                'reqid': reqid,
-                'subscription': {
-                    'name': 'ticker'
-                }
-            })
+def parse_ticker(pair, data, channel_name='ticker'):
+    return [TickerRecord(
+        pair,
+        float(data['a'][0]), float(data['a'][2]),
+        float(data['b'][0]), float(data['b'][2]),
+        float(data['c'][0]), float(data['c'][1]),
+        float(data['v'][1]), float(data['p'][1]), int(data['t'][1]),
+        float(data['l'][1]), float(data['h'][1]), float(data['o'][1])
+    )]
 
-        # send our packet along
-        ws.send(payload)
 
-        # loop through the returned data
-        while True:
-            trade_data = json.loads(ws.recv())
+def parse_trade(pair, data, channel_name='trade'):
+    return [TradeRecord(pair, float(trade[0]), float(trade[1]), float(trade[2]), trade[3], trade[4], trade[5]) for trade in data]
 
-            print(trade_data)
 
-        ws.close()
+def parse_ohlc(pair, data, channel_name='ohlc-1'):
+    return [OHLCRecord(
+        pair,
+        float(data[0]), float(data[1]),
+        float(data[2]), float(data[3]), float(data[4]), float(data[5]),
+        float(data[6]), float(data[7]), int(data[8]),
+        int(channel_name[5:])
+    )]
 
-    def ws_trade(self, reqid=None):
-        '''        
-        returns:
-            -Dictionary of websocket data (see Kraken Websocket docs for full data definitioins)
-        '''
 
-        # create a function that will open a websockets connection to the Kraken websocket API and pull in the 'trade' channel
+def parse_spread(pair, data, channel_name='spread'):
+    return [SpreadRecord(pair, float(data[0]), float(data[1]), float(data[2]), float(data[3]), float(data[4]))]
 
-        # first, be sure the servers are online or at least in post_only mode
-        PublicKraken().guarantee_online()
 
-        # initiate our connection
-        ws = websocket.create_connection('wss://ws.kraken.com/')
+# parser for each channel, looked up by the channel name without its interval/depth suffix
+RECORD_PARSERS = {
+    'ticker': parse_ticker,
+    'trade': parse_trade,
+    'ohlc': parse_ohlc,
+    'spread': parse_spread
+}
 
-        # be sure 'pair' is in wsname format
-        pair = self.ws_name()
+# latest top of book from every connected KrakenWS.top_of_book() feed: {pair key: (SpreadRecord, bid, ask)}
+# PublicKraken.get_current_bid()/get_current_ask() read from here before falling back to the REST order book, so bid and ask
+# are kept like the REST order book levels -- [price string, volume string, integer timestamp]
+live_top_of_book = {}
 
-        # be sure 'pair' is a list
-        if type(pair)==list:
-            pair = pair
-        else:
-            pair = [pair]
 
-        # create the payload to be sent to the websocket API
-        if reqid==None:
-            payload = json.dumps({
-                'event': 'subscribe',
-                'pair': pair,
-                'subscription': {
-                    'name': 'trade'
-                }           
-            })
-        else:
-            payload = json.dumps({
-                'event': 'subscribe',
-                'pair': pair,
-                'reqid': reqid,
-                'subscription': {
-                    'name': 'trade'
-                }
-            })
+def pair_key(pair):
+    # one key for the different ways of writing a pair (i.e.- 'eth/usd', 'ETHUSD' and 'ETH/USD' are all 'ETHUSD')
+    return str(pair).upper().replace('/', '')
 
-        # send our packet along
-        ws.send(payload)
 
-        # loop through the returned data
-        while True:
-            trade_data = json.loads(ws.recv())
+def trades_to_array(data, out=None):
+    '''
+    args:
+        - data = trade payload from the websocket (a list of [price, volume, time, side, ordertype, misc])
+        * Optional: out = preallocated TRADE_DTYPE array to write the trades into (must be at least len(data) long)
+            - Default is set to 'None' which allocates a new array
 
-            print(trade_data)
+    returns:
+        - A numpy structured array (TRADE_DTYPE) of the trades with numeric fields
+    '''
+    count = len(data)
+    if out is None:
+        out = np.empty(count, dtype=TRADE_DTYPE)
+    out = out[:count]
 
-        ws.close()
+    # numpy parses the price/volume/time strings in C, which is much faster than calling float() on every field
+    columns = np.array([trade[:3] for trade in data], dtype='f8').reshape(count, 3)
+    out['price'] = columns[:, 0]
+    out['volume'] = columns[:, 1]
+    out['time'] = columns[:, 2]
+    out['side'] = [1 if trade[3] == 'b' else -1 for trade in data]
+    out['ordertype'] = [0 if trade[4] == 'm' else 1 for trade in data]
 
-    def ws_ohlc(self, interval, display=True, reqid=None):
-        '''      
-        args: \n
-            -'interval' = this is the interval for which the ohlc data will be built (in minutes)
-        returns: \n
-            - A dictionary of ohlc items:\n
-                -'current_time' = time of most recent trade
-                -'end_time' = time when the current interval will end
-                -'open' = opening price of the current interval
-                -'high' = highest price of the current interval
-                -'low' = lowest price of the current interval
-                -'close' = closing price of the current interval (a.k.a.: the current price)
-                -'vwap' = volume weighted average price of the current interval
-                -'volume' = volume of traded asset in the current interval
-                -'count' = number of trades within the current interval
-        '''
+    return out
 
-        # create a function that will open a websockets connection to the Kraken websocket API and pull in the 'ohlc' channel
 
-        # first, be sure the servers are online or at least in post_only mode
-        PublicKraken().guarantee_online()
 
-        # initiate our connection
-        ws = websocket.create_connection('wss://ws.kraken.com/')
+class KrakenStream:
+    '''
+    Bounded buffer between a KrakenWS connection and the code consuming its records.  Works both as a regular iterator
+    (for record in stream) and as an async iterator (async for record in stream).
+
+    args:
+        - ws = KrakenWS connection that feeds the stream
+        * Optional: maxsize = maximum number of records held in the buffer
+            - Default is set to 1000
+        * Optional: overflow = what to do when the buffer is full:
+            - 'block' (default) = the socket waits until the consumer catches up (this also pauses every other handler on the connection)
+            - 'drop_oldest' = the oldest record in the buffer is thrown away
+            - 'conflate' = only the latest record for each pair is kept
+        * Optional: owns_connection = close the websocket connection when the stream is closed
+            - Default is set to True
+    '''
 
-        # be sure 'pair' is in wsname format
-        pair = self.ws_name()
+    def __init__(self, ws, maxsize=1000, overflow='block', owns_connection=True):
+        if overflow not in ('block', 'drop_oldest', 'conflate'):
+            raise Exception({'input_error': "'overflow' must be either 'block', 'drop_oldest' or 'conflate'"})
 
-        # be sure 'pair' is a list
-        if type(pair)==list:
-            pair = pair
-        else:
-            pair = [pair]
+        self.ws = ws
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.owns_connection = owns_connection
+        self.dropped = 0
+        self.closed = False
 
-        # create the payload to be sent to the websocket API
-        if reqid==None:
-            payload = json.dumps({
-                'event': 'subscribe',
-                'pair': pair,
-                'subscription': {
-                    'name': 'ohlc',
-                    'interval': interval
-                }           
-            })
+        # 'conflate' keeps one record per pair, so it uses an ordered dictionary instead of a deque
+        if overflow == 'conflate':
+            self._buffer = collections.OrderedDict()
         else:
-            payload = json.dumps({
-                'event': 'subscribe',
-                'pair': pair,
-                'reqid': reqid,
-                'subscription': {
-                    'name': 'ohlc',
-                    'interval': interval
-                }
-            })
+            self._buffer = collections.deque()
+        self._cond = threading.Condition()
+        self._handlers = []
+        # 'async for' consumers waiting on their event loop: {(loop, asyncio.Event)}
+        self._async_waiters = set()
+
+    def put(self, record):
+        # called from the websocket thread for every record
+        with self._cond:
+            if self.closed:
+                return
+
+            if self.overflow == 'conflate':
+                key = (type(record).__name__, record.pair)
+                if key in self._buffer:
+                    self._buffer[key] = record
+                    self.dropped += 1
+                else:
+                    if len(self._buffer) >= self.maxsize:
+                        self._buffer.popitem(last=False)
+                        self.dropped += 1
+                    self._buffer[key] = record
 
-        # send our packet along
-        ws.send(payload)
+            elif self.overflow == 'drop_oldest':
+                if len(self._buffer) >= self.maxsize:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                self._buffer.append(record)
 
-        # loop through the returned data
-        while True:
-            trade_data = json.loads(ws.recv())
+            else:
+                while len(self._buffer) >= self.maxsize and not self.closed:
+                    self._cond.wait()
+                if self.closed:
+                    return
+                self._buffer.append(record)
+
+            self._cond.notify_all()
+            self._wake_async()
+
+    def _wake_async(self):
+        # called with the condition held, hands the wake up to each waiting event loop's own thread
+        for loop, event in list(self._async_waiters):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # the loop was closed without the consumer finishing
+                self._async_waiters.discard((loop, event))
 
-            # if there is data, put it in a dictionary
-            
-            if type(trade_data) == list:
-                ohlc_data = {}
-                ohlc_data = {'current_time': trade_data[1][0],
-                            'end_time': trade_data[1][1],
-                            'open': trade_data[1][2],
-                            'high': trade_data[1][3],
-                            'low': trade_data[1][4],
-                            'close': trade_data[1][5],
-                            'vwap': trade_data[1][6],
-                            'volume': trade_data[1][7],
-                            'count': trade_data[1][8],
-                            'ohlc_interval': interval
-                            }
-            
-                if display == True:
-                    print(ohlc_data)
+    def get(self, timeout=None):
+        '''
+        args:
+            * Optional: timeout = seconds to wait for a record
+                - Default is set to 'None' which waits until a record comes in or the stream is closed
 
-        ws.close()
+        returns:
+            - The next record, or 'None' if the timeout passed or the stream is closed
+        '''
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._buffer or self.closed, timeout):
+                return None
 
-    def guarantee_no_open_order(self, order_id=None):
-        # this function will connect to the websocket and pause any logic from running until either there are no open orders,
-        # or the order_id that is provided is no longer open
-        # see https://support.kraken.com/hc/en-us/articles/360034499452-WebSocket-API-private-feeds-openOrders for more info
+            if not self._buffer:
+                return None
 
-        # create the websocket token needed for authenticated access
-        token = self.get_ws_token()
+            if self.overflow == 'conflate':
+                record = self._buffer.popitem(last=False)[1]
+            else:
+                record = self._buffer.popleft()
 
-        # connect to the authenticated websocket
-        ws = websocket.create_connection('wss://ws-auth.kraken.com/')
+            self._cond.notify_all()
+            return record
 
-        # subscribe to the open orders authenticated websocket endpoint
-        payload = json.dumps({
-            'event': 'subscribe',
-            'subscription': {
-                'name': 'openOrders',
-                'token': token
-            }
-        })
+    def close(self):
+        '''
+        Stops the stream, removes it from the connection and closes the connection if the stream owns it.
+        '''
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self._cond.notify_all()
+            self._wake_async()
 
-        # send the packet data to Kraken websocket
-        ws.send(payload)
+        for channel_name, handler in self._handlers:
+            self.ws.remove_handler(channel_name, handler)
 
-        # recieve the connection and subscription message, if no message raise an Exception
-        if not json.loads(ws.recv()):
-            raise Exception({'websocket_error': 'Error Message: Could not connect to channel'})
+        if self.owns_connection:
+            self.ws.stop()
 
-        if not json.loads(ws.recv()):
-            raise Exception({'websocket_error': 'Error Message: Could not subscribe to channel'})
+    def __len__(self):
+        return len(self._buffer)
 
-        # loop through the responses until either: A) there are no open orders or, B) the provided order_id is no longer open
-        # instantiate initial loop condition and a list for tracking order_ids and dictionary for tracking order_status
-        loop = 1
-        list_of_orders = []
-        order_status = {}
-        while loop == 1:
-            
-            # save the response as a variable to call later on
-            orders = json.loads(ws.recv())
+    def __iter__(self):
+        return self
 
-            # if there are no orders initially, end the loop and close the websocket
-            if type(orders) == dict and orders['event'] == 'heartbeat':
-                continue
-            elif not orders[0]:
-                loop = 0
-            
-            # create a list of the order_ids to reference later
-            if type(orders) == list:
-                for order_data in orders[0]:
-                    for order in order_data:
-                        list_of_orders.append(order)
+    def __next__(self):
+        record = self.get()
+        if record is None:
+            raise StopIteration
+        return record
 
-            # track the status of each order_id in a dictionary
-            if type(orders) == list:
-                for order_data in orders[0]:
-                    for order in list_of_orders:
-                        try:
-                            order_status[order] = order_data[order]['status']
-                        except: KeyError
-            
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # waits on an asyncio.Event that .put()/.close() set from the websocket thread, so the event loop is never blocked and
+        # no worker thread is left behind holding a record if the wait is cancelled
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            self._async_waiters.add(waiter)
+
+        try:
+            while True:
+                record = self.get(timeout=0)
+                if record is not None:
+                    return record
+                if self.closed:
+                    raise StopAsyncIteration
+
+                await waiter[1].wait()
+                waiter[1].clear()
+
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        # closing joins the connection's thread, so it is done off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+class KrakenOrderBook:
+    '''
+    Locally maintained L2 order book for one pair, built from the websocket 'book' channel (see KrakenWS.subscribe_book).
+
+    Price levels are kept in a dictionary (price -> [price string, volume string]) for O(1) level lookups, plus a sorted
+    list of prices for each side so the top of book is O(1) and price searches are O(log n).  The original price/volume
+    strings are kept because Kraken's checksum is calculated on them.
+
+    Updates are applied on the websocket thread while readers can be on any thread, so both hold the book's lock and a
+    reader never sees a price in the sorted list whose level was already deleted.
+
+    args:
+        - pair = wsname of the pair
+        * Optional: depth = depth of the book subscription
+            - Default is set to 10
+    '''
+
+    def __init__(self, pair, depth=10):
+        self.pair = pair
+        self.depth = depth
+        self.valid = False
+        self.last_update = None
+        self.checksum_failures = 0
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        # asks are sorted low -> high (best ask first), bids are sorted low -> high (best bid last)
+        with self._lock:
+            self._asks = {}
+            self._bids = {}
+            self._ask_prices = []
+            self._bid_prices = []
+
+    def apply(self, data):
+        '''
+        args:
+            - data = book payload from the websocket (a snapshot or update dictionary, or a list of them)
+
+        returns:
+            - True if the book is valid after the message
+            - False if the checksum did not match (the book needs a new snapshot)
+            - None if the message was an update that came in while waiting for a snapshot
+        '''
+        if type(data) != list:
+            data = [data]
+
+        with self._lock:
+            # updates are meaningless until a snapshot has been applied
+            if not self.valid and not any('as' in part or 'bs' in part for part in data):
+                return None
+
+            checksum = None
+            for part in data:
+                if 'as' in part or 'bs' in part:
+                    self._clear()
+                    for level in part.get('as', []):
+                        self._set_level('a', level)
+                    for level in part.get('bs', []):
+                        self._set_level('b', level)
+                    self.valid = True
+                else:
+                    for level in part.get('a', []):
+                        self._set_level('a', level)
+                    for level in part.get('b', []):
+                        self._set_level('b', level)
+
+                if 'c' in part:
+                    checksum = part['c']
+
+            self._truncate()
+            self.last_update = time.time()
+
+            if checksum is not None and self.checksum() != int(checksum):
+                self.checksum_failures += 1
+                self.valid = False
+
+            return self.valid
+
+    def _set_level(self, side, level):
+        # level = [price, volume, timestamp, (update type)] -- a volume of 0 removes the price level
+        price_str, volume_str = level[0], level[1]
+        price = float(price_str)
+
+        if side == 'a':
+            levels, prices = self._asks, self._ask_prices
+        else:
+            levels, prices = self._bids, self._bid_prices
+
+        if float(volume_str) == 0:
+            if price in levels:
+                del levels[price]
+                prices.pop(bisect.bisect_left(prices, price))
+        else:
+            if price not in levels:
+                bisect.insort(prices, price)
+            levels[price] = [price_str, volume_str]
+
+    def _truncate(self):
+        # Kraken does not send deletes for levels that fall out of the subscribed depth, so they must be dropped here
+        while len(self._ask_prices) > self.depth:
+            del self._asks[self._ask_prices.pop()]
+        while len(self._bid_prices) > self.depth:
+            del self._bids[self._bid_prices.pop(0)]
+
+    def checksum(self):
+        '''
+        returns:
+            - Kraken's CRC32 checksum of the top 10 asks and bids of the local book
+        '''
+        def format_level(levels, price):
+            price_str, volume_str = levels[price]
+            return price_str.replace('.', '').lstrip('0') + volume_str.replace('.', '').lstrip('0')
+
+        with self._lock:
+            checksum_string = ''.join(format_level(self._asks, price) for price in self._ask_prices[:10])
+            checksum_string += ''.join(format_level(self._bids, price) for price in reversed(self._bid_prices[-10:]))
+
+        return zlib.crc32(checksum_string.encode()) & 0xffffffff
+
+    def best_bid(self):
+        '''
+        returns:
+            - [price, volume] of the best bid, or 'None' if the bid side is empty
+        '''
+        with self._lock:
+            if not self._bid_prices:
+                return None
+            price = self._bid_prices[-1]
+            return [price, float(self._bids[price][1])]
+
+    def best_ask(self):
+        '''
+        returns:
+            - [price, volume] of the best ask, or 'None' if the ask side is empty
+        '''
+        with self._lock:
+            if not self._ask_prices:
+                return None
+            price = self._ask_prices[0]
+            return [price, float(self._asks[price][1])]
+
+    def spread(self):
+        with self._lock:
+            if not self._bid_prices or not self._ask_prices:
+                return None
+            return self._ask_prices[0] - self._bid_prices[-1]
+
+    def mid(self):
+        with self._lock:
+            if not self._bid_prices or not self._ask_prices:
+                return None
+            return (self._ask_prices[0] + self._bid_prices[-1]) / 2
+
+    def level(self, side, price):
+        '''
+        args:
+            - side = 'bid' or 'ask'
+            - price = price level to look up
+
+        returns:
+            - The volume resting at that price (0 if there is no level there)
+        '''
+        with self._lock:
+            levels = self._bids if side == 'bid' else self._asks
+            level = levels.get(float(price))
+        return float(level[1]) if level else 0.0
+
+    def levels(self, side, count=None):
+        '''
+        args:
+            - side = 'bid' or 'ask'
+            * Optional: count = number of levels to return (best first)
+                - Default is set to 'None' which returns every level in the book
+
+        returns:
+            - A list of [price, volume] from the best price outward
+        '''
+        with self._lock:
+            if side == 'bid':
+                prices = self._bid_prices[::-1]
+                levels = self._bids
+            else:
+                prices = self._ask_prices
+                levels = self._asks
+
+            if count is not None:
+                prices = prices[:count]
+
+            return [[price, float(levels[price][1])] for price in prices]
+
+    def volume_to_price(self, side, price):
+        '''
+        args:
+            - side = 'bid' or 'ask'
+            - price = price to walk the book to
+
+        returns:
+            - Total volume available from the top of book up to and including 'price'
+        '''
+        price = float(price)
+        with self._lock:
+            if side == 'bid':
+                prices = self._bid_prices[bisect.bisect_left(self._bid_prices, price):]
+                levels = self._bids
+            else:
+                prices = self._ask_prices[:bisect.bisect_right(self._ask_prices, price)]
+                levels = self._asks
+
+            return sum(float(levels[level][1]) for level in prices)
+
+
+class TradeRingBuffer:
+    '''
+    Fixed capacity, numpy backed buffer of the most recent trades for one pair (see KrakenWS.trade_buffers).
+
+    Every trade is written twice, at position i and i + capacity, so any window of the most recent trades is always one
+    contiguous slice of the underlying array.  That means every read is a zero-copy numpy view with time, price, volume,
+    side and ordertype columns (see TRADE_DTYPE).  Trades are kept in time order: trades older than the newest one in the
+    buffer (i.e.- backfilled after a reconnect) are merged in place.
+        *NOTICE: views point at the live buffer, which the websocket thread keeps writing to.  Pass copy=True (or use the
+                 .vwap()/.volume() aggregates, which hold the buffer's lock) for a consistent read from another thread.
+
+    args:
+        * Optional: capacity = number of trades to keep
+            - Default is set to 100000
+    '''
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.count = 0
+        self._next = 0
+        self._data = np.zeros(capacity * 2, dtype=TRADE_DTYPE)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, time, price, volume, side=1, ordertype=0):
+        '''
+        args:
+            - time = unix timestamp of the trade
+            - price = trade price
+            - volume = trade volume
+            * Optional: side = 1 for buys, -1 for sells
+            * Optional: ordertype = 0 for market, 1 for limit
+        '''
+        trade = np.array([(time, price, volume, side, ordertype)], dtype=TRADE_DTYPE)
+        self.extend(trade)
+
+    def extend(self, trades):
+        '''
+        args:
+            - trades = TRADE_DTYPE array of trades, oldest first (see trades_to_array)
+        '''
+        if not len(trades):
+            return
+
+        with self._lock:
+            # trades from before the newest trade in the buffer would break the time order .since()/.window() search on
+            if len(self) and trades['time'][0] < self._data[self._next + self.capacity - 1]['time']:
+                self._merge(trades)
+                return
+
+            trades = trades[-self.capacity:]
+            count = len(trades)
+
+            # write up to the end of the first half (and its mirror), then wrap around to the start for whatever is left
+            first = min(count, self.capacity - self._next)
+            self._data[self._next:self._next + first] = trades[:first]
+            self._data[self._next + self.capacity:self._next + self.capacity + first] = trades[:first]
+
+            rest = count - first
+            if rest > 0:
+                self._data[:rest] = trades[first:]
+                self._data[self.capacity:self.capacity + rest] = trades[first:]
+
+            self._next = (self._next + count) % self.capacity
+            self.count += count
+
+    def _merge(self, trades):
+        # rare (a backfill), so the whole buffer is sorted and written again from the start
+        merged = np.concatenate([self.last(), trades])
+        merged = merged[np.argsort(merged['time'], kind='stable')][-self.capacity:]
+        size = len(merged)
+
+        self._data[:size] = merged
+        self._data[self.capacity:self.capacity + size] = merged
+        self._next = size % self.capacity
+        self.count += len(trades)
+
+    def last(self, count=None, copy=False):
+        '''
+        args:
+            * Optional: count = number of trades to return
+                - Default is set to 'None' which returns every trade in the buffer
+            * Optional: copy = return a copy taken under the buffer's lock instead of a view
+                - Default is set to False
+
+        returns:
+            - A zero-copy view (or copy) of the most recent trades, oldest first
+        '''
+        with self._lock:
+            size = len(self)
+            if count is None or count > size:
+                count = size
+
+            end = self._next + self.capacity
+            trades = self._data[end - count:end]
+            return trades.copy() if copy else trades
+
+    def since(self, start_time, copy=False):
+        '''
+        args:
+            - start_time = unix timestamp
+            * Optional: copy = return a copy taken under the buffer's lock instead of a view
+                - Default is set to False
+
+        returns:
+            - A zero-copy view (or copy) of every trade in the buffer at or after 'start_time'
+        '''
+        with self._lock:
+            trades = self.last()
+            trades = trades[np.searchsorted(trades['time'], start_time, side='left'):]
+            return trades.copy() if copy else trades
+
+    def window(self, seconds, now=None, copy=False):
+        '''
+        args:
+            - seconds = length of the window
+            * Optional: now = end of the window as a unix timestamp
+                - Default is set to 'None' which uses the current time
+            * Optional: copy = return a copy taken under the buffer's lock instead of a view
+                - Default is set to False
+
+        returns:
+            - A zero-copy view (or copy) of the trades in the last 'seconds'
+        '''
+        if now is None:
+            now = time.time()
+        return self.since(now - seconds, copy)
+
+    def _select(self, count=None, seconds=None):
+        if seconds is not None:
+            return self.window(seconds)
+        return self.last(count)
+
+    def vwap(self, count=None, seconds=None):
+        '''
+        args:
+            * Optional: count = use the last 'count' trades
+            * Optional: seconds = use the trades in the last 'seconds' (takes priority over 'count')
+
+        returns:
+            - The volume weighted average price of the selected trades, or 'None' if there are none
+        '''
+        with self._lock:
+            trades = self._select(count, seconds)
+            volume = trades['volume'].sum()
+            if volume == 0:
+                return None
+            return float(np.dot(trades['price'], trades['volume']) / volume)
+
+    def volume(self, count=None, seconds=None, side=None):
+        '''
+        args:
+            * Optional: count = use the last 'count' trades
+            * Optional: seconds = use the trades in the last 'seconds' (takes priority over 'count')
+            * Optional: side = 'buy' or 'sell' to only add up one side
+                - Default is set to 'None' which adds up both sides
+
+        returns:
+            - The total traded volume of the selected trades
+        '''
+        with self._lock:
+            trades = self._select(count, seconds)
+            if side is not None:
+                trades = trades[trades['side'] == (1 if side == 'buy' else -1)]
+            return float(trades['volume'].sum())
+
+
+# a finished bar from OHLCVBarBuilder -- 'time' is the unix timestamp of the start of the bar (same as the ohlcv_df index)
+BarRecord = collections.namedtuple('BarRecord', ['pair', 'interval', 'time', 'open', 'high', 'low', 'close', 'volume', 'trade_count'])
+
+
+def interval_seconds(interval):
+    '''
+    args:
+        - interval = number of seconds, or a time string/pandas frequency (i.e.- '5s', '30s', '3min', '2h', '1D')
+
+    returns:
+        - The interval length in seconds
+    '''
+    if type(interval) in (int, float):
+        return float(interval)
+
+    try:
+        return pd.to_timedelta(interval).total_seconds()
+    except ValueError:
+        return pd.Timedelta(pd.tseries.frequencies.to_offset(interval)).total_seconds()
+
+
+class OHLCVBarBuilder:
+    '''
+    Builds OHLCV bars for any number of intervals at once from a live trade feed (see KrakenWS.bar_builder).
+
+    Bars follow the same rules as KrakenData().ohlcv_df(), which uses pandas' resample: bars are labeled by their start
+    time, include their start and exclude their end, are lined up from midnight (UTC) of the day of the first trade,
+    and intervals with no trades are NaN for open/high/low/close with 0 volume and 0 trade_count.
+
+    args:
+        - intervals = list of intervals (seconds or time strings, i.e.- ['5s', '30s', '3min', '2h'])
+        * Optional: on_bar = function called as on_bar(bar) with a BarRecord every time a bar closes
+        * Optional: max_bars = number of finished bars kept for each pair/interval for .to_df()
+            - Default is set to 10000
+    '''
+
+    def __init__(self, intervals, on_bar=None, max_bars=10000):
+        if type(intervals) not in (list, tuple):
+            intervals = [intervals]
+
+        self.intervals = list(intervals)
+        self.on_bar = on_bar
+        self.max_bars = max_bars
+        self.late_trades = 0
+        self._seconds = {interval: interval_seconds(interval) for interval in self.intervals}
+
+        # state for every (pair, interval):
+        #   origin = midnight of the first trade's day, index = bin number of the open bar, bar = [open, high, low, close, volume, trade_count]
+        self._state = {}
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    def update(self, pair, trade_time, price, volume):
+        '''
+        args:
+            - pair = pair the trade belongs to
+            - trade_time = unix timestamp of the trade
+            - price = trade price
+            - volume = trade volume
+        '''
+        closed = []
+
+        with self._lock:
+            for interval in self.intervals:
+                seconds = self._seconds[interval]
+                state = self._state.get((pair, interval))
+
+                if state is None:
+                    origin = math.floor(trade_time / 86400) * 86400
+                    state = self._state[(pair, interval)] = {'origin': origin, 'index': None, 'bar': None}
+
+                index = int((trade_time - state['origin']) // seconds)
+
+                # trades that belong to a bar that is already closed can't be added anymore
+                if state['index'] is not None and (index < state['index'] or (index == state['index'] and state['bar'] is None)):
+                    self.late_trades += 1
+                    continue
+
+                if state['bar'] is not None and index > state['index']:
+                    closed.append(self._close(pair, interval, state))
+
+                # fill in any intervals with no trades between the last bar and this one
+                if state['index'] is not None and state['bar'] is None:
+                    for empty in range(state['index'] + 1, index):
+                        closed.append(self._store(pair, interval, BarRecord(pair, interval, state['origin'] + (empty * seconds), np.nan, np.nan, np.nan, np.nan, 0.0, 0)))
+
+                if state['bar'] is None or index != state['index']:
+                    state['index'] = index
+                    state['bar'] = [price, price, price, price, volume, 1]
+                else:
+                    bar = state['bar']
+                    if price > bar[1]:
+                        bar[1] = price
+                    if price < bar[2]:
+                        bar[2] = price
+                    bar[3] = price
+                    bar[4] += volume
+                    bar[5] += 1
+
+        self._emit(closed)
+
+    def update_trades(self, pair, data):
+        '''
+        args:
+            - pair = pair the trades belong to
+            - data = trade payload from the websocket (a list of [price, volume, time, side, ordertype, misc])
+        '''
+        for trade in data:
+            self.update(pair, float(trade[2]), float(trade[0]), float(trade[1]))
+
+    def flush(self, now=None):
+        '''
+        Closes every open bar whose end time has passed, so quiet markets still get their bars on time.
+
+        args:
+            * Optional: now = unix timestamp
+                - Default is set to 'None' which uses the current time
+        '''
+        if now is None:
+            now = time.time()
+
+        closed = []
+        with self._lock:
+            for (pair, interval), state in self._state.items():
+                if state['bar'] is not None and state['origin'] + ((state['index'] + 1) * self._seconds[interval]) <= now:
+                    closed.append(self._close(pair, interval, state))
+
+        self._emit(closed)
+
+    def current(self, pair, interval):
+        '''
+        returns:
+            - A BarRecord of the bar that is still open for the pair/interval, or 'None'
+        '''
+        state = self._state.get((pair, interval))
+        if state is None or state['bar'] is None:
+            return None
+        return BarRecord(pair, interval, state['origin'] + (state['index'] * self._seconds[interval]), *state['bar'])
+
+    def bars(self, pair, interval):
+        '''
+        returns:
+            - A list of the finished BarRecords for the pair/interval, oldest first
+        '''
+        return list(self._bars.get((pair, interval), []))
+
+    def to_df(self, interval, include_last_period=True):
+        '''
+        args:
+            - interval = one of the builder's intervals
+            * Optional: include_last_period = include the bar that is still open
+                - Default is set to True
+
+        returns:
+            - A multiindex dataframe in the same format as KrakenData().ohlcv_df()
+        '''
+        frames = []
+        for (pair, bar_interval), bars in list(self._bars.items()):
+            if bar_interval != interval:
+                continue
+
+            bars = list(bars)
+            if include_last_period and self.current(pair, interval) is not None:
+                bars.append(self.current(pair, interval))
+
+            df = pd.DataFrame(bars, columns=BarRecord._fields)
+            df['date'] = pd.to_datetime(df['time'], unit='s')
+            df = df.set_index('date')[['open', 'high', 'low', 'close', 'volume', 'trade_count']]
+            df.columns = pd.MultiIndex.from_product([[pair], df.columns])
+            frames.append(df)
+
+        if not frames:
+            return None
+
+        return pd.concat(frames, axis=1).sort_index()
+
+    def _close(self, pair, interval, state):
+        bar = BarRecord(pair, interval, state['origin'] + (state['index'] * self._seconds[interval]), *state['bar'])
+        state['bar'] = None
+        return self._store(pair, interval, bar)
+
+    def _store(self, pair, interval, bar):
+        if (pair, interval) not in self._bars:
+            self._bars[(pair, interval)] = collections.deque(maxlen=self.max_bars)
+        self._bars[(pair, interval)].append(bar)
+        return bar
+
+    def _emit(self, closed):
+        # handlers are called outside of the lock so they can read the builder
+        if self.on_bar is not None:
+            for bar in closed:
+                self.on_bar(bar)
+
+
+class WSHealthMonitor:
+    '''
+    Connection health for a KrakenWS connection (see KrakenWS.health).  Tracks the round trip time of every ping, the time
+    between heartbeats and the time of the last message on every subscription.
+
+    args:
+        * Optional: window = number of pings/heartbeats kept for the rolling statistics
+            - Default is set to 500
+        * Optional: pong_timeout = seconds after which a ping without a pong is counted in .missed_pongs
+            - Default is set to 10
+    '''
+
+    def __init__(self, window=500, pong_timeout=10):
+        self.window = window
+        self.pong_timeout = pong_timeout
+        self.rtt = collections.deque(maxlen=window)
+        self.heartbeat_intervals = collections.deque(maxlen=window)
+        self.last_heartbeat = None
+        self.last_message = {}
+        self.missed_pongs = 0
+        # local receive time minus exchange time for each pair: {wsname: deque of seconds}
+        self.clock_skew = {}
+        # outstanding pings in the order they were sent: {reqid: sent time}
+        # pings are sent from the caller's thread and pongs come in on the receive thread, so both hold the lock
+        self._pings = {}
+        self._lock = threading.Lock()
+
+    def ping_sent(self, reqid, sent_time=None):
+        if sent_time is None:
+            sent_time = time.perf_counter()
+
+        with self._lock:
+            self._expire_pings(sent_time)
+            self._pings[reqid] = sent_time
+
+            # never keep more than the window, even if pings are sent faster than pong_timeout
+            if len(self._pings) > self.window:
+                self._pings.pop(next(iter(self._pings)))
+                self.missed_pongs += 1
+
+    def pong_received(self, reqid, recv_time=None):
+        if recv_time is None:
+            recv_time = time.perf_counter()
+
+        with self._lock:
+            sent_time = self._pings.pop(reqid, None)
+            self._expire_pings(recv_time)
+        if sent_time is None:
+            return None
+
+        rtt = recv_time - sent_time
+        self.rtt.append(rtt)
+        return rtt
+
+    def _expire_pings(self, now):
+        # a ping that has waited longer than pong_timeout is missed (the connection is dropped by then), and its pong is ignored
+        while self._pings:
+            reqid, sent_time = next(iter(self._pings.items()))
+            if now - sent_time <= self.pong_timeout:
+                break
+            del self._pings[reqid]
+            self.missed_pongs += 1
+
+    def heartbeat(self, recv_time=None):
+        if recv_time is None:
+            recv_time = time.time()
+        if self.last_heartbeat is not None:
+            self.heartbeat_intervals.append(recv_time - self.last_heartbeat)
+        self.last_heartbeat = recv_time
+
+    def record_skew(self, wsname, exchange_time, recv_time=None):
+        if recv_time is None:
+            recv_time = time.time()
+        if wsname not in self.clock_skew:
+            self.clock_skew[wsname] = collections.deque(maxlen=self.window)
+        self.clock_skew[wsname].append(recv_time - exchange_time)
+
+    def skew(self, percentiles=(50, 90, 99)):
+        '''
+        args:
+            * Optional: percentiles = percentiles to return
+                - Default is set to (50, 90, 99)
+
+        returns:
+            - A dictionary of {wsname: {'last': ms, 'p50': ms, ...}} of local receive time minus exchange time in milliseconds.
+              This is the network delay plus any difference between the local and exchange clocks.
+        '''
+        skew = {}
+        for wsname, values in list(self.clock_skew.items()):
+            if not values:
+                continue
+            values = np.array(values) * 1000
+            skew[wsname] = {'last': float(values[-1])}
+            skew[wsname].update({f'p{percentile}': float(value) for percentile, value in zip(percentiles, np.percentile(values, percentiles))})
+        return skew
+
+    def latency(self, percentiles=(50, 90, 99)):
+        '''
+        args:
+            * Optional: percentiles = percentiles to return
+                - Default is set to (50, 90, 99)
+
+        returns:
+            - A dictionary of the ping round trip time percentiles in milliseconds (i.e.- {'p50': 41.2, 'p90': 55.0, 'p99': 80.3}),
+              or 'None' if no pongs have come back yet
+        '''
+        if not self.rtt:
+            return None
+        values = np.percentile(np.array(self.rtt) * 1000, percentiles)
+        return {f'p{percentile}': float(value) for percentile, value in zip(percentiles, values)}
+
+    def heartbeat_latency(self, percentiles=(50, 90, 99)):
+        '''
+        returns:
+            - A dictionary of the time between heartbeats in seconds, or 'None' if there have not been two heartbeats yet
+        '''
+        if not self.heartbeat_intervals:
+            return None
+        values = np.percentile(np.array(self.heartbeat_intervals), percentiles)
+        return {f'p{percentile}': float(value) for percentile, value in zip(percentiles, values)}
+
+    def staleness(self, subscriptions=None, now=None):
+        '''
+        args:
+            * Optional: subscriptions = list of (channel_name, wsname) to report on
+                - Default is set to 'None' which reports on every subscription that has received a message
+            * Optional: now = unix timestamp
+                - Default is set to 'None' which uses the current time
+
+        returns:
+            - A dictionary of {(channel_name, wsname): seconds since the last message} ('None' if nothing has come in yet)
+        '''
+        if now is None:
+            now = time.time()
+        if subscriptions is None:
+            subscriptions = list(self.last_message)
+
+        staleness = {}
+        for key in subscriptions:
+            last = self.last_message.get(key)
+            staleness[key] = None if last is None else now - last
+        return staleness
+
+
+class KrakenWS:
+    '''
+    Takes 'asset' which is a trading pair (i.e.- ETHUSD, btcusd, LTC/eth, etc.) or a list of trading pairs.
+
+    A single KrakenWS instance is also a connection manager: any number of ticker, trade, ohlc, spread and book
+    subscriptions for any number of pairs are multiplexed over one websocket connection and every message is routed
+    by channel and pair to the handlers registered for it.
+        ex.:
+            ws = KrakenWS()
+            ws.subscribe('trade', ['ethusd', 'btcusd'], handler=on_trade)
+            ws.subscribe('ohlc', 'ethusd', handler=on_ohlc, interval=5)
+            ws.start()      # runs in a background thread, or ws.run() to block
+            ...
+            ws.stop()
+
+    The connection is supervised: if no message (data, heartbeat or pong) comes in for 'timeout' seconds, or the socket
+    drops, it reconnects with an exponential backoff and replays every active subscription.  Any window where trades
+    could have been missed is reported as a 'gap' event (see .on_event('gap', handler) and .gaps) and, with
+    'backfill=True', the missing trades are pulled from the REST 'Trades' endpoint and sent to the trade handlers.
+
+    args:
+        * Optional: asset = trading pair or list of trading pairs
+        * Optional: url = websocket url
+        * Optional: reconnect = reconnect automatically when the connection drops (default True)
+        * Optional: timeout = seconds without any message before the connection is considered dead (default 10)
+        * Optional: ping_interval = seconds without any message before a ping is sent (default 5)
+        * Optional: max_backoff = longest wait between reconnect attempts in seconds (default 60)
+        * Optional: backfill = fill trade gaps from the REST API after a reconnect (default False)
+    '''
+
+    def __init__(self, asset=None, url='wss://ws.kraken.com/', reconnect=True, timeout=10, ping_interval=5, max_backoff=60, backfill=False):
+        self.asset = asset
+        self.url = url
+        self.reconnect = reconnect
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.max_backoff = max_backoff
+        self.backfill = backfill
+
+        # connection state
+        self._ws = None
+        self._thread = None
+        self._running = False
+        self._send_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._recv_thread = None
+        self._last_recv = None
+        self.reconnects = 0
+
+        # outstanding pings: {reqid: threading.Event}
+        self._pings = {}
+        self._reqid = 0
+        self._last_ping = 0
+        # ping round trip times, heartbeat intervals and per subscription staleness
+        self.health = WSHealthMonitor(pong_timeout=timeout)
+
+        # time of the last trade seen for each pair (and the trades at that time), and trade gaps waiting on the first trade after a reconnect
+        self._last_trade = {}
+        self._last_trades = {}
+        self._pending_gaps = {}
+        # every gap that has been detected (see .on_event('gap', handler))
+        self.gaps = []
+        # REST pair names for backfilling: {wsname: Kraken pair name}
+        self._rest_pairs = {}
+        # backfilled trades (and failed backfills) waiting to be handed out by the receive thread, as functions to call
+        self._backfilled = queue.Queue()
+
+        # active subscriptions: {(channel_name, wsname): subscription dictionary sent to Kraken}
+        self._subscriptions = {}
+        # data handlers: {(channel_name, wsname): [handler, ...]} -- a wsname of 'None' receives every pair on that channel
+        self._handlers = {}
+        # event handlers: {event: [handler, ...]} -- i.e.- 'subscriptionStatus', 'systemStatus', 'heartbeat', 'pong'
+        self._event_handlers = {}
+        # cache of names that have already been converted to wsnames so we don't have to call the REST API every time
+        self._wsnames = {}
+        # local order books kept up to date from the 'book' channel: {wsname: KrakenOrderBook}
+        self._books = {}
+        # channel ids from the subscriptionStatus messages: {channelID: (channel_name, wsname)}
+        self._channel_ids = {}
+        # functions called with every update of a local order book: {wsname: [handler, ...]}
+        self._book_handlers = {}
+        # recent trades kept from the 'trade' channel: {wsname: TradeRingBuffer}
+        self._trade_buffers = {}
+        # bar builders fed by the 'trade' channel: {(intervals, on_bar, max_bars): (OHLCVBarBuilder, handler)}
+        self._bar_builders = {}
+        # best bid/ask from the 'spread' channel: {wsname: SpreadRecord}
+        self._top_of_book = {}
+        # functions called with every top of book update, and every name each pair was asked for by: {wsname: [handler, ...]}, {wsname: {name, ...}}
+        self._top_of_book_handlers = {}
+        self._top_of_book_names = {}
+    
+    def ping_pong(function):
+        # decorator to be sure the server is responsive before sending any traffic
+        # if the connection is open, a ping is sent on it and the wrapped method only runs once the 'pong' comes back
+        '''
+        args:
+            - function = KrakenWS method to wrap
+        '''
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            # the pong can only come back if the receive loop is running, and waiting on it from inside that loop would block it
+            if self._running and self._ws is not None and self._recv_thread is not threading.current_thread():
+                if not self.ping():
+                    raise Exception({'websocket_error': 'Error Message: server did not respond to ping'})
+
+            return function(self, *args, **kwargs)
+
+        return wrapper
+
+    def ping(self, timeout=None):
+        '''
+        args:
+            * Optional: timeout = seconds to wait for the 'pong'
+                - Default is set to 'None' which uses the connection timeout
+
+        returns:
+            - True if the server answered with a 'pong', otherwise False
+        '''
+        with self._lock:
+            self._reqid += 1
+            reqid = self._reqid
+            pong = threading.Event()
+            self._pings[reqid] = pong
+
+        try:
+            self._send_ping(reqid)
+            return pong.wait(timeout or self.timeout)
+        finally:
+            self._pings.pop(reqid, None)
+
+    def get_ws_token(self):
+        '''
+        returns:
+            - An authenticated websocket token
+            * NOTICE: if not used, the token will expire within 15 minutes and a new token will have to be requested
+        '''
+        # will return the wwebsockets token that is needed for all ws function calls
+
+        # create an empty 'data' dictionary since there are no fields to pass through
+        data = {}
+
+        # use the private function 'authenticate' to request a token from the REST API
+        token = PrivateKraken().authenticate('GetWebSocketsToken', data)['token']
+
+        # return the token
+        return token
+
+    def ws_name(self):
+        '''        
+        returns:
+            - wsname of specified trading pair/pairs
+        '''
+        # takes in any name and returns the wsname
+            # can take a list (for multiple pairs) or a single string
+        # this will mainly be used as a helper function within other functions to minimize naming convention errors
+        
+        url = 'https://api.kraken.com/0/public/AssetPairs'
+        res = requests.get(url).json()
+
+        # instantiate the list we will return from this funtion (if given a list), along with the naming classification dictionaries we will need.
+        ws_names = []
+        wsdict = {}
+        altdict = {}
+
+        pair = self.asset
+
+        # as long as Kraken is not returning an error, start the logic on converting the names to wsnames
+        if not res['error']:
+            # populate the wsdict and altdict with the wsnames and alternative names and then create a list of the key/value pairs so that we can index them later
+            for coin in res['result']:
+                try:
+                    wsdict[coin] = res['result'][coin]['wsname']
+                except KeyError: continue
+
+            for coin in res['result']:
+                try:
+                    altdict[coin] = res['result'][coin]['altname']
+                except KeyError: continue
+            
+            # don't actually need the keys for wsdict here, since the value is what we are trying to return any how.  
+            wsdictvals = list(wsdict.values())
+
+            altdictkeys = list(altdict.keys())
+            altdictvals = list(altdict.values())
+
+            # first thing to check is if the entered pair data is a list or not, if it is a list, return a list
+            if type(pair) == list:
+                for coin in pair:
+                    coin = coin.upper()
+                    # since BTC/USD is a common form people will use, but Kraken does not recognize, we will need to make a manual case for this one
+                    if coin=='BTCUSD' or coin=='BTC/USD':
+                        ws_names.append('XBT/USD')
+                    # if the name entered is already in the Kraken trading format (i.e.- 'XETHZUSD') then return the wsname for it, otherwise we need to find the match
+                    elif coin in res['result']:
+                        ws_names.append(res['result'][coin]['wsname'])
+                    else:
+                        # if the name already exists in the wsname dictionary values, then the name is already in wsname format and we will add that to the list to return
+                        if coin in wsdictvals:
+                            ws_names.append(coin)
+                        # otherwise, if the name is an alternative name we need to convert it to the wsname
+                        elif coin in altdictvals:
+                            pos = altdictvals.index(coin)
+                            kname = altdictkeys[pos]
+                            ws_names.append(wsdict[kname])
+                        else:
+                            raise Exception(f'Error Message: {coin} is not a recognized trading pair by Kraken.')
+                            
+                return ws_names
+
+                # if the entered pair is not a list, then return a string following the same logic from above (just returning the values instead of adding them to a list)
+            else:
+                pair = pair.upper()
+
+                if pair=='BTCUSD' or pair=='BTC/USD':
+                    return 'XBT/USD'
+
+                elif pair in res['result']:
+                    return res['result'][pair]['wsname']
+                else:
+
+                    if pair in wsdictvals:
+                        return pair
+
+                    elif pair in altdictvals:
+                        pos = altdictvals.index(pair)
+                        kname = altdictkeys[pos]
+                        return wsdict[kname]
+                    else:
+                        raise Exception(f'Error Message: {pair} is not a recognized trading pair by Kraken.')
+
+        # if Kraken returns an error, then have the function return it as well
+        else:
+            raise Exception(res['error'])
+
+    def channel_name(self, channel, interval=None, depth=None):
+        '''
+        args:
+            - channel = 'ticker', 'trade', 'ohlc', 'spread' or 'book'
+            * Optional: interval = ohlc interval in minutes (default 1)
+            * Optional: depth = book depth (default 10)
+
+        returns:
+            - The channel name Kraken uses in its messages (i.e.- 'ohlc-5' or 'book-10')
+        '''
+        if channel == 'ohlc':
+            return f'ohlc-{interval or 1}'
+        elif channel == 'book':
+            return f'book-{depth or 10}'
+        elif channel in ('ticker', 'trade', 'spread'):
+            return channel
+        else:
+            raise Exception({'input_error': f"{channel} is not a valid channel.  Only 'ticker', 'trade', 'ohlc', 'spread' and 'book' are accepted."})
+
+    def subscription_pairs(self, pair=None):
+        '''
+        args:
+            * Optional: pair = pair or list of pairs in any naming format
+                - Default is set to 'None' which uses the asset(s) provided in instantiation
+
+        returns:
+            - A list of wsnames
+        '''
+        if pair is None:
+            pair = self.asset
+
+        if pair is None:
+            raise Exception({'input_error': 'No pair provided.  Please provide a pair either in the KrakenWS instantiation or to the method.'})
+
+        if type(pair) != list:
+            pair = [pair]
+
+        # only look up names that have not been converted yet
+        missing = [coin for coin in pair if coin not in self._wsnames]
+        if missing:
+            for coin, wsname in zip(missing, KrakenWS(missing).ws_name()):
+                self._wsnames[coin] = wsname
+                # wsnames are passed back in by the helper methods, so they map to themselves
+                self._wsnames[wsname] = wsname
+
+        return [self._wsnames[coin] for coin in pair]
+
+    @ping_pong
+    def subscribe(self, channel, pair=None, handler=None, interval=None, depth=None, reqid=None):
+        '''
+        args:
+            - channel = 'ticker', 'trade', 'ohlc', 'spread' or 'book'
+            * Optional: pair = pair or list of pairs to subscribe to
+                - Default is set to 'None' which uses the asset(s) provided in instantiation
+            * Optional: handler = function called as handler(channel_name, wsname, data) for every message on this channel/pair
+            * Optional: interval = ohlc interval in minutes (only for 'ohlc')
+            * Optional: depth = book depth (only for 'book')
+            * Optional: reqid = request id echoed back by Kraken in the subscriptionStatus message
+
+        returns:
+            - The Kraken channel name (i.e.- 'ohlc-5') that the messages will be routed under
+        '''
+        channel_name = self.channel_name(channel, interval, depth)
+        pairs = self.subscription_pairs(pair)
+
+        subscription = {'name': channel}
+        if channel == 'ohlc' and interval is not None:
+            subscription['interval'] = interval
+        if channel == 'book' and depth is not None:
+            subscription['depth'] = depth
+
+        with self._lock:
+            for wsname in pairs:
+                self._subscriptions[(channel_name, wsname)] = subscription
+                if handler is not None:
+                    self._handlers.setdefault((channel_name, wsname), []).append(handler)
+
+        # if we are not connected yet, the subscription will be sent as soon as the connection is opened
+        if self._ws is not None:
+            self._send_subscription('subscribe', pairs, subscription, reqid)
+
+        return channel_name
+
+    def unsubscribe(self, channel, pair=None, interval=None, depth=None):
+        '''
+        args:
+            - channel = 'ticker', 'trade', 'ohlc', 'spread' or 'book'
+            * Optional: pair = pair or list of pairs to unsubscribe from
+            * Optional: interval = ohlc interval in minutes (only for 'ohlc')
+            * Optional: depth = book depth (only for 'book')
+        '''
+        channel_name = self.channel_name(channel, interval, depth)
+        pairs = self.subscription_pairs(pair)
+
+        with self._lock:
+            subscription = None
+            for wsname in pairs:
+                subscription = self._subscriptions.pop((channel_name, wsname), subscription)
+                self._handlers.pop((channel_name, wsname), None)
+
+        if subscription is not None and self._ws is not None:
+            self._send_subscription('unsubscribe', pairs, subscription)
+
+    def add_handler(self, channel_name, handler, pair=None):
+        '''
+        args:
+            - channel_name = Kraken channel name (i.e.- 'trade', 'ohlc-5', 'book-10')
+            - handler = function called as handler(channel_name, wsname, data)
+            * Optional: pair = only route this pair to the handler
+                - Default is set to 'None' which routes every pair on the channel to the handler
+        '''
+        wsname = None if pair is None else self.subscription_pairs(pair)[0]
+        with self._lock:
+            self._handlers.setdefault((channel_name, wsname), []).append(handler)
+
+    def remove_handler(self, channel_name, handler, pair=None):
+        '''
+        args:
+            - channel_name = Kraken channel name the handler was added under
+            - handler = handler to remove
+            * Optional: pair = only remove the handler from this pair
+                - Default is set to 'None' which removes the handler from every pair on the channel
+        '''
+        with self._lock:
+            if pair is None:
+                keys = [key for key in self._handlers if key[0] == channel_name]
+            else:
+                keys = [(channel_name, self.subscription_pairs(pair)[0])]
+
+            for key in keys:
+                handlers = self._handlers.get(key, [])
+                if handler in handlers:
+                    handlers.remove(handler)
+
+    def on_event(self, event, handler):
+        '''
+        args:
+            - event = Kraken event name ('subscriptionStatus', 'systemStatus', 'heartbeat', 'pong')
+            - handler = function called as handler(message) for every message of that event
+        '''
+        with self._lock:
+            self._event_handlers.setdefault(event, []).append(handler)
+
+    def connect(self):
+        '''
+        Opens the websocket connection (if it is not already open) and sends every active subscription.
+        '''
+        if self._ws is not None:
+            return
+
+        self._ws = websocket.create_connection(self.url, timeout=self.ping_interval)
+        self._last_recv = time.time()
+
+        # group the subscriptions so every channel is sent as one message with all of its pairs
+        grouped = {}
+        with self._lock:
+            for (channel_name, wsname), subscription in self._subscriptions.items():
+                grouped.setdefault(channel_name, (subscription, []))[1].append(wsname)
+
+        for subscription, pairs in grouped.values():
+            self._send_subscription('subscribe', pairs, subscription)
+
+    def send(self, payload):
+        '''
+        args:
+            - payload = dictionary to send over the websocket connection
+        '''
+        if self._ws is None:
+            raise Exception({'websocket_error': 'Error Message: websocket is not connected'})
+
+        with self._send_lock:
+            self._ws.send(json.dumps(payload))
+
+    def run(self):
+        '''
+        Connects (if needed) and blocks, routing every message to its handlers until .stop() is called.
+        '''
+        self._running = True
+        self._recv_thread = threading.current_thread()
+        self._stop_event.clear()
+        backoff = 1
+
+        while self._running:
+            try:
+                self.connect()
+                self._receive()
+                backoff = 1
+
+            except (websocket.WebSocketException, OSError) as e:
+                # .stop() closes the socket out from under recv(), which is the normal way to end the loop
+                if not self._running:
+                    break
+                if not self.reconnect:
+                    raise
+
+                print(f'WARNING: websocket connection lost ({e}), reconnecting in {backoff} seconds...')
+                self._disconnect()
+
+                # wait for the backoff (or stop right away if .stop() is called) and double it for the next attempt
+                if self._stop_event.wait(backoff):
+                    break
+                backoff = min(backoff * 2, self.max_backoff)
+                self.reconnects += 1
+
+    def _receive(self):
+        # receive messages until the connection drops or goes quiet for longer than 'timeout'
+        while self._running:
+            # trades pulled in by a backfill thread are routed from here, so handlers are only ever called from one thread
+            while not self._backfilled.empty():
+                self._backfilled.get_nowait()()
+
+            try:
+                message = self._ws.recv()
+            except websocket.WebSocketTimeoutException:
+                # nothing came in for 'ping_interval' seconds, so check the connection is still alive
+                if time.time() - self._last_recv > self.timeout:
+                    raise websocket.WebSocketTimeoutException(f'no messages received for {self.timeout} seconds')
+                self._ping_nowait()
+                continue
+
+            self._last_recv = time.time()
+            if message:
+                self._dispatch(json_loads(message))
+
+            # keep pinging on a busy connection too, so the round trip time is always current
+            if self._last_recv - self._last_ping > self.ping_interval:
+                self._ping_nowait()
+
+    def _ping_nowait(self):
+        with self._lock:
+            self._reqid += 1
+            reqid = self._reqid
+        self._send_ping(reqid)
+
+    def _send_ping(self, reqid):
+        self._last_ping = time.time()
+        self.health.ping_sent(reqid)
+        self.send({'event': 'ping', 'reqid': reqid})
+
+    def staleness(self, threshold=None):
+        '''
+        args:
+            * Optional: threshold = only return the subscriptions that have gone longer than this many seconds without a message
+                - Default is set to 'None' which returns every subscription
+
+        returns:
+            - A dictionary of {(channel_name, wsname): seconds since the last message} for the active subscriptions
+              ('None' if nothing has come in yet)
+        '''
+        staleness = self.health.staleness(list(self._subscriptions))
+
+        if threshold is not None:
+            staleness = {key: value for key, value in staleness.items() if value is None or value > threshold}
+
+        return staleness
+
+    def _disconnect(self):
+        # drop the dead socket and remember where every trade feed left off so the gap can be reported later
+        ws = self._ws
+        self._ws = None
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+        # channel ids are only valid for the connection that handed them out
+        self._channel_ids = {}
+
+        # the REST accessors go back to the REST order book until the spread feed comes back
+        self._drop_live_top_of_book()
+
+        disconnect_time = time.time()
+        with self._lock:
+            for (channel_name, wsname) in self._subscriptions:
+                if channel_name == 'trade' and wsname not in self._pending_gaps:
+                    self._pending_gaps[wsname] = (self._last_trade.get(wsname), disconnect_time, self._last_trades.get(wsname, []))
+                elif channel_name.startswith('book') and wsname in self._books:
+                    # the book will be rebuilt from the snapshot sent after resubscribing
+                    with self._books[wsname]._lock:
+                        self._books[wsname].valid = False
+                        self._books[wsname]._clear()
+                    self._emit_gap('book', wsname, disconnect_time, None, 'reconnect')
+
+    def start(self):
+        '''
+        Runs the connection in a background thread and returns right away.
+        '''
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        self.connect()
+        self._running = True
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+        return self._thread
+
+    def stop(self):
+        '''
+        Stops the message loop and closes the websocket connection.
+        '''
+        self._running = False
+        self._stop_event.set()
+
+        ws = self._ws
+        self._ws = None
+        if ws is not None:
+            ws.close()
+
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+        self._drop_live_top_of_book()
+
+    def _drop_live_top_of_book(self):
+        # the cached prices stop updating with the connection, so don't let the REST accessors read them anymore
+        for key, live_book in list(live_top_of_book.items()):
+            if self._top_of_book.get(live_book[0].pair) is live_book[0]:
+                live_top_of_book.pop(key, None)
+
+    def _send_subscription(self, event, pairs, subscription, reqid=None):
+        payload = {
+            'event': event,
+            'pair': pairs,
+            'subscription': subscription
+        }
+        if reqid is not None:
+            payload['reqid'] = reqid
+
+        self.send(payload)
+
+    def _dispatch(self, message):
+        # data comes in as lists and is by far the most common message, so it is checked first
+        if type(message) is list:
+            # route by the channel id Kraken gave us when subscribing, falling back to the names at the end of the message
+            route = self._channel_ids.get(message[0])
+            if route is None:
+                channel_name, wsname = message[-2], message[-1]
+            else:
+                channel_name, wsname = route
+
+            # data messages are [channelID, data, (data,) channel_name, pair]
+            if len(message) == 4:
+                data = message[1]
+            else:
+                data = message[1:-2]
+
+            if channel_name == 'trade':
+                self._check_trade_gap(wsname, data)
+
+            self.health.last_message[(channel_name, wsname)] = self._last_recv
+            self._route(channel_name, wsname, data)
+            return
+
+        # events (heartbeats, subscription status, etc.) come in as dictionaries
+        event = message.get('event')
+
+        if event == 'subscriptionStatus':
+            if message.get('status') == 'error':
+                print(f"WARNING: subscription error for {message.get('pair')}: {message.get('errorMessage')}")
+            elif message.get('status') == 'subscribed' and 'channelID' in message:
+                self._channel_ids[message['channelID']] = (message['channelName'], message['pair'])
+            elif message.get('status') == 'unsubscribed' and 'channelID' in message:
+                self._channel_ids.pop(message['channelID'], None)
+
+        elif event == 'pong':
+            self.health.pong_received(message.get('reqid'))
+            if message.get('reqid') in self._pings:
+                self._pings[message['reqid']].set()
+
+        elif event == 'heartbeat':
+            self.health.heartbeat(self._last_recv)
+
+        for handler in list(self._event_handlers.get(event, [])):
+            handler(message)
+
+    def _route(self, channel_name, wsname, data):
+        handlers = self._handlers.get((channel_name, wsname), []) + self._handlers.get((channel_name, None), [])
+        for handler in handlers:
+            handler(channel_name, wsname, data)
+
+    def _emit_gap(self, channel, wsname, start, end, reason):
+        gap = {
+            'event': 'gap',
+            'channel': channel,
+            'pair': wsname,
+            'start': start,
+            'end': end,
+            'reason': reason
+        }
+        self.gaps.append(gap)
+
+        for handler in list(self._event_handlers.get('gap', [])):
+            handler(gap)
+
+    def _check_trade_gap(self, wsname, data):
+        # the first trades after a reconnect close out the gap that was opened when the connection dropped
+        first_time = float(data[0][2])
+
+        if wsname in self._pending_gaps:
+            last_time, disconnect_time, last_trades = self._pending_gaps.pop(wsname)
+            start = last_time if last_time is not None else disconnect_time
+            self._emit_gap('trade', wsname, start, first_time, 'reconnect')
+
+            # the REST calls can take a while, so they run on their own thread and never hold up the live feed
+            # the trades at either edge of the gap were already received, so they are passed along to be left out
+            if self.backfill and last_time is not None:
+                known = last_trades + [trade for trade in data if float(trade[2]) == first_time]
+                threading.Thread(target=self._backfill_worker, args=(wsname, last_time, first_time, known), daemon=True).start()
+
+        # keep every trade at the latest time, which can be spread over more than one message
+        last_time = float(data[-1][2])
+        at_last = [trade for trade in data if float(trade[2]) == last_time]
+        if len(at_last) == len(data) and self._last_trade.get(wsname) == last_time:
+            self._last_trades[wsname] = self._last_trades.get(wsname, []) + at_last
+        else:
+            self._last_trades[wsname] = at_last
+        self._last_trade[wsname] = last_time
+
+    def _backfill_worker(self, wsname, start, end, known):
+        try:
+            self.backfill_trades(wsname, start, end, known=known)
+        except Exception as e:
+            print(f'WARNING: could not backfill the {wsname} trades between {start} and {end}: {e}')
+            # recorded as a gap of its own (from the receive thread, like every other event) so it can be repaired later
+            self._hand_off(functools.partial(self._emit_gap, 'trade', wsname, start, end, 'backfill_failed'))
+
+    def _hand_off(self, function):
+        # runs 'function' on the receive thread while the connection is running, so handlers are only ever called from one thread
+        if self._running:
+            self._backfilled.put(function)
+        else:
+            function()
+
+    def backfill_trades(self, pair, start, end, timeout=30, retries=5, known=None):
+        '''
+        Pulls the trades between 'start' and 'end' from the REST 'Trades' endpoint and sends them to the trade handlers
+        in the same format as the websocket trade messages.
+
+        Gaps are only found (and backfilled with 'backfill=True') when the connection drops and comes back.  The v1 'trade'
+        channel has no sequence numbers, so trades missed on a connection that stays up can't be detected.
+
+        args:
+            - pair = pair in any naming format
+            - start = unix timestamp of the last trade that was received before the gap (included)
+            - end = unix timestamp of the first trade that was received after the gap (included)
+            * Optional: timeout = seconds to wait on each REST call
+                - Default is set to 30
+            * Optional: retries = number of failed REST calls in a row before giving up
+                - Default is set to 5
+            * Optional: known = trades already received (websocket format), which are left out.  The trades at 'start' and 'end'
+              usually are, since the trades at either edge of the gap are included.
+                - Default is set to 'None'
+
+        returns:
+            - The number of trades that were backfilled
+            * NOTICE: while the connection is running the trades are handed to the receive thread, so they reach the
+              handlers after any live trades that came in while the REST calls were made
+        '''
+        wsname = self.subscription_pairs(pair)[0]
+        if wsname not in self._rest_pairs:
+            self._rest_pairs[wsname] = PublicKraken(wsname).pair_matching()[0]
+        rest_pair = self._rest_pairs[wsname]
+
+        # the websocket cuts timestamps to 6 decimals and the REST API sends 7, so the same trade matches within a microsecond
+        known = [(float(trade[0]), float(trade[1]), float(trade[2]), trade[3], trade[4]) for trade in (known or [])]
+
+        url = 'https://api.kraken.com/0/public/Trades'
+        since = int(start * 1000000000)
+        count = 0
+        failures = 0
+
+        while True:
+            if failures > retries or (failures and self._stop_event.is_set()):
+                raise Exception({'kraken_error': f'Error Message: gave up on the {wsname} trades between {start} and {end} after {failures} failed calls'})
+
+            public_rate_limiter.acquire()
+            try:
+                message = requests.get(url, PublicKraken().make_api_data(pair=rest_pair, since=since), timeout=timeout).json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print('Connection Issue:', e)
+                failures += 1
+                continue
+
+            if message['error'] == ['EService:Unavailable'] or message['error'] == ['EService:Busy'] or message['error'] == ['EGeneral:Internal error']:
+                print("Server connection issue...retrying...")
+                PublicKraken().guarantee_cancel()
+                failures += 1
+                continue
+            elif message['error']:
+                raise Exception({'kraken_error': f'Error Message: {message["error"]}'})
+            failures = 0
+
+            trades = [trades for key, trades in message['result'].items() if key != 'last'][0]
+
+            # only send the trades that fall inside the gap, in the websocket format [price, volume, time, side, ordertype, misc]
+            missing = []
+            for trade in trades:
+                if not start <= float(trade[2]) <= end:
+                    continue
+                for j, (price, volume, trade_time, side, ordertype) in enumerate(known):
+                    if (price, volume, side, ordertype) == (float(trade[0]), float(trade[1]), trade[3], trade[4]) and abs(trade_time - float(trade[2])) < 0.0000015:
+                        known.pop(j)
+                        break
+                else:
+                    missing.append([trade[0], trade[1], str(trade[2]), trade[3], trade[4], trade[5]])
+
+            if missing:
+                self._hand_off(functools.partial(self._route_backfill, wsname, missing))
+                count += len(missing)
+
+            if not trades or float(trades[-1][2]) > end or int(message['result']['last']) <= since:
+                break
+            since = int(message['result']['last'])
+
+        return count
+
+    def _route_backfill(self, wsname, trades):
+        # a handler that fails on one backfilled page must not stop the rest of the page or the other handlers
+        handlers = self._handlers.get(('trade', wsname), []) + self._handlers.get(('trade', None), [])
+        for handler in handlers:
+            try:
+                handler('trade', wsname, trades)
+            except Exception as e:
+                print(f'WARNING: trade handler {handler} failed on backfilled {wsname} trades: {e}')
+
+    def subscribe_book(self, pair=None, depth=10, handler=None):
+        '''
+        args:
+            * Optional: pair = pair or list of pairs to keep a local order book for
+                - Default is set to 'None' which uses the asset(s) provided in instantiation
+            * Optional: depth = book depth to subscribe to (10, 25, 100, 500 or 1000)
+                - Default is set to 10
+            * Optional: handler = function called as handler(book) every time a book is updated
+
+        returns:
+            - A dictionary of {wsname: KrakenOrderBook}.  The books fill in once the connection is started (.start() or .run()).
+        '''
+        pairs = self.subscription_pairs(pair)
+        channel_name = self.channel_name('book', None, depth)
+
+        with self._lock:
+            for wsname in pairs:
+                book = self._books.get(wsname)
+                # a pair has one local book, so updates from a second depth would corrupt it
+                if book is not None and book.depth != depth:
+                    raise Exception({'input_error': f'{wsname} already has a local order book of depth {book.depth}'})
+
+            for wsname in pairs:
+                if wsname not in self._books:
+                    self._books[wsname] = KrakenOrderBook(wsname, depth)
+                if handler is not None and handler not in self._book_handlers.setdefault(wsname, []):
+                    self._book_handlers[wsname].append(handler)
+
+        # the book is only fed once per pair however many times this is called, otherwise every update would be applied twice
+        new_pairs = self._unhandled_pairs(channel_name, pairs, self._apply_book)
+        if new_pairs:
+            self.subscribe('book', new_pairs, handler=self._apply_book, depth=depth)
+
+        return {wsname: self._books[wsname] for wsname in pairs}
+
+    def _apply_book(self, channel_name, wsname, data):
+        book = self._books[wsname]
+        result = book.apply(data)
+        if result:
+            for handler in list(self._book_handlers.get(wsname, [])):
+                handler(book)
+        elif result is False:
+            # the checksum did not match (or an update came in before the snapshot) so ask Kraken for a fresh snapshot
+            self._resync_book(wsname)
+
+    def _unhandled_pairs(self, channel_name, pairs, handler):
+        # the pairs the handler is not routed to yet (it is dropped again by .unsubscribe(), so it is checked every time)
+        with self._lock:
+            return [wsname for wsname in pairs if handler not in self._handlers.get((channel_name, wsname), [])]
+
+    def get_book(self, pair):
+        '''
+        args:
+            - pair = pair in any naming format
+
+        returns:
+            - The KrakenOrderBook for that pair (see .subscribe_book())
+        '''
+        return self._books[self.subscription_pairs(pair)[0]]
+
+    def _resync_book(self, wsname):
+        book = self._books[wsname]
+        with book._lock:
+            book.valid = False
+            book._clear()
+        self._emit_gap('book', wsname, time.time(), None, 'checksum')
+
+        subscription = {'name': 'book', 'depth': book.depth}
+        self._send_subscription('unsubscribe', [wsname], subscription)
+        self._send_subscription('subscribe', [wsname], subscription)
+
+    def trade_buffers(self, pair=None, capacity=100000):
+        '''
+        args:
+            * Optional: pair = pair or list of pairs to keep recent trades for
+                - Default is set to 'None' which uses the asset(s) provided in instantiation
+            * Optional: capacity = number of trades to keep for each pair
+                - Default is set to 100000
+
+        returns:
+            - A dictionary of {wsname: TradeRingBuffer}.  The buffers fill in once the connection is started (.start() or .run()).
+        '''
+        pairs = self.subscription_pairs(pair)
+
+        with self._lock:
+            for wsname in pairs:
+                if wsname not in self._trade_buffers:
+                    self._trade_buffers[wsname] = TradeRingBuffer(capacity)
+
+        # each buffer is only fed once however many times this is called, otherwise every trade would be stored twice
+        new_pairs = self._unhandled_pairs('trade', pairs, self._append_trades)
+        if new_pairs:
+            self.subscribe('trade', new_pairs, handler=self._append_trades)
+
+        return {wsname: self._trade_buffers[wsname] for wsname in pairs}
+
+    def _append_trades(self, channel_name, wsname, data):
+        self._trade_buffers[wsname].extend(trades_to_array(data))
+
+    def get_trade_buffer(self, pair):
+        '''
+        args:
+            - pair = pair in any naming format
+
+        returns:
+            - The TradeRingBuffer for that pair (see .trade_buffers())
+        '''
+        return self._trade_buffers[self.subscription_pairs(pair)[0]]
+
+    def bar_builder(self, pair=None, intervals=('1min',), on_bar=None, max_bars=10000):
+        '''
+        args:
+            * Optional: pair = pair or list of pairs to build bars for
+                - Default is set to 'None' which uses the asset(s) provided in instantiation
+            * Optional: intervals = list of bar intervals (seconds or time strings, i.e.- ['5s', '30s', '3min', '2h'])
+            * Optional: on_bar = function called as on_bar(bar) with a BarRecord every time a bar closes
+            * Optional: max_bars = number of finished bars kept for each pair/interval
+
+        returns:
+            - An OHLCVBarBuilder fed by the 'trade' channel.  Bars are built once the connection is started (.start() or .run()).
+            * NOTICE: calling this again with the same intervals/on_bar/max_bars returns the same builder, fed once per pair
+        '''
+        if type(intervals) not in (list, tuple):
+            intervals = [intervals]
+        pairs = self.subscription_pairs(pair)
+        key = (tuple(intervals), on_bar, max_bars)
+
+        with self._lock:
+            if key not in self._bar_builders:
+                builder = OHLCVBarBuilder(list(intervals), on_bar=on_bar, max_bars=max_bars)
+
+                def update(channel_name, wsname, data):
+                    builder.update_trades(wsname, data)
+
+                self._bar_builders[key] = (builder, update)
+            builder, update = self._bar_builders[key]
+
+        # only route the pairs the builder isn't fed yet, otherwise every trade would be counted twice in the bars
+        new_pairs = self._unhandled_pairs('trade', pairs, update)
+        if new_pairs:
+            self.subscribe('trade', new_pairs, handler=update)
+
+        return builder
+
+    def top_of_book(self, pair=None, handler=None):
+        '''
+        args:
+            * Optional: pair = pair or list of pairs to keep the best bid/ask for
+                - Default is set to 'None' which uses the asset(s) provided in instantiation
+            * Optional: handler = function called as handler(record) with a SpreadRecord every time the top of book changes
+
+        returns:
+            - A dictionary of {wsname: SpreadRecord or 'None'} of the current top of book.  Use .get_top_of_book() for later reads.
+            * NOTICE: while the feed is connected, PublicKraken(pair).get_current_bid()/get_current_ask() are served from this cache
+        '''
+        pairs = self.subscription_pairs(pair)
+
+        with self._lock:
+            for wsname in pairs:
+                # every name the pair was asked for by, so the REST accessors find it under whatever name it was given
+                self._top_of_book_names.setdefault(wsname, {wsname}).update(coin for coin, name in self._wsnames.items() if name == wsname)
+                if handler is not None and handler not in self._top_of_book_handlers.setdefault(wsname, []):
+                    self._top_of_book_handlers[wsname].append(handler)
+
+        # each pair's quote is only written once per update however many times this is called
+        new_pairs = self._unhandled_pairs('spread', pairs, self._update_top_of_book)
+        if new_pairs:
+            self.subscribe('spread', new_pairs, handler=self._update_top_of_book)
+
+        return {wsname: self._top_of_book.get(wsname) for wsname in pairs}
+
+    def _update_top_of_book(self, channel_name, wsname, data):
+        record = parse_spread(wsname, data)[0]
+        self.health.record_skew(wsname, record.time, self._last_recv)
+
+        # a single dictionary assignment of an immutable record, so readers never need a lock and never see half an update
+        self._top_of_book[wsname] = record
+        live_book = (record, (data[0], data[3], int(record.time)), (data[1], data[4], int(record.time)))
+        for name in list(self._top_of_book_names.get(wsname, [wsname])):
+            live_top_of_book[pair_key(name)] = live_book
+
+        for handler in list(self._top_of_book_handlers.get(wsname, [])):
+            handler(record)
+
+    def get_top_of_book(self, pair):
+        '''
+        args:
+            - pair = pair in any naming format
+
+        returns:
+            - The latest SpreadRecord for that pair (see .top_of_book()), or 'None' if nothing has come in yet
+        '''
+        return self._top_of_book.get(self.subscription_pairs(pair)[0])
+
+    def parse(self, channel_name, pair, data):
+        '''
+        args:
+            - channel_name, pair and data as passed to a handler
+
+        returns:
+            - A list of typed records (TickerRecord, TradeRecord, OHLCRecord or SpreadRecord) with numeric fields
+        '''
+        return self.parser(channel_name)(pair, data, channel_name)
+
+    def parser(self, channel_name):
+        '''
+        args:
+            - channel_name = Kraken channel name (i.e.- 'trade', 'ohlc-5')
+
+        returns:
+            - The function that turns that channel's data into typed records, called as parser(pair, data, channel_name)
+        '''
+        parser = RECORD_PARSERS.get(channel_name.split('-')[0])
+        if parser is None:
+            raise Exception({'input_error': f'No record type for the {channel_name} channel'})
+        return parser
+
+    def stream(self, channel, pair=None, interval=None, maxsize=1000, overflow='block', reqid=None):
+        '''
+        args:
+            - channel = 'ticker', 'trade', 'ohlc' or 'spread'
+            * Optional: pair = pair or list of pairs to subscribe to
+                - Default is set to 'None' which uses the asset(s) provided in instantiation
+            * Optional: interval = ohlc interval in minutes (only for 'ohlc')
+            * Optional: maxsize = maximum number of records held in the buffer
+            * Optional: overflow = 'block', 'drop_oldest' or 'conflate' (see KrakenStream)
+            * Optional: reqid = request id echoed back by Kraken in the subscriptionStatus message
+
+        returns:
+            - A KrakenStream of typed records.  Use it with 'for', 'async for' or .get() and call .close() when done.
+        '''
+        # only close the connection with the stream if nothing else was already running on it
+        owns_connection = self._thread is None
+        stream = KrakenStream(self, maxsize=maxsize, overflow=overflow, owns_connection=owns_connection)
+
+        # look up the parser once, rather than for every message
+        parser = self.parser(self.channel_name(channel, interval))
+
+        def handler(channel_name, wsname, data):
+            for record in parser(wsname, data, channel_name):
+                stream.put(record)
+
+        channel_name = self.subscribe(channel, pair, handler=handler, interval=interval, reqid=reqid)
+        stream._handlers.append((channel_name, handler))
+
+        self.start()
+
+        return stream
+
+    def ws_ticker(self, reqid=None, stream=False, maxsize=1000, overflow='block'):
+        '''
+        args:
+            * Optional: stream = when True, returns a KrakenStream of typed records (usable with 'for' or 'async for') instead of printing
+                - Default is set to False
+            * Optional: maxsize = maximum number of records buffered by the stream
+            * Optional: overflow = 'block', 'drop_oldest' or 'conflate' (see KrakenStream)
+        returns:
+            -Dictionary of websocket data (see Kraken Websocket docs for full data definitioins)
+            -KrakenStream of TickerRecords if 'stream=True'
+        '''
+
+        # create a function that will subscribe to the 'ticker' channel on the Kraken websocket API
+        # this is a bunch of info about a ticker that comes in - if more specific data is needed, it is suggested to look at the other channels:
+            # OHLC
+            # Trades
+            # Spread
+            # Book
+
+        # first, be sure the servers are online or at least in post_only mode
+        PublicKraken().guarantee_online()
+
+        if stream:
+            return self.stream('ticker', maxsize=maxsize, overflow=overflow, reqid=reqid)
+
+        # subscribe and print every message as it comes in
+        def display(channel_name, pair, data):
+            print([data, channel_name, pair])
+
+        self.subscribe('ticker', handler=display, reqid=reqid)
+
+        # loop through the returned data
+        self.run()
+
+    def ws_trade(self, reqid=None, stream=False, maxsize=1000, overflow='block'):
+        '''
+        args:
+            * Optional: stream = when True, returns a KrakenStream of typed records (usable with 'for' or 'async for') instead of printing
+                - Default is set to False
+            * Optional: maxsize = maximum number of records buffered by the stream
+            * Optional: overflow = 'block', 'drop_oldest' or 'conflate' (see KrakenStream)
+        returns:
+            -Dictionary of websocket data (see Kraken Websocket docs for full data definitioins)
+            -KrakenStream of TradeRecords if 'stream=True'
+        '''
+
+        # create a function that will subscribe to the 'trade' channel on the Kraken websocket API
+
+        # first, be sure the servers are online or at least in post_only mode
+        PublicKraken().guarantee_online()
+
+        if stream:
+            return self.stream('trade', maxsize=maxsize, overflow=overflow, reqid=reqid)
+
+        # subscribe and print every message as it comes in
+        def display(channel_name, pair, data):
+            print([data, channel_name, pair])
+
+        self.subscribe('trade', handler=display, reqid=reqid)
+
+        # loop through the returned data
+        self.run()
+
+    def ws_ohlc(self, interval, display=True, reqid=None, stream=False, maxsize=1000, overflow='block'):
+        '''      
+        args: \n
+            -'interval' = this is the interval for which the ohlc data will be built (in minutes)
+            * Optional: stream = when True, returns a KrakenStream of typed records (usable with 'for' or 'async for') instead of printing
+                - Default is set to False
+            * Optional: maxsize = maximum number of records buffered by the stream
+            * Optional: overflow = 'block', 'drop_oldest' or 'conflate' (see KrakenStream)
+        returns: \n
+            - A dictionary of ohlc items:\n
+                -'current_time' = time of most recent trade
+                -'end_time' = time when the current interval will end
+                -'open' = opening price of the current interval
+                -'high' = highest price of the current interval
+                -'low' = lowest price of the current interval
+                -'close' = closing price of the current interval (a.k.a.: the current price)
+                -'vwap' = volume weighted average price of the current interval
+                -'volume' = volume of traded asset in the current interval
+                -'count' = number of trades within the current interval
+            - KrakenStream of OHLCRecords if 'stream=True'
+        '''
+
+        # create a function that will subscribe to the 'ohlc' channel on the Kraken websocket API
+
+        # first, be sure the servers are online or at least in post_only mode
+        PublicKraken().guarantee_online()
+
+        if stream:
+            return self.stream('ohlc', interval=interval, maxsize=maxsize, overflow=overflow, reqid=reqid)
+
+        # if there is data, put it in a dictionary (only when it is going to be displayed, otherwise there is no reason to build it)
+        def handler(channel_name, pair, data):
+            if display != True:
+                return
+
+            ohlc_data = {'current_time': data[0],
+                        'end_time': data[1],
+                        'open': data[2],
+                        'high': data[3],
+                        'low': data[4],
+                        'close': data[5],
+                        'vwap': data[6],
+                        'volume': data[7],
+                        'count': data[8],
+                        'ohlc_interval': interval
+                        }
+
+            print(ohlc_data)
+
+        self.subscribe('ohlc', handler=handler, interval=interval, reqid=reqid)
+
+        # loop through the returned data
+        self.run()
+
+    def guarantee_no_open_order(self, order_id=None):
+        # this function will connect to the websocket and pause any logic from running until either there are no open orders,
+        # or the order_id that is provided is no longer open
+        # see https://support.kraken.com/hc/en-us/articles/360034499452-WebSocket-API-private-feeds-openOrders for more info
+
+        # create the websocket token needed for authenticated access
+        token = self.get_ws_token()
+
+        # connect to the authenticated websocket
+        ws = websocket.create_connection('wss://ws-auth.kraken.com/')
+
+        # subscribe to the open orders authenticated websocket endpoint
+        payload = json.dumps({
+            'event': 'subscribe',
+            'subscription': {
+                'name': 'openOrders',
+                'token': token
+            }
+        })
+
+        # send the packet data to Kraken websocket
+        ws.send(payload)
+
+        # recieve the connection and subscription message, if no message raise an Exception
+        if not json.loads(ws.recv()):
+            raise Exception({'websocket_error': 'Error Message: Could not connect to channel'})
+
+        if not json.loads(ws.recv()):
+            raise Exception({'websocket_error': 'Error Message: Could not subscribe to channel'})
+
+        # loop through the responses until either: A) there are no open orders or, B) the provided order_id is no longer open
+        # instantiate initial loop condition and a list for tracking order_ids and dictionary for tracking order_status
+        loop = 1
+        list_of_orders = []
+        order_status = {}
+        while loop == 1:
+            
+            # save the response as a variable to call later on
+            orders = json.loads(ws.recv())
+
+            # if there are no orders initially, end the loop and close the websocket
+            if type(orders) == dict and orders['event'] == 'heartbeat':
+                continue
+            elif not orders[0]:
+                loop = 0
+            
+            # create a list of the order_ids to reference later
+            if type(orders) == list:
+                for order_data in orders[0]:
+                    for order in order_data:
+                        list_of_orders.append(order)
+
+            # track the status of each order_id in a dictionary
+            if type(orders) == list:
+                for order_data in orders[0]:
+                    for order in list_of_orders:
+                        try:
+                            order_status[order] = order_data[order]['status']
+                        except: KeyError
+            
             # remove closed orders from order_status dictionary and list_of_orders
             if len(order_status) > 0:
                 for order in list_of_orders:
@@ -2303,19 +4457,884 @@ class KrakenWS:
         
         ws.close()    
 
+class KrakenBroker:
+    '''
+    Local market data broker: holds one upstream KrakenWS connection with one subscription per channel/pair and fans
+    every update out to any number of consumers, both in this process (.subscribe()) and in other local processes
+    (KrakenBrokerClient).  Late joiners are sent the latest value for their channel/pair (a full book snapshot for 'book').
+    Trades are events rather than state, so 'trade' subscribers only get the trades that come in after they join.
+        ex.:
+            # market data process
+            broker = KrakenBroker(address=('localhost', 6000))
+            broker.start()
+            # hand broker.authkey to the strategy processes (i.e.- an environment variable or a file only you can read)
+
+            # any strategy process on the same box
+            client = KrakenBrokerClient(authkey, address=('localhost', 6000))
+            client.subscribe('trade', 'ethusd', handler=on_trade)
+
+    args:
+        * Optional: address = address other processes connect on -- a (host, port) tuple, or a file path for a Unix socket
+            - Default is set to ('localhost', 6000).  Set to 'None' to only serve consumers in this process.
+        * Optional: authkey = secret key (bytes) that clients must present to connect.  The connection carries pickles, so anyone
+                              with the key can run code in the broker process - keep it secret.
+            - Default is set to 'None' which generates a random key (read it back from .authkey)
+        * Optional: ws = KrakenWS connection to use upstream
+            - Default is set to 'None' which creates a new one
+        * Optional: client_queue = number of messages buffered for each client process before the oldest are dropped
+            - Default is set to 10000
+    '''
+
+    def __init__(self, address=('localhost', 6000), authkey=None, ws=None, client_queue=10000):
+        self.address = address
+        self.authkey = authkey if authkey is not None else os.urandom(32)
+        self.ws = ws if ws is not None else KrakenWS()
+        self.client_queue = client_queue
+
+        # latest data for every state channel/pair (not 'trade' or 'book'), sent to late joiners: {(channel_name, wsname): data}
+        self._latest = {}
+        # upstream subscriptions that are already open: {(channel_name, wsname)}
+        self._upstream = set()
+        # in-process and client subscribers: {(channel_name, wsname): [{'handler': handler, 'pending': list or None}, ...]}
+        # 'pending' buffers the updates that come in while a new subscriber is still being sent its snapshot
+        self._subscribers = {}
+        self._lock = threading.RLock()
+
+        self._listener = None
+        self._clients = []
+        self._running = False
+
+    def subscribe(self, channel, pair, handler, interval=None, depth=None, snapshot=True, ready=None):
+        '''
+        args:
+            - channel = 'ticker', 'trade', 'ohlc', 'spread' or 'book'
+            - pair = pair or list of pairs
+            - handler = function called as handler(channel_name, wsname, data), the same as a KrakenWS handler
+            * Optional: interval = ohlc interval in minutes (only for 'ohlc')
+            * Optional: depth = book depth (only for 'book')
+            * Optional: snapshot = send the handler the latest value for each pair right away
+                - Default is set to True
+                * NOTICE: there is no snapshot for 'trade', replaying the last trade would hand the subscriber a duplicate
+            * Optional: ready = function called as ready(channel_name, wsnames) once the subscription is open, before the handler gets any data
+                - Default is set to 'None'
+
+        returns:
+            - (channel_name, list of wsnames) that the handler was subscribed to
+        '''
+        channel_name = self.ws.channel_name(channel, interval, depth)
+        pairs = self.ws.subscription_pairs(pair)
+
+        # the lock is only held to record the subscription.  Opening the upstream subscription waits on the websocket thread
+        # (which needs the lock in ._publish()), and handlers are never called with it held
+        with self._lock:
+            # only open an upstream subscription for the pairs nobody is subscribed to yet (recorded now so nobody else opens them too)
+            new_pairs = [wsname for wsname in pairs if (channel_name, wsname) not in self._upstream]
+            self._upstream.update((channel_name, wsname) for wsname in new_pairs)
+
+            # updates are held back in 'pending' until the snapshot has been sent, so they can't arrive before it
+            entries = []
+            for wsname in pairs:
+                entry = {'handler': handler, 'pending': []}
+                self._subscribers.setdefault((channel_name, wsname), []).append(entry)
+                entries.append((wsname, entry, self.latest(channel_name, wsname) if snapshot else None))
+
+        if new_pairs:
+            try:
+                if channel == 'book':
+                    self.ws.subscribe_book(new_pairs, depth=depth or 10)
+                    for wsname in new_pairs:
+                        self.ws.add_handler(channel_name, self._publish, wsname)
+                else:
+                    self.ws.subscribe(channel, new_pairs, handler=self._publish, interval=interval)
+            except Exception:
+                with self._lock:
+                    self._upstream.difference_update((channel_name, wsname) for wsname in new_pairs)
+                    for wsname, entry, _ in entries:
+                        self._subscribers[(channel_name, wsname)].remove(entry)
+                raise
+
+        if ready is not None:
+            ready(channel_name, pairs)
+
+        # bring the late joiner up to date with the latest value, then with whatever came in since
+        for wsname, entry, latest in entries:
+            if latest is not None:
+                handler(channel_name, wsname, latest)
+            while True:
+                with self._lock:
+                    pending = entry['pending']
+                    if not pending:
+                        entry['pending'] = None
+                        break
+                    entry['pending'] = []
+                for data in pending:
+                    handler(channel_name, wsname, data)
+
+        return channel_name, pairs
+
+    def unsubscribe(self, handler):
+        '''
+        Removes the handler from every channel/pair it is subscribed to (the upstream subscriptions stay open).
+        '''
+        with self._lock:
+            for key, entries in self._subscribers.items():
+                self._subscribers[key] = [entry for entry in entries if entry['handler'] != handler]
+
+    def latest(self, channel_name, wsname):
+        '''
+        args:
+            - channel_name = Kraken channel name (i.e.- 'trade', 'ohlc-5', 'book-10')
+            - wsname = pair in wsname format
+
+        returns:
+            - The latest data for the channel/pair (a book snapshot for 'book' channels), or 'None' ('trade' is never kept)
+        '''
+        if channel_name.startswith('book'):
+            book = self.ws._books.get(wsname)
+            if book is None:
+                return None
+            # hold the book's lock so the snapshot can't be taken halfway through an update
+            with book._lock:
+                if not book.valid:
+                    return None
+                return {
+                    'as': [[book._asks[price][0], book._asks[price][1], '0'] for price in book._ask_prices],
+                    'bs': [[book._bids[price][0], book._bids[price][1], '0'] for price in reversed(book._bid_prices)]
+                }
+
+        return self._latest.get((channel_name, wsname))
+
+    def start(self):
+        '''
+        Starts the upstream connection and (if an address is set) starts accepting client processes.
+        '''
+        self._running = True
+        self.ws.start()
+
+        if self.address is not None:
+            self._listener = Listener(self.address, authkey=self.authkey)
+            threading.Thread(target=self._accept, daemon=True).start()
+
+    def stop(self):
+        '''
+        Stops the upstream connection and disconnects every client process.
+        '''
+        self._running = False
+        self.ws.stop()
+
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+        for client in list(self._clients):
+            self._enqueue(client, None)
+            client['conn'].close()
+        self._clients = []
+
+    def _publish(self, channel_name, wsname, data):
+        # called from the upstream websocket thread for every message
+        # only the state channels are kept for late joiners, the book has its own snapshot and a trade replayed to them would be a duplicate
+        if channel_name != 'trade' and not channel_name.startswith('book'):
+            self._latest[(channel_name, wsname)] = data
+
+        # subscribers that are still being sent their snapshot get the update queued, everyone else gets it right away (outside the lock)
+        handlers = []
+        with self._lock:
+            for entry in self._subscribers.get((channel_name, wsname), []):
+                if entry['pending'] is not None:
+                    entry['pending'].append(data)
+                else:
+                    handlers.append(entry['handler'])
+
+        for handler in handlers:
+            handler(channel_name, wsname, data)
+
+    def _accept(self):
+        while self._running:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                if not self._running:
+                    break
+                continue
+
+            client = {'conn': conn, 'queue': queue.Queue(maxsize=self.client_queue), 'dropped': 0}
+            self._clients.append(client)
+
+            threading.Thread(target=self._client_requests, args=(client,), daemon=True).start()
+            threading.Thread(target=self._client_sender, args=(client,), daemon=True).start()
+
+    def _enqueue(self, client, message):
+        # never let a slow client hold up the upstream thread, drop its oldest message instead
+        while True:
+            try:
+                client['queue'].put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    client['queue'].get_nowait()
+                    client['dropped'] += 1
+                except queue.Empty:
+                    pass
+
+    def _client_requests(self, client):
+        # requests from a client process: ('subscribe', request_id, channel, pair, interval, depth)
+        def forward(channel_name, wsname, data):
+            self._enqueue(client, ('data', channel_name, wsname, data))
+
+        try:
+            while True:
+                request = client['conn'].recv()
+
+                if request[0] == 'subscribe':
+                    request_id, channel, pair, interval, depth = request[1:]
+                    try:
+                        # the client can only route data once it knows the wsnames, so the reply has to go out before the snapshot
+                        self.subscribe(channel, pair, forward, interval=interval, depth=depth,
+                                       ready=lambda channel_name, pairs: self._enqueue(client, ('subscribed', request_id, channel_name, pairs)))
+                    except Exception as e:
+                        self._enqueue(client, ('error', request_id, str(e), None))
+
+        except (EOFError, OSError):
+            # the client went away
+            self.unsubscribe(forward)
+            self._enqueue(client, None)
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def _client_sender(self, client):
+        while True:
+            message = client['queue'].get()
+            if message is None:
+                break
+            try:
+                client['conn'].send(message)
+            except (OSError, ValueError):
+                break
+
+
+class KrakenBrokerClient:
+    '''
+    Connects to a KrakenBroker running in another local process and receives its market data, without opening any
+    websocket connections or making any REST calls of its own.
+
+    args:
+        - authkey = the broker's secret key (KrakenBroker.authkey)
+        * Optional: address = address the broker is listening on
+            - Default is set to ('localhost', 6000)
+    '''
+
+    def __init__(self, authkey, address=('localhost', 6000)):
+        if not authkey:
+            raise Exception({'input_error': "authkey is required.  Use the broker's .authkey."})
+        self.conn = Client(address, authkey=authkey)
+        self._handlers = {}
+        self._requests = {}
+        self._request_id = 0
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._running = True
+
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def subscribe(self, channel, pair, handler, interval=None, depth=None, timeout=30):
+        '''
+        args:
+            - channel = 'ticker', 'trade', 'ohlc', 'spread' or 'book'
+            - pair = pair or list of pairs
+            - handler = function called as handler(channel_name, wsname, data), the same as a KrakenWS handler
+            * Optional: interval = ohlc interval in minutes (only for 'ohlc')
+            * Optional: depth = book depth (only for 'book')
+            * Optional: timeout = seconds to wait for the broker to confirm the subscription
+
+        returns:
+            - (channel_name, list of wsnames) that the handler was subscribed to
+        '''
+        with self._lock:
+            self._request_id += 1
+            request_id = self._request_id
+            reply = {'event': threading.Event(), 'handler': handler}
+            self._requests[request_id] = reply
+
+        with self._send_lock:
+            self.conn.send(('subscribe', request_id, channel, pair, interval, depth))
+
+        if not reply['event'].wait(timeout):
+            raise Exception({'broker_error': 'Error Message: broker did not respond to the subscription request'})
+
+        if 'error' in reply:
+            raise Exception({'broker_error': f"Error Message: {reply['error']}"})
+
+        return reply['channel_name'], reply['pairs']
+
+    def close(self):
+        self._running = False
+        self.conn.close()
+
+    def _receive(self):
+        while self._running:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+
+            kind = message[0]
+            if kind == 'data':
+                channel_name, wsname, data = message[1:]
+                for handler in list(self._handlers.get((channel_name, wsname), [])):
+                    handler(channel_name, wsname, data)
+
+            else:
+                request_id = message[1]
+                reply = self._requests.pop(request_id, None)
+                if reply is None:
+                    continue
+
+                if kind == 'subscribed':
+                    reply['channel_name'], reply['pairs'] = message[2], message[3]
+                    with self._lock:
+                        for wsname in reply['pairs']:
+                            self._handlers.setdefault((reply['channel_name'], wsname), []).append(reply['handler'])
+                else:
+                    reply['error'] = message[2]
+
+                reply['event'].set()
+
+
+# column types of the Kraken downloadable trade history .csv files (see KrakenData.create_kraken_db)
+TRADE_CSV_DTYPES = {'timestamp': 'int64', 'price': 'float64', 'volume': 'float64'}
+
+
+def _init_csv_worker(queue):
+    # runs once in each KrakenData.create_kraken_db() worker process, so the queue doesn't have to be pickled with every file
+    global _csv_queue
+    _csv_queue = queue
+
+
+def _get_from_workers(messages, result, timeout):
+    # next message from the KrakenData.create_kraken_db() workers.  A worker that is killed (i.e.- out of memory) never sends
+    # its 'done' and the pool never finishes its map, so instead of blocking forever this gives up after 'timeout' quiet seconds
+    started = time.time()
+    while True:
+        try:
+            return messages.get(timeout=1)
+        except queue.Empty:
+            pass
+
+        # the workers catch their own errors, so this only re-raises what went wrong in the pool itself
+        if result.ready() and not result.successful():
+            result.get()
+
+        if time.time() - started > timeout:
+            raise Exception({'input_error': f'No data from the .csv workers for {timeout} seconds, a worker process may have died'})
+
+
+def _parse_trade_csv(args):
+    # parses one Kraken .csv file in chunks and sends the columns back to the writer as numpy arrays (much cheaper to pickle than rows)
+    # with a Parquet dataset (parquet_root), every worker writes its own pair's files directly and only the totals are sent back
+    path, table_name, chunksize, parquet_root = args
+    count, first, last = 0, None, None
+    try:
+        reader = pd.read_csv(path, delimiter=',', names=list(TRADE_CSV_DTYPES), dtype=TRADE_CSV_DTYPES, chunksize=chunksize, engine='c')
+        for chunk in reader:
+            timestamps = chunk['timestamp'].to_numpy()
+            if not len(timestamps):
+                continue
+
+            if parquet_root is None:
+                _csv_queue.put(('rows', table_name, timestamps, chunk['price'].to_numpy(), chunk['volume'].to_numpy()))
+            else:
+                _write_parquet_trades(parquet_root, table_name, timestamps, chunk['price'].to_numpy(), chunk['volume'].to_numpy())
+
+            count += len(timestamps)
+            first = timestamps.min() if first is None else min(first, timestamps.min())
+            last = timestamps.max() if last is None else max(last, timestamps.max())
+
+        _csv_queue.put(('done', table_name, count, first, last))
+    except Exception as e:
+        _csv_queue.put(('error', table_name, repr(e)))
+
+
+def _parquet_trade_schema():
+    # every file has all of the columns, with side/ordertype/trade_id left null for the trades that don't have them (i.e.- the .csv files)
+    # side is 1 for buys and -1 for sells and ordertype is 0 for market and 1 for limit orders (the same as TRADE_DTYPE)
+    return pa.schema([('timestamp', pa.int64()), ('price', pa.float64()), ('volume', pa.float64()),
+                      ('side', pa.int8()), ('ordertype', pa.int8()), ('trade_id', pa.int64())])
+
+
+def _parquet_time_range(path):
+    # (first, last) timestamp in nanoseconds of a Parquet trade file from its row group statistics, or (None, None) if it is empty
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    column = parquet_file.schema_arrow.get_field_index('timestamp')
+
+    low, high = None, None
+    for row_group in range(metadata.num_row_groups):
+        if metadata.row_group(row_group).num_rows == 0:
+            continue
+        statistics = metadata.row_group(row_group).column(column).statistics
+        if statistics is None or not statistics.has_min_max:
+            # written without statistics, so read the column itself
+            timestamps = parquet_file.read(columns=['timestamp']).column('timestamp')
+            if len(timestamps) == 0:
+                return None, None
+            return pc.min(timestamps).as_py(), pc.max(timestamps).as_py()
+        low = statistics.min if low is None else min(low, statistics.min)
+        high = statistics.max if high is None else max(high, statistics.max)
+
+    return low, high
+
+
+def _merge_pages(streams):
+    # merges streams of time sorted pages into one stream of time sorted pages, holding about one page from each stream
+    # rows with the same timestamp keep the order of the streams
+    buffers = []
+    for stream in streams:
+        page = next(stream, None)
+        if page is not None:
+            buffers.append([page, stream])
+
+    while buffers:
+        # every row up to the smallest last timestamp of the buffered pages is complete across all of the streams
+        watermark = min(page[-1, 0] for page, stream in buffers)
+        parts = []
+        for buffer in buffers:
+            cut = np.searchsorted(buffer[0][:, 0], watermark, side='right')
+            parts.append(buffer[0][:cut])
+            buffer[0] = buffer[0][cut:]
+
+        page = np.concatenate(parts)
+        yield page[np.argsort(page[:, 0], kind='stable')]
+
+        for buffer in buffers:
+            while buffer[0] is not None and not len(buffer[0]):
+                buffer[0] = next(buffer[1], None)
+        buffers = [buffer for buffer in buffers if buffer[0] is not None]
+
+
+def _write_parquet_trades(root, table_name, timestamps, prices, volumes, sides=None, ordertypes=None, trade_ids=None):
+    # writes trades to a Parquet dataset laid out as root/pair=XBTUSD/month=2023-01/part-....parquet
+    # timestamps come in as unix seconds and are stored as int64 nanoseconds, which delta encode and compress to a few bits per trade
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.integer):
+        nanoseconds = timestamps.astype('int64') * 1000000000
+    else:
+        nanoseconds = np.round(timestamps.astype('float64') * 1000000000).astype('int64')
+
+    prices = np.asarray(prices, dtype='float64')
+    volumes = np.asarray(volumes, dtype='float64')
+    # None (a missing side, ordertype or trade_id) is written as null
+    extra = {name: None if values is None else pa.array(list(values), type=_parquet_trade_schema().field(name).type)
+             for name, values in (('side', sides), ('ordertype', ordertypes), ('trade_id', trade_ids))}
+    months = nanoseconds.astype('datetime64[ns]').astype('datetime64[M]')
+
+    files = []
+    for month in np.unique(months):
+        in_month = months == month
+        folder = Path(root) / f'pair={table_name}' / f'month={month}'
+        folder.mkdir(parents=True, exist_ok=True)
+
+        count = int(in_month.sum())
+        columns = {'timestamp': nanoseconds[in_month], 'price': prices[in_month], 'volume': volumes[in_month]}
+        for name, values in extra.items():
+            columns[name] = pa.nulls(count, _parquet_trade_schema().field(name).type) if values is None else values.filter(pa.array(in_month))
+        table = pa.table(columns, schema=_parquet_trade_schema())
+        # file names start with the write time so they list in the order they were written
+        path = folder / f'part-{time.time_ns()}-{os.getpid()}.parquet'
+        pq.write_table(table, path, compression='zstd', use_dictionary=False, column_encoding={'timestamp': 'DELTA_BINARY_PACKED'})
+        files.append(path.name)
+
+    # returns the names of the files written
+    return files
+
+
+def _read_parquet_trades(root, table_name, start=None, end=None):
+    # reads one pair's trades between the unix timestamps start and end (inclusive)
+    # only the months in range are opened (partition pruning), row groups outside the range are skipped using their statistics and
+    # only the three trade columns are read
+    folder = Path(root) / f'pair={table_name}'
+    if not folder.exists():
+        return pd.DataFrame({'price': pd.Series(dtype='float64'), 'volume': pd.Series(dtype='float64')}, index=pd.Index([], dtype='float64', name='timestamp'))
+
+    partitioning = pa_dataset.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+    dataset = pa_dataset.dataset(folder, format='parquet', partitioning=partitioning)
+
+    condition = None
+    for bound, compare in ((start, 'ge'), (end, 'le')):
+        if bound is None:
+            continue
+        nanoseconds = int(bound * 1000000000)
+        month = str(np.datetime64(nanoseconds, 'ns').astype('datetime64[M]'))
+        if compare == 'ge':
+            bound_condition = (pa_dataset.field('timestamp') >= nanoseconds) & (pa_dataset.field('month') >= month)
+        else:
+            bound_condition = (pa_dataset.field('timestamp') <= nanoseconds) & (pa_dataset.field('month') <= month)
+        condition = bound_condition if condition is None else condition & bound_condition
+
+    table = dataset.to_table(columns=['timestamp', 'price', 'volume'], filter=condition).sort_by('timestamp')
+
+    data = pd.DataFrame({
+        'price': table.column('price').to_numpy(),
+        'volume': table.column('volume').to_numpy()},
+        index=pd.Index(table.column('timestamp').to_numpy() / 1000000000, name='timestamp'))
+
+    return data
+
+
+def _ohlcv_worker(args):
+    # builds one pair's bars for KrakenData.ohlcv_df() (module level so it can run in a process pool)
+    backend, db_path, crypto, interval, start_time, end_time = args
+    return KrakenData(backend=backend)._pair_ohlcv(db_path, crypto, interval, start_time, end_time)
+
+
+# process pools for KrakenData.ohlcv_df(), one for each number of workers: {processes: multiprocessing.Pool}
+# they are started on the first call that needs them and reused after that, close_ohlcv_pool() shuts them down (it also runs at exit)
+# the workers are spawned instead of forked, a forked child would inherit copies of locks held by the websocket/broker threads
+_ohlcv_pools = {}
+_ohlcv_pools_lock = threading.Lock()
+
+
+def _ohlcv_pool(processes):
+    with _ohlcv_pools_lock:
+        if processes not in _ohlcv_pools:
+            _ohlcv_pools[processes] = multiprocessing.get_context('spawn').Pool(processes)
+        return _ohlcv_pools[processes]
+
+
+def close_ohlcv_pool():
+    # shuts down the worker processes KrakenData.ohlcv_df() keeps between calls
+    # the next ohlcv_df() call starts new ones, so this is safe to call at any time
+    '''
+    returns:
+        * the number of pools that were closed
+    '''
+
+    with _ohlcv_pools_lock:
+        pools = list(_ohlcv_pools.values())
+        _ohlcv_pools.clear()
+
+    for pool in pools:
+        pool.close()
+        pool.join()
+
+    return len(pools)
+
+
+atexit.register(close_ohlcv_pool)
+
+
+def _put_until_stopped(q, item, stop):
+    # put() on a bounded queue that gives up once 'stop' is set, so a failed stage can't leave the others blocked forever
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _stored_at_start(timestamps, last_timestamp, stored):
+    # number of trades to skip at the start of 'timestamps' (sorted, none older than last_timestamp): the leading trades at
+    # last_timestamp, up to the 'stored' that are already copied
+    if last_timestamp is None or stored <= 0:
+        return 0
+    return min(stored, int(np.searchsorted(timestamps, last_timestamp, side='right')))
+
+
+def _skip_stored_trades(trades, last_timestamp, stored):
+    # drops the REST trades older than last_timestamp and the first 'stored' trades at last_timestamp (the ones already in the table)
+    # returns the remaining trades and the (last_timestamp, stored) still left to skip, or 'None' once a newer trade has been reached
+    # compared in whole microseconds, since Parquet gives the timestamps back from nanoseconds (Kraken's are 100 microseconds apart at most)
+    last = round(last_timestamp * 1000000)
+    kept = []
+    for i, trade in enumerate(trades):
+        timestamp = round(float(trade[2]) * 1000000)
+        if timestamp > last:
+            return kept + trades[i:], None
+        if timestamp == last:
+            if stored > 0:
+                stored -= 1
+            else:
+                kept.append(trade)
+    return kept, (last_timestamp, stored)
+
+
+def _discard_uncommitted_parquet(root, table_name, entry):
+    # .update_db() writes the Parquet files first and then saves the catalog, so files newer than the catalog's 'last_file' were never checkpointed
+    if entry is None or not entry.get('last_file'):
+        return
+    for path in (Path(root) / f'pair={table_name}').glob('month=*/part-*.parquet'):
+        if path.name > entry['last_file']:
+            path.unlink()
+
+
+def _parquet_trade_ids(root, table_name, start, end):
+    # the trade_ids stored between the unix timestamps start and end (inclusive), only reading the months in range
+    folder = Path(root) / f'pair={table_name}'
+    if not folder.exists():
+        return set()
+
+    # the schema is given so files written before the trade_id column existed just read as null
+    schema = _parquet_trade_schema().append(pa.field('month', pa.string()))
+    partitioning = pa_dataset.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+    dataset = pa_dataset.dataset(folder, format='parquet', partitioning=partitioning, schema=schema)
+
+    first, last = int(round(start * 1000000000)), int(round(end * 1000000000))
+    months = [str(np.datetime64(bound, 'ns').astype('datetime64[M]')) for bound in (first, last)]
+    condition = ((pa_dataset.field('timestamp') >= first) & (pa_dataset.field('timestamp') <= last) &
+                 (pa_dataset.field('month') >= months[0]) & (pa_dataset.field('month') <= months[1]))
+
+    trade_ids = dataset.to_table(columns=['trade_id'], filter=condition).column('trade_id').drop_null()
+    return set(trade_ids.to_pylist())
+
+
+def _parquet_count_at(root, table_name, timestamp):
+    # number of trades stored at this timestamp, give or take a microsecond of float rounding (only the month it falls in is read)
+    nanoseconds = int(round(timestamp * 1000000000))
+    folder = Path(root) / f'pair={table_name}' / f'month={np.datetime64(nanoseconds, "ns").astype("datetime64[M]")}'
+    if not folder.exists():
+        return 0
+    column = pa_dataset.dataset(folder, format='parquet').to_table(columns=['timestamp'], filter=(pa_dataset.field('timestamp') >= nanoseconds - 1000) & (pa_dataset.field('timestamp') <= nanoseconds + 1000)).column('timestamp')
+    return len(column)
+
+
+def _parquet_last_timestamp(root, table_name):
+    # the newest trade is in the newest month, so only that partition is read
+    months = sorted((Path(root) / f'pair={table_name}').glob('month=*'))
+    if not months:
+        return None
+    nanoseconds = pa_dataset.dataset(months[-1], format='parquet').to_table(columns=['timestamp']).column('timestamp')
+    if len(nanoseconds) == 0:
+        return None
+    return pc.max(nanoseconds).as_py() / 1000000000
+
+
+# layout of the trade chunks from KrakenData.iter_trades(as_array=True)
+DB_TRADE_DTYPE = np.dtype([('timestamp', 'f8'), ('price', 'f8'), ('volume', 'f8')])
+
+
+class KrakenTradeIterator:
+    '''
+    Streams one pair's trade history in chunks, oldest first, without ever holding more than a couple of chunks in memory
+    (see KrakenData.iter_trades).
+
+    The sqlite tables are read with keyset pagination on the timestamp index (every page starts where the last one ended,
+    so there is no OFFSET to skip over) and Parquet datasets are read one row group at a time.  A chunk never splits trades
+    that have the same timestamp, so .cursor (the timestamp of the last trade handed out) is always a safe place to resume from:
+        ex.:
+            trades = KrakenData('btcusd').iter_trades('kraken.db', chunk_rows=500000)
+            for chunk in trades:
+                process(chunk)
+                save(trades.cursor)
+            ...
+            for chunk in KrakenData('btcusd').iter_trades('kraken.db', after=load()):     # picks up where it left off
+    '''
+
+    def __init__(self, db_path, table_name, parquet=False, start=None, end=None, after=None, chunk_rows=100000, chunk_seconds=None, as_array=False, page_rows=100000):
+        self.db_path = db_path
+        self.table_name = table_name
+        self.parquet = parquet
+        self.end = end
+        self.chunk_rows = chunk_rows
+        self.chunk_seconds = chunk_seconds
+        self.as_array = as_array
+        self.page_rows = page_rows
+        self.cursor = after
+
+        # trades strictly after the cursor when resuming, otherwise from start_time on
+        if after is not None:
+            self._lower, self._inclusive = after, False
+        else:
+            self._lower, self._inclusive = start, True
+
+        self._conn = None
+        self._chunks = self._chunk()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self._chunks)
+        self.cursor = float(chunk[-1, 0])
+        return self._format(chunk)
+
+    def close(self):
+        '''
+        Stops the iterator early and closes its database connection.
+        '''
+        self._chunks.close()
+        self._close_connection()
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _format(self, chunk):
+        if self.as_array:
+            array = np.empty(len(chunk), dtype=DB_TRADE_DTYPE)
+            array['timestamp'], array['price'], array['volume'] = chunk[:, 0], chunk[:, 1], chunk[:, 2]
+            return array
+
+        # the same layout as KrakenData.trades_df()
+        data = pd.DataFrame({'price': chunk[:, 1], 'volume': chunk[:, 2]}, index=pd.Index(chunk[:, 0], name='timestamp'))
+        data.insert(0, 'date', pd.to_datetime(data.index, unit='s'))
+        return data
+
+    def _chunk(self):
+        # cuts the stream of pages into chunks, only ever between two different timestamps
+        buffer = np.empty((0, 3))
+        for page in (self._parquet_pages() if self.parquet else self._sqlite_pages()):
+            buffer = np.concatenate([buffer, page]) if len(buffer) else page
+
+            while True:
+                if self.chunk_seconds is not None:
+                    # time windows on a fixed grid (i.e.- chunk_seconds=86400 gives utc days), cut where the window changes
+                    windows = buffer[:, 0] // self.chunk_seconds
+                    cuts = np.flatnonzero(windows[1:] != windows[:-1]) + 1
+                else:
+                    if len(buffer) <= self.chunk_rows:
+                        break
+                    # the first change of timestamp at or after chunk_rows
+                    cuts = np.flatnonzero(buffer[self.chunk_rows:, 0] != buffer[self.chunk_rows - 1:-1, 0])[:1] + self.chunk_rows
+
+                if not len(cuts):
+                    break
+
+                yield buffer[:cuts[0]]
+                buffer = buffer[cuts[0]:]
+
+        if len(buffer):
+            yield buffer
+
+        self._close_connection()
+
+    def _sqlite_pages(self):
+        self._conn = sqlite3.connect(self.db_path)
+        lower, inclusive = self._lower, self._inclusive
+
+        while True:
+            conditions, params = [], []
+            if lower is not None:
+                conditions.append('timestamp >= ?' if inclusive else 'timestamp > ?')
+                params.append(lower)
+            if self.end is not None:
+                conditions.append('timestamp <= ?')
+                params.append(self.end)
+            where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+            rows = self._conn.execute(f'SELECT timestamp, price, volume FROM "{self.table_name}" {where} ORDER BY timestamp LIMIT ?', params + [self.page_rows]).fetchall()
+            if not rows:
+                return
+
+            page = np.array(rows, dtype='f8')
+            if len(rows) == self.page_rows:
+                # a full page can end part way through trades with the same timestamp, so they are all re-read together
+                last = page[-1, 0]
+                ties = self._conn.execute(f'SELECT timestamp, price, volume FROM "{self.table_name}" WHERE timestamp = ?', (rows[-1][0],)).fetchall()
+                page = np.concatenate([page[page[:, 0] != last], np.array(ties, dtype='f8')])
+
+            yield page
+
+            if len(rows) < self.page_rows:
+                return
+            lower, inclusive = page[-1, 0], False
+
+    def _parquet_pages(self):
+        folder = Path(self.db_path) / f'pair={self.table_name}'
+        first_month = None if self._lower is None else str(np.datetime64(int(self._lower * 1000000000), 'ns').astype('datetime64[M]'))
+        last_month = None if self.end is None else str(np.datetime64(int(self.end * 1000000000), 'ns').astype('datetime64[M]'))
+
+        # months sort in time order, but the files inside a month don't (i.e.- .repair_gaps() writes old trades to a new file)
+        for month in sorted(folder.glob('month=*')):
+            name = month.name.replace('month=', '')
+            if (first_month is not None and name < first_month) or (last_month is not None and name > last_month):
+                continue
+
+            for paths in self._overlapping_files(sorted(month.glob('*.parquet'))):
+                if len(paths) == 1:
+                    pages = self._file_pages(paths[0])
+                else:
+                    pages = _merge_pages([self._file_pages(path) for path in paths])
+
+                for page in pages:
+                    keep = np.ones(len(page), dtype=bool)
+                    if self._lower is not None:
+                        keep &= page[:, 0] >= self._lower if self._inclusive else page[:, 0] > self._lower
+                    if self.end is not None:
+                        keep &= page[:, 0] <= self.end
+
+                    if keep.any():
+                        yield page[keep]
+
+    def _file_pages(self, path):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=self.page_rows, columns=['timestamp', 'price', 'volume']):
+            yield np.column_stack([
+                batch.column('timestamp').to_numpy() / 1000000000,
+                batch.column('price').to_numpy(),
+                batch.column('volume').to_numpy()])
+
+    def _overlapping_files(self, paths):
+        # groups the files by the time range they cover, from the row group statistics, in trade time order
+        # a file that doesn't overlap any other is streamed on its own, the ones that do overlap are merged
+        ranges = []
+        for path in paths:
+            low, high = _parquet_time_range(path)
+            if low is None:
+                continue
+            # files that end before the lower bound or start after the end can be skipped without reading them
+            if (self._lower is not None and high / 1000000000 < self._lower) or (self.end is not None and low / 1000000000 > self.end):
+                continue
+            ranges.append((low, high, path))
+
+        group, group_high = [], None
+        for low, high, path in sorted(ranges, key=lambda file: (file[0], file[2].name)):
+            if group and low > group_high:
+                # the merge breaks ties in file name order, the same as the duckdb queries
+                yield sorted(group, key=lambda path: path.name)
+                group, group_high = [], None
+            group.append(path)
+            group_high = high if group_high is None else max(group_high, high)
+
+        if group:
+            yield sorted(group, key=lambda path: path.name)
+
 
 class KrakenData:
+    '''
+    Takes 'asset' which is a trading pair (i.e.- ETHUSD, btcusd, LTC/eth, etc.) or a list of trading pairs.
+
+    The trade history can be kept in a sqlite database (the default) or in a Parquet dataset, which is a folder of compressed
+    column files partitioned by pair and month (needs pyarrow).  Parquet is several times smaller on disk, only reads the months
+    and columns a query needs, and the folder can be copied or synced between machines a pair or month at a time.
+        ex.:
+            KrakenData(backend='parquet').create_kraken_db('kraken_csvs', 'data')     # creates the folder data/kraken_historical_trades
+            KrakenData('btcusd').ohlcv_df('1H', 'data/kraken_historical_trades', last=24)
+
+    args:
+        * Optional: asset = trading pair or list of trading pairs
+        * Optional: backend = 'sqlite' or 'parquet'
+            - Default is set to 'None' which uses Parquet when db_path is a folder and sqlite otherwise
+    '''
 
-    def __init__(self, asset=None):
+    def __init__(self, asset=None, backend=None):
         self.asset = asset
+        self.backend = backend
+
+        if backend not in (None, 'sqlite', 'parquet'):
+            raise Exception({'input_error': f"{backend} is not a valid backend.  Only 'sqlite' and 'parquet' are accepted."})
+        if backend == 'parquet' and pa is None:
+            raise Exception({'input_error': "The 'parquet' backend needs pyarrow.  Please install it with 'pip install pyarrow'."})
     
-    def create_kraken_db(self, folder_path, db_path, db_name='kraken_historical_trades'):
+    def create_kraken_db(self, folder_path, db_path, db_name='kraken_historical_trades', workers=None, chunksize=1000000, commit_rows=5000000, page_size=65536, covering=False, rollups=True, worker_timeout=600):
         # this function will create a sqlite database from the Kraken downloadable data found at:
             # https://support.kraken.com/hc/en-us/articles/360047543791-Downloadable-historical-market-data-time-and-sales-
         # folder_path is the folder that you download and save these files in
         # db_path is where you want the databse to be created and stored.
-        # Beware - if you use the entire dataset, the trade history will be around 40 GB and takes about 15-30 minutes to run and 
-            # will only get bigger every quarter (at least at the time of this writing - 12/7/2022)
+        # Beware - if you use the entire dataset, the trade history will be around 40 GB and will only get bigger every quarter
+            # (at least at the time of this writing - 12/7/2022).  The files are parsed in parallel, so the load is mostly limited by disk speed.
         # Once this initial database is created, it is recommended to run KrakenData().update_db() immediately after.  This will
             # bring the database up to date with current trades - however, there could be a lot of data needing to be updated so it 
             # could potentially take a very long time (like a day or two if the database is created toward the end of the quarter - the Kraken REST API is rate 
@@ -2326,43 +5345,303 @@ class KrakenData:
             - folder_path = directory path where Kraken historical data is stored
             - db_path = directory path where the database will be created and stored
             * Optional: db_name = name of the database that will be created, default name is 'trade_historical_data.db'
+            * Optional: workers = number of processes used to parse the .csv files
+                - Default is set to 'None' which uses one per cpu
+            * Optional: chunksize = number of rows parsed at a time from each file
+                - Default is set to 1000000
+            * Optional: commit_rows = number of rows written in each transaction
+                - Default is set to 5000000
+            * Optional: page_size = sqlite page size in bytes (only used when the database is new)
+                - Default is set to 65536
+            * Optional: covering = build covering (timestamp, price, volume) indexes instead of plain timestamp indexes (see .migrate_db())
+                - Default is set to False
+            * Optional: rollups = build the 1 minute OHLCV rollups (see .build_rollups(), sqlite only)
+                - Default is set to True
+            * Optional: worker_timeout = seconds to wait on the parsing processes before giving up (i.e.- if one was killed)
+                - Default is set to 600
 
         creates:
-            - sqlite database
+            - sqlite database, or with KrakenData(backend='parquet') a Parquet dataset folder at db_path/db_name
         '''
         # create a list of all the available data files from Kraken. These will be used for the tables in the sqlite db.
-        table_list = os.listdir(folder_path)
+        table_list = [table for table in os.listdir(folder_path) if table.endswith('.csv')]
+
+        if self.backend == 'parquet':
+            return self._create_parquet_db(folder_path, Path(f'{db_path}/{db_name}'), table_list, workers, chunksize, worker_timeout)
 
         # connect to the db, if it doesn't exist it will be created.
         conn = sqlite3.connect(Path(f'{db_path}/{db_name}.db'))
+        # bulk load settings: big pages and cache, WAL, and no fsync until the load is done
+        # page_size only takes effect on a new database file, so it has to be set before anything is written
+        # synchronous, cache_size and temp_store only apply to this connection, so every later connection is back on the safe defaults
+        conn.execute(f'PRAGMA page_size={page_size}')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('PRAGMA cache_size=-1000000')
+        conn.execute('PRAGMA temp_store=MEMORY')
+
+        # the tables are replaced and the indexes are only built once all of the rows are in, which is much faster than updating them on every insert
+        self._create_catalog(conn)
+        for table in table_list:
+            table_name = table.replace('.csv', '')
+            conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            conn.execute('DELETE FROM "kraken_catalog" WHERE "pair" = ?', (table_name,))
+            self._create_trade_table(conn, table_name, index=False)
+        conn.commit()
+
+        # the .csv files are parsed in a pool of processes and the chunks are sent back here, where a single connection does all of the writing
+        # the queue is bounded so the parsers can't get too far ahead of the writer and fill up memory
+        chunks = multiprocessing.Queue(maxsize=(workers or os.cpu_count()) * 4)
+        pool = multiprocessing.Pool(workers, initializer=_init_csv_worker, initargs=(chunks,))
+        result = pool.map_async(_parse_trade_csv, [(str(Path(f'{folder_path}/{table}')), table.replace('.csv', ''), chunksize, None) for table in table_list])
+        pool.close()
 
-        # read in the .csv files as a pandas dataframe and then send to the newly created db
         # use tqdm library to display a progress bar
-        pbar = tqdm(table_list)
-        for table in pbar:
-            pbar.set_description(f'Current Asset: {table}   Overall Progress: ')
-            df = pd.read_csv(
-                Path(f'{folder_path}/{table}'),
-                delimiter=',',
-                names=['timestamp', 'price', 'volume'])
-            
-            df.set_index('timestamp', inplace=True, )
-            
-            df.to_sql(f'{table.replace(".csv", "")}', conn, if_exists='replace')
+        pbar = tqdm(total=len(table_list))
+        pbar.set_description('Overall Progress: ')
+        finished = 0
+        uncommitted = 0
+        try:
+            while finished < len(table_list):
+                message = _get_from_workers(chunks, result, worker_timeout)
+
+                if message[0] == 'rows':
+                    _, table_name, timestamps, prices, volumes = message
+                    self._insert_trades(conn, table_name, zip(timestamps.tolist(), prices.tolist(), volumes.tolist()))
+                    uncommitted += len(timestamps)
+
+                    # large transactions, but not so large that the WAL file grows without limit
+                    if uncommitted >= commit_rows:
+                        conn.commit()
+                        uncommitted = 0
+
+                elif message[0] == 'done':
+                    finished += 1
+                    pbar.update(1)
+                    pbar.set_description(f'Last Asset: {message[1]}   Overall Progress: ')
+
+                else:
+                    raise Exception({'input_error': f'Could not read {message[1]}.csv: {message[2]}'})
+
+            conn.commit()
+            pbar.close()
+
+            # build the timestamp indexes now that the data is loaded
+            for table in tqdm(table_list, desc='Building Indexes: '):
+                self._create_trade_index(conn, table.replace('.csv', ''), covering)
+                self._rebuild_catalog(conn, table.replace('.csv', ''))
+            conn.commit()
+
+            # 1 minute rollups so .ohlcv_df() doesn't have to resample the ticks
+            if rollups:
+                for table in tqdm(table_list, desc='Building Rollups: '):
+                    self._build_rollup(conn, table.replace('.csv', ''), chunksize)
+
+            # let the query planner know how big the tables and indexes are
+            conn.execute('ANALYZE')
+            conn.commit()
+
+            # fold the WAL back into the database file now that the load is done
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+        except:
+            pool.terminate()
+            raise
+
+        finally:
+            pool.join()
+            # close the connection after the tables are built
+            conn.close()
+
+    def _create_parquet_db(self, folder_path, root, table_list, workers, chunksize, worker_timeout):
+        # every worker writes its own pairs straight to the dataset, so there is no single writer to wait on
+        root.mkdir(parents=True, exist_ok=True)
+        catalog = self._parquet_catalog(root)
+        for table in table_list:
+            table_name = table.replace('.csv', '')
+            shutil.rmtree(root / f'pair={table_name}', ignore_errors=True)
+            catalog.pop(table_name, None)
+
+        done = multiprocessing.Queue()
+        pool = multiprocessing.Pool(workers, initializer=_init_csv_worker, initargs=(done,))
+        result = pool.map_async(_parse_trade_csv, [(str(Path(f'{folder_path}/{table}')), table.replace('.csv', ''), chunksize, str(root)) for table in table_list])
+        pool.close()
+
+        # use tqdm library to display a progress bar
+        pbar = tqdm(total=len(table_list))
+        pbar.set_description('Overall Progress: ')
+        try:
+            for _ in table_list:
+                message = _get_from_workers(done, result, worker_timeout)
+                if message[0] == 'error':
+                    raise Exception({'input_error': f'Could not read {message[1]}.csv: {message[2]}'})
+
+                _, table_name, count, first, last = message
+                catalog[table_name] = {'first_timestamp': None if first is None else float(first), 'last_timestamp': None if last is None else float(last),
+                                       'last_cursor': None, 'row_count': count, 'updated': time.time()}
+                pbar.update(1)
+                pbar.set_description(f'Last Asset: {table_name}   Overall Progress: ')
+
+            pbar.close()
+
+        except:
+            pool.terminate()
+            raise
+
+        finally:
+            pool.join()
+            self._save_parquet_catalog(root, catalog)
+
+    def _parquet(self, db_path):
+        if self.backend is None:
+            parquet = os.path.isdir(db_path)
+        else:
+            parquet = self.backend == 'parquet'
+
+        # a folder picks the Parquet backend on its own, so this is the first place a missing pyarrow shows up
+        if parquet and pa is None:
+            raise Exception({'input_error': 'pyarrow is required for the Parquet backend'})
+        return parquet
+
+    def _parquet_catalog(self, root):
+        # the Parquet version of the 'kraken_catalog' table, kept as a small json file at the top of the dataset
+        path = Path(root) / '_catalog.json'
+        if not path.exists():
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_parquet_catalog(self, root, catalog):
+        # written to a temporary file and renamed, so a crash never leaves a half written catalog
+        path = Path(root) / '_catalog.json'
+        with open(path.with_suffix('.tmp'), 'w') as f:
+            json.dump(catalog, f)
+        os.replace(path.with_suffix('.tmp'), path)
+
+    def _update_parquet_catalog(self, root, table_name, timestamps, cursor=None, files=None):
+        # files = names of the Parquet files the timestamps were written to.  The newest one is the checkpoint: anything written after it
+        # is thrown away by the next .update_db(), since the catalog (and so the cursor) was never saved for it
+        catalog = self._parquet_catalog(root)
+        entry = catalog.get(table_name, {'first_timestamp': None, 'last_timestamp': None, 'last_cursor': None, 'row_count': 0, 'updated': None})
+        if files:
+            entry['last_file'] = max(files + ([entry['last_file']] if entry.get('last_file') else []))
+
+        if len(timestamps):
+            first, last = float(min(timestamps)), float(max(timestamps))
+            entry['first_timestamp'] = first if entry['first_timestamp'] is None else min(entry['first_timestamp'], first)
+            entry['last_timestamp'] = last if entry['last_timestamp'] is None else max(entry['last_timestamp'], last)
+            entry['row_count'] += len(timestamps)
+        entry['last_cursor'] = cursor
+        entry['updated'] = time.time()
+
+        catalog[table_name] = entry
+        self._save_parquet_catalog(root, catalog)
+
+    def migrate_db(self, db_path, covering=False):
+        # one-shot upgrade for databases made before the trade tables were indexed (i.e.- tables made by older versions of .update_db())
+        # and before the 'kraken_catalog' table existed
+        # safe to run more than once - tables that are already indexed and cataloged are skipped
+        '''
+        args:
+            - db_path = path to the sqlite database
+            * Optional: covering = build covering (timestamp, price, volume) indexes so range queries never read the tables themselves.
+                                   This is the fastest for .ohlcv_df() and .trades_df(), but the database grows to roughly twice the size.
+                - Default is set to False which builds plain timestamp indexes
+
+        returns:
+            - A list of the tables that were migrated
+        '''
+        if self._parquet(db_path):
+            raise Exception({'input_error': 'migrate_db() is only for sqlite databases.  Parquet datasets are always partitioned and cataloged.'})
+
+        conn = sqlite3.connect(db_path)
+
+        try:
+            self._create_catalog(conn)
+            tables = [table for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+            cataloged = {pair for (pair,) in conn.execute('SELECT "pair" FROM "kraken_catalog"')}
+            index_name = '{}_timestamp_price_volume' if covering else '{}_timestamp'
+            existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+
+            migrated = []
+            pbar = tqdm(tables)
+            for table_name in pbar:
+                pbar.set_description(f'Current Asset: {table_name}   Overall Progress: ')
+
+                # only the trade tables, and only the ones missing the index, the trade_id columns or the catalog entry
+                columns = [column[1] for column in conn.execute(f'PRAGMA table_info("{table_name}")')]
+                if 'timestamp' not in columns or ('ix_' + index_name.format(table_name) in existing and table_name in cataloged
+                                                  and 'trade_id' in columns and f'ux_{table_name}_trade_id' in existing):
+                    continue
+
+                with conn:
+                    self._upgrade_trade_table(conn, table_name)
+                    self._create_trade_index(conn, table_name, covering)
+                    self._rebuild_catalog(conn, table_name)
+                migrated.append(table_name)
+
+            if migrated:
+                conn.execute('ANALYZE')
+                conn.commit()
+
+        finally:
+            conn.close()
+
+        return migrated
+
+    def catalog(self, db_path):
+        '''
+        args:
+            - db_path = path to the sqlite database
 
-        # close the connection after the tables are built
-        conn.close()
+        returns:
+            - A dataframe indexed by table name with each pair's first/last trade timestamp, last REST cursor, row count and last update time
+        '''
+        if self._parquet(db_path):
+            columns = ['first_timestamp', 'last_timestamp', 'last_cursor', 'row_count', 'updated']
+            catalog = pd.DataFrame.from_dict(self._parquet_catalog(db_path), orient='index', columns=columns).sort_index()
+            catalog.index.name = 'pair'
+            return catalog
+
+        conn = sqlite3.connect(db_path)
 
-    def ohlcv_df(self, interval, db_path, start_time=None, end_time=None, last=None, include_last_period=True):
+        try:
+            self._create_catalog(conn)
+            catalog = pd.read_sql('SELECT * FROM "kraken_catalog" ORDER BY "pair"', conn, index_col='pair')
+        finally:
+            conn.close()
+
+        return catalog
+
+    def ohlcv_df(self, interval, db_path, start_time=None, end_time=None, last=None, include_last_period=True, workers=None):
         # takes a crypto trading pair and time interval and returns an multiindex OHLC dataframe
-        pair = []
+        # with a list of pairs, each pair's bars are built in its own process and the panel is put together in one concat at the end
+        '''
+        args:
+            - interval = bar interval as a pandas frequency (i.e.- '1min', '4H', '1D')
+            - db_path = path to the sqlite database or Parquet dataset folder
+            * Optional: start_time = first time to include (anything pd.to_datetime understands)
+            * Optional: end_time = last time to include (anything pd.to_datetime understands)
+            * Optional: last = number of intervals back from now to include (overrides start_time and end_time)
+            * Optional: include_last_period = include the last (usually unfinished) bar
+                - Default is set to True
+            * Optional: workers = number of processes used to build the bars when there is more than one pair
+                - Default is set to 'None' which uses one per cpu
+                * NOTICE: the processes are started by the first call with more than one pair and reused by the calls after it, kraken.close_ohlcv_pool() shuts them down
+
+        returns:
+            - A multiindex dataframe of (pair, open/high/low/close/volume/trade_count) columns indexed by bar time,
+              or 'None' if none of the pairs have trades in the period
+        '''
         if type(self.asset) != list:
             assets = [self.asset]
         else:
             assets = self.asset
-            
-        for asset in PublicKraken(assets).pair_matching():
-            pair.append(PublicKraken(asset).get_pair_info()['altname'])
+
+        # one AssetPairs call for all of the table names
+        matched = PublicKraken(assets).pair_matching()
+        pair_info = self._pair_info(matched)
+        pair = [str(pair_info[asset]['altname']) for asset in matched]
 
         interval_dict = {
             'D': 86400,
@@ -2402,79 +5681,501 @@ class KrakenData:
 
             interval_length = int(interval_length)
 
-            start_time = pd.to_datetime(time.time() - (last * interval_length * interval_dict[interval_unit]), unit='s')
+            start_time = pd.to_datetime(time.time() - (last * interval_length * interval_dict[interval_unit]), unit='s')
+
+
+        # build each pair's bars, in a pool of processes when there is more than one pair
+        # the pool is kept between calls, since starting the processes can take longer than the queries themselves
+        jobs = [(self.backend, db_path, crypto, interval, start_time, end_time) for crypto in pair]
+        if len(jobs) > 1 and workers != 1:
+            results = _ohlcv_pool(workers or os.cpu_count()).map(_ohlcv_worker, jobs)
+        else:
+            results = [_ohlcv_worker(job) for job in jobs]
+
+        # pairs with no trades in the period come back as 'None' and are left out
+        frames = {crypto: bars for crypto, bars in zip(pair, results) if bars is not None}
+        if not frames:
+            return None
+
+        # one outer join of every pair on the bar times, rather than merging the pairs in one at a time
+        ohlcv = pd.concat(frames, axis=1).sort_index()
+        ohlcv.index.name = 'date'
+
+        if include_last_period == True:
+            return ohlcv
+        else:
+            return ohlcv[:-1]
+
+    def _pair_ohlcv(self, db_path, crypto, interval, start_time, end_time):
+        # builds one pair's bars for .ohlcv_df(), returns 'None' if there are no trades since start_time
+        bars = None
+
+        # the Parquet dataset is read with the same time range, only opening the months in range
+        if self._parquet(db_path):
+            start = int(datetime.timestamp(pd.to_datetime(start_time, utc=True))) if start_time != None else 0
+            end = int(datetime.timestamp(pd.to_datetime(end_time, utc=True))) if end_time != None else None
+
+            last_trade_time = self._parquet_catalog(db_path).get(crypto, {}).get('last_timestamp') or _parquet_last_timestamp(db_path, crypto) or 0
+            if last_trade_time < start:
+                print(f'WARNING: {crypto} not included in dataframe since there have been no trades since {start_time}')
+                return None
+
+            # aggregated inside duckdb when it is installed, otherwise the ticks are read and resampled
+            bars = self._sql_ohlcv(db_path, crypto, interval, start_time, end_time)
+            if bars is None:
+                crypto = _read_parquet_trades(db_path, crypto, start if start_time != None else None, end)
+
+        else:
+            # intervals made of whole minutes are built from the 1 minute rollups (see .build_rollups()) instead of the ticks
+            bars = self._rollup_ohlcv(db_path, crypto, interval, start_time, end_time)
+
+            # everything else is aggregated inside sqlite
+            if bars is None:
+                bars = self._sql_ohlcv(db_path, crypto, interval, start_time, end_time)
 
+            if bars is None:
+                crypto = self._read_sqlite_ohlcv_trades(db_path, crypto, start_time, end_time)
+                if crypto is None:
+                    return None
 
-        # start a counter and loop through the different assets, creating a query to send to the db
-        count = 0
+        # format the ohlcv df
+        if bars is None:
+            crypto['date'] = pd.to_datetime(crypto.index, unit='s')
+            crypto = crypto[['date', 'price', 'volume']]
+            crypto = crypto.resample(interval, on='date').agg({'price': 'ohlc', 'volume':'sum', 'date':'count'})
+            crypto.columns = crypto.columns.droplevel()
+            crypto.rename(columns={'date':'trade_count'}, inplace=True)
+            bars = crypto
 
-        for crypto in pair:
-            break_loop = 0
-            count += 1
+        return bars
 
-            # create the connection to the sqlite db
-            conn = sqlite3.connect(db_path)
+    def iter_trades(self, db_path, pair=None, start_time=None, end_time=None, chunk_rows=100000, chunk_seconds=None, as_array=False, after=None):
+        # streams the trades in chunks instead of loading them all at once like .trades_df(), so any length of history fits in memory
+        '''
+        args:
+            - db_path = path to the sqlite database or Parquet dataset folder
+            * Optional: pair = pair in any naming format
+                - Default is set to 'None' which uses the asset provided in instantiation
+            * Optional: start_time = first time to include (anything pd.to_datetime understands)
+            * Optional: end_time = last time to include (anything pd.to_datetime understands)
+            * Optional: chunk_rows = number of trades in each chunk (a chunk runs a little long rather than split trades with the same timestamp)
+                - Default is set to 100000
+            * Optional: chunk_seconds = make every chunk a fixed window of time instead (i.e.- 3600 gives one chunk per utc hour that has trades)
+                - Default is set to 'None'
+            * Optional: as_array = yield numpy structured arrays (DB_TRADE_DTYPE) instead of dataframes
+                - Default is set to False which yields dataframes in the .trades_df() format
+            * Optional: after = resume after this cursor (the .cursor of an earlier iterator), overrides start_time
 
-            # make a placeholder "start" to reference later in the code
-            start = 0
+        returns:
+            - A KrakenTradeIterator of chunks, oldest first
+        '''
+        if pair == None:
+            pair = self.asset
+        pair = PublicKraken(pair).pair_matching()
+        table_name = str(PublicKraken(pair).get_pair_info()['altname'])
 
-            # create the query to send to sql
-            if start_time != None and end_time == None:
-                start = int(datetime.timestamp(pd.to_datetime(start_time, utc=True)))
-                query = f'SELECT * FROM "{str(crypto)}" WHERE timestamp >= {start}'
+        start = datetime.timestamp(pd.to_datetime(start_time, utc=True)) if start_time is not None else None
+        end = datetime.timestamp(pd.to_datetime(end_time, utc=True)) if end_time is not None else None
 
-            elif start_time == None and end_time != None:
-                end = int(datetime.timestamp(pd.to_datetime(end_time, utc=True)))
-                query = f'SELECT * FROM "{str(crypto)}" WHERE timestamp <= {end}'
+        return KrakenTradeIterator(db_path, table_name, parquet=self._parquet(db_path), start=start, end=end, after=after,
+                                   chunk_rows=chunk_rows, chunk_seconds=chunk_seconds, as_array=as_array)
 
-            elif start_time != None and end_time != None:
-                start = int(datetime.timestamp(pd.to_datetime(start_time, utc=True)))
-                end = int(datetime.timestamp(pd.to_datetime(end_time, utc=True)))
-                query = f'SELECT * FROM "{str(crypto)}" WHERE timestamp >= {start} AND timestamp <= {end}'
+    def build_tick_store(self, db_path, store_path, chunk_rows=1000000):
+        # copies the trades into a KrakenTickStore so research code can read them as zero-copy numpy arrays
+        # only the trades newer than what the store already holds are copied, so it can be run again after every .update_db()
+        '''
+        args:
+            - db_path = path to the sqlite database or Parquet dataset folder
+            - store_path = folder of the KrakenTickStore (created if it doesn't exist)
+            * Optional: chunk_rows = number of trades copied at a time
+                - Default is set to 1000000
 
-            else:
-                query = f'SELECT * FROM "{str(crypto)}"'
+        returns:
+            - The KrakenTickStore
+        '''
+        store = KrakenTickStore(store_path)
+        parquet = self._parquet(db_path)
 
-            # check to make sure that there was trade activity in the time period chosen for any particular crypto
-            # if not, it needs to be skipped as the resample will throw an error on a blank df
-            last_trade_time = datetime.timestamp(pd.to_datetime(KrakenData(crypto).trades_df(db_path=db_path,).iloc[-1].date, utc=True))
+        # the pairs from instantiation, otherwise every pair in the database
+        if self.asset != None:
+            tables = [str(PublicKraken(pair).get_pair_info()['altname']) for pair in PublicKraken(self.asset).pair_matching()]
+        elif parquet:
+            tables = sorted(folder.name.replace('pair=', '') for folder in Path(db_path).glob('pair=*'))
+        else:
+            conn = sqlite3.connect(db_path)
+            tables = [table for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'kraken_%'")]
+            conn.close()
 
-            if last_trade_time < start:
-                # if there is only one crypto being analyzed, then we must gracefully throw an error because the ohlcv won't be created
-                # if len(pair) <= 1:
-                #     raise Exception(f'{crypto} has no trade activity since {start_time} and therefore cannot create an OHLCV.  Please try a different asset or a different start time')
-                    
-                print(f'WARNING: {crypto} not included in dataframe since there have been no trades since {start_time}')
-                break_loop = 1
+        pbar = tqdm(tables)
+        for table_name in pbar:
+            pbar.set_description(f'Current Asset: {table_name}   Overall Progress: ')
+            last = store.last_timestamp(table_name)
+            # trades can share a timestamp (and .csv ones always share the second), so later trades at 'last' may not be in the store yet.
+            # Everything from 'last' on is read and only as many trades at 'last' as the store already holds are skipped
+            stored = len(store.read(table_name, last).timestamp) if last is not None else 0
+
+            if parquet:
+                # the Parquet reader already only opens the months from 'last' on
+                trades = _read_parquet_trades(db_path, table_name, last)
+                skip = _stored_at_start(trades.index.values, last, stored)
+                store.append(table_name, trades.index.values[skip:], trades['price'].values[skip:], trades['volume'].values[skip:])
                 continue
 
+            conn = sqlite3.connect(db_path)
             try:
-                crypto = pd.read_sql(query, conn, index_col='timestamp')
+                cursor = conn.execute(f'SELECT timestamp, price, volume FROM "{table_name}" WHERE timestamp >= ? ORDER BY timestamp, rowid', (-1 if last is None else last,))
+                while True:
+                    rows = cursor.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    rows = np.array(rows, dtype='f8')
+                    skip = _stored_at_start(rows[:, 0], last, stored)
+                    stored -= skip
+                    store.append(table_name, rows[skip:, 0], rows[skip:, 1], rows[skip:, 2])
+            finally:
                 conn.close()
 
-            except Exception as e:
-                conn.close()
-                raise e
+        return store
 
-            # format the ohlcv df
-            crypto['date'] = pd.to_datetime(crypto.index, unit='s')
-            crypto = crypto[['date', 'price', 'volume']]
-            crypto = crypto.resample(interval, on='date').agg({'price': 'ohlc', 'volume':'sum', 'date':'count'})
-            crypto.columns = crypto.columns.droplevel()
-            crypto.columns = pd.MultiIndex.from_product([[pair[count-1]], crypto.columns])
-            crypto.rename(columns={'date':'trade_count'}, inplace=True)
+    def build_rollups(self, db_path, chunk_rows=1000000):
+        # builds the 1 minute OHLCV rollups that .ohlcv_df() uses for any interval made of whole minutes
+        # once a pair has rollups, .update_db() and .live_ingest() keep them current as they write trades, so this only needs to be run once
+        # (.create_kraken_db() runs it for you)
+        '''
+        args:
+            - db_path = path to the sqlite database
+            * Optional: chunk_rows = number of trades read at a time
+                - Default is set to 1000000
 
-            if count == 1:
-                ohlcv = crypto
+        returns:
+            - A list of the tables that rollups were built for
+        '''
+        if self._parquet(db_path):
+            raise Exception({'input_error': 'Rollups are only kept in sqlite databases.  Parquet datasets build bars straight from the ticks.'})
+
+        conn = sqlite3.connect(db_path)
+
+        try:
+            self._create_catalog(conn)
+            if self.asset != None:
+                tables = [str(PublicKraken(pair).get_pair_info()['altname']) for pair in PublicKraken(self.asset).pair_matching()]
             else:
-                ohlcv = ohlcv.merge(crypto, on='date', how='outer').sort_index()
-        
-        if break_loop == 1:
-            None
-        elif include_last_period == True:
-            return ohlcv
+                tables = [table for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'kraken_%'")]
+                tables = [table for table in tables if 'timestamp' in [column[1] for column in conn.execute(f'PRAGMA table_info("{table}")')]]
+
+            pbar = tqdm(tables)
+            for table_name in pbar:
+                pbar.set_description(f'Current Asset: {table_name}   Overall Progress: ')
+                self._build_rollup(conn, table_name, chunk_rows)
+
+        finally:
+            conn.close()
+
+        return tables
+
+    def _build_rollup(self, conn, table_name, chunk_rows):
+        # rebuilds one pair's rollup from its ticks in a single transaction, then marks it as built so the writers keep it current
+        with conn:
+            self._create_rollup_table(conn)
+            conn.execute('DELETE FROM "kraken_ohlcv_1m" WHERE "pair" = ?', (table_name,))
+
+            cursor = conn.execute(f'SELECT timestamp, price, volume FROM "{table_name}" ORDER BY timestamp')
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                # a minute split across two chunks is merged by the upsert
+                self._update_rollup(conn, table_name, rows, force=True)
+
+            if self._catalog_entry(conn, table_name) is None:
+                self._rebuild_catalog(conn, table_name)
+            conn.execute('UPDATE "kraken_catalog" SET "rollup_built" = ? WHERE "pair" = ?', (time.time(), table_name))
+
+    def _create_rollup_table(self, conn):
+        # one row per pair per minute with trades.  first_time/last_time are the first and last trade in the minute, which is how
+        # a minute that is written in more than one batch still gets the right open and close
+        conn.execute('CREATE TABLE IF NOT EXISTS "kraken_ohlcv_1m" ("pair" TEXT, "time" INTEGER, "open" REAL, "high" REAL, "low" REAL, "close" REAL, '
+                     '"volume" REAL, "trade_count" INTEGER, "first_time" REAL, "last_time" REAL, PRIMARY KEY ("pair", "time")) WITHOUT ROWID')
+
+    def _minute_bars(self, timestamps, prices, volumes):
+        # one bar per minute that has trades, for trades in any order
+        order = np.argsort(np.asarray(timestamps, dtype='f8'), kind='stable')
+        timestamps = np.asarray(timestamps, dtype='f8')[order]
+        prices = np.asarray(prices, dtype='f8')[order]
+        volumes = np.asarray(volumes, dtype='f8')[order]
+
+        minutes = (timestamps // 60 * 60).astype('int64')
+        starts = np.flatnonzero(np.r_[True, minutes[1:] != minutes[:-1]])
+        ends = np.r_[starts[1:], len(timestamps)] - 1
+
+        return pd.DataFrame({
+            'time': minutes[starts],
+            'open': prices[starts],
+            'high': np.maximum.reduceat(prices, starts),
+            'low': np.minimum.reduceat(prices, starts),
+            'close': prices[ends],
+            'volume': np.add.reduceat(volumes, starts),
+            'trade_count': ends - starts + 1,
+            'first_time': timestamps[starts],
+            'last_time': timestamps[ends]})
+
+    def _update_rollup(self, conn, table_name, rows, force=False):
+        # rows = list of (timestamp, price, volume, ...) that were just written to table_name
+        # pairs that don't have rollups yet are skipped, a partial rollup would give .ohlcv_df() wrong bars
+        if not len(rows):
+            return
+        if not force:
+            entry = self._catalog_entry(conn, table_name)
+            if entry is None or entry['rollup_built'] is None:
+                return
+
+        rows = np.array([row[:3] for row in rows], dtype='f8')
+        bars = self._minute_bars(rows[:, 0], rows[:, 1], rows[:, 2])
+        columns = ['time', 'open', 'high', 'low', 'close', 'volume', 'trade_count', 'first_time', 'last_time']
+
+        conn.executemany(
+            'INSERT INTO "kraken_ohlcv_1m" ("pair", "time", "open", "high", "low", "close", "volume", "trade_count", "first_time", "last_time") '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT("pair", "time") DO UPDATE SET '
+            '"open" = CASE WHEN excluded."first_time" < "first_time" THEN excluded."open" ELSE "open" END, '
+            '"high" = MAX("high", excluded."high"), "low" = MIN("low", excluded."low"), '
+            '"close" = CASE WHEN excluded."last_time" >= "last_time" THEN excluded."close" ELSE "close" END, '
+            '"volume" = "volume" + excluded."volume", "trade_count" = "trade_count" + excluded."trade_count", '
+            '"first_time" = MIN("first_time", excluded."first_time"), "last_time" = MAX("last_time", excluded."last_time")',
+            zip([table_name] * len(bars), *(bars[column].tolist() for column in columns)))
+
+    def _rollup_ohlcv(self, db_path, crypto, interval, start_time, end_time):
+        # the rollup half of .ohlcv_df(), returns 'None' whenever the bars have to come from the ticks instead
+        try:
+            offset = pd.tseries.frequencies.to_offset(interval)
+        except ValueError:
+            return None
+        # fixed intervals have to be whole minutes, calendar intervals (days, weeks, months) always are
+        if isinstance(offset, pd.offsets.Tick) and offset.nanos % 60000000000 != 0:
+            return None
+
+        start = int(datetime.timestamp(pd.to_datetime(start_time, utc=True))) if start_time != None else None
+        end = int(datetime.timestamp(pd.to_datetime(end_time, utc=True))) if end_time != None else None
+
+        conn = sqlite3.connect(db_path)
+
+        try:
+            entry = self._catalog_entry(conn, crypto)
+            if entry is None or entry.get('rollup_built') is None:
+                return None
+            if start is not None and (entry['last_timestamp'] or 0) < start:
+                return None
+
+            # the minutes that are completely inside the range come from the rollup, the partial minutes at either end from the ticks
+            first_full = None if start is None else -(-start // 60) * 60
+            last_full = None if end is None else (end - 60) // 60 * 60
+            if first_full is not None and last_full is not None and first_full > last_full:
+                return None
+
+            conditions, params = ['"pair" = ?'], [crypto]
+            if first_full is not None:
+                conditions.append('"time" >= ?')
+                params.append(first_full)
+            if last_full is not None:
+                conditions.append('"time" <= ?')
+                params.append(last_full)
+            minutes = pd.read_sql(f'SELECT "time", "open", "high", "low", "close", "volume", "trade_count" FROM "kraken_ohlcv_1m" WHERE {" AND ".join(conditions)} ORDER BY "time"', conn, params=params)
+
+            edges = []
+            if start is not None and start != first_full:
+                edges.append(conn.execute(f'SELECT timestamp, price, volume FROM "{crypto}" WHERE timestamp >= ? AND timestamp < ?', (start, first_full)).fetchall())
+            if end is not None:
+                edges.append(conn.execute(f'SELECT timestamp, price, volume FROM "{crypto}" WHERE timestamp >= ? AND timestamp <= ?', (last_full + 60, end)).fetchall())
+
+        finally:
+            conn.close()
+
+        for rows in edges:
+            if rows:
+                rows = np.array(rows, dtype='f8')
+                minutes = pd.concat([minutes, self._minute_bars(rows[:, 0], rows[:, 1], rows[:, 2])[minutes.columns]], ignore_index=True)
+
+        if minutes.empty:
+            return None
+
+        return self._resample_bars(minutes, interval)
+
+    def _resample_bars(self, bars, interval):
+        # combines smaller bars (with a unix 'time' column) into 'interval' bars, on the same bins .resample() gives the ticks
+        bars = bars.sort_values('time')
+        bars.index = pd.to_datetime(bars.pop('time'), unit='s')
+        bars.index.name = 'date'
+
+        return bars.resample(interval).agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum', 'trade_count': 'sum'})
+
+    def _bucket_seconds(self, interval):
+        # the bucket size the database groups the trades by: the interval itself when it is a fixed length, otherwise whole days
+        # (i.e.- weeks and months) which .resample() then puts together on the calendar
+        try:
+            offset = pd.tseries.frequencies.to_offset(interval)
+        except ValueError:
+            return None
+
+        if isinstance(offset, pd.offsets.Tick):
+            return offset.nanos / 1000000000
+        if isinstance(offset, pd.offsets.Day):
+            return 86400 * offset.n
+        return 86400
+
+    def _sql_ohlcv(self, db_path, crypto, interval, start_time, end_time):
+        # aggregates the ticks into bars inside the database, so only the bars come back into python
+        # returns 'None' whenever the bars have to come from the ticks instead (i.e.- no trades in the range)
+        seconds = self._bucket_seconds(interval)
+        if seconds is None:
+            return None
+
+        start = int(datetime.timestamp(pd.to_datetime(start_time, utc=True))) if start_time != None else None
+        end = int(datetime.timestamp(pd.to_datetime(end_time, utc=True))) if end_time != None else None
+
+        if self._parquet(db_path):
+            if duckdb is None:
+                return None
+            bars = self._duckdb_bars(db_path, crypto, seconds, start, end)
         else:
-            return ohlcv[:-1]
+            bars = self._sqlite_bars(db_path, crypto, seconds, start, end)
+
+        if bars is None or bars.empty:
+            return None
+
+        return self._resample_bars(bars, interval)
+
+    def _sqlite_bars(self, db_path, crypto, seconds, start, end):
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('timestamp <= ?')
+            params.append(end)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+        conn = sqlite3.connect(db_path)
+
+        try:
+            # buckets start from midnight of the first trade's day, the same origin .resample() uses
+            first = conn.execute(f'SELECT MIN(timestamp) FROM "{crypto}" {where}', params).fetchone()[0]
+            if first is None:
+                return None
+            origin = first // 86400 * 86400
+
+            # one pass over the trades: open and close are the first and last price of each bucket (lowest rowid first for trades with the same
+            # timestamp, the order the ticks are read in) from window functions, so nothing is looked up per bucket and tables without the
+            # timestamp index (made by older versions, see .migrate_db()) don't need a scan per bucket
+            query = f'''
+                SELECT
+                    {origin} + bucket * {seconds} AS time,
+                    MIN(open) AS open, MAX(price) AS high, MIN(price) AS low, MIN(close) AS close,
+                    SUM(volume) AS volume, COUNT(*) AS trade_count
+                FROM (
+                    SELECT
+                        bucket, price, volume,
+                        FIRST_VALUE(price) OVER bucket_trades AS open,
+                        LAST_VALUE(price) OVER bucket_trades AS close
+                    FROM (
+                        SELECT rowid, timestamp, price, volume, CAST((timestamp - {origin}) / {seconds} AS INTEGER) AS bucket
+                        FROM "{crypto}" {where}
+                    )
+                    WINDOW bucket_trades AS (PARTITION BY bucket ORDER BY timestamp, rowid ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+                )
+                GROUP BY bucket
+                ORDER BY bucket'''
+            bars = pd.read_sql(query, conn, params=params)
+
+        finally:
+            conn.close()
+
+        return bars
+
+    def _duckdb_bars(self, root, crypto, seconds, start, end):
+        # the same aggregation run by duckdb straight over the Parquet files, only reading the months in range
+        # trades with the same timestamp are ordered by file and row, the order they were written in
+        files = str(Path(root) / f'pair={crypto}' / '*' / '*.parquet')
+        if not list(Path(root).glob(f'pair={crypto}/*/*.parquet')):
+            return None
+
+        conditions = []
+        if start is not None:
+            conditions.append(f"timestamp >= {start * 1000000000} AND month >= '{str(np.datetime64(start, 's').astype('datetime64[M]'))}'")
+        if end is not None:
+            conditions.append(f"timestamp <= {end * 1000000000} AND month <= '{str(np.datetime64(end, 's').astype('datetime64[M]'))}'")
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        source = f"read_parquet('{files}', hive_partitioning = true, hive_types = {{'month': VARCHAR}}, filename = true, file_row_number = true)"
+
+        conn = duckdb.connect()
+
+        try:
+            first = conn.execute(f'SELECT MIN(timestamp) FROM {source} {where}').fetchone()[0]
+            if first is None:
+                return None
+            origin = first // 86400000000000 * 86400000000000
+            bucket_ns = int(round(seconds * 1000000000))
+
+            bars = conn.execute(f'''
+                SELECT
+                    ({origin} + (timestamp - {origin}) // {bucket_ns} * {bucket_ns}) / 1e9 AS time,
+                    arg_min(price, (timestamp, filename, file_row_number)) AS open, MAX(price) AS high, MIN(price) AS low,
+                    arg_max(price, (timestamp, filename, file_row_number)) AS close,
+                    SUM(volume) AS volume, COUNT(*) AS trade_count
+                FROM {source} {where}
+                GROUP BY 1''').df()
+
+        finally:
+            conn.close()
+
+        return bars
+
+    def _read_sqlite_ohlcv_trades(self, db_path, crypto, start_time, end_time):
+        # the sqlite half of .ohlcv_df(), returns 'None' when the pair has no trades since start_time
+        # create the connection to the sqlite db
+        conn = sqlite3.connect(db_path)
+
+        # make a placeholder "start" to reference later in the code
+        start = 0
+
+        # create the query to send to sql
+        # every query is a range on the timestamp index, and only asks for the indexed columns so a covering index never reads the table
+        if start_time != None and end_time == None:
+            start = int(datetime.timestamp(pd.to_datetime(start_time, utc=True)))
+            query = f'SELECT timestamp, price, volume FROM "{str(crypto)}" WHERE timestamp >= {start} ORDER BY timestamp'
+
+        elif start_time == None and end_time != None:
+            end = int(datetime.timestamp(pd.to_datetime(end_time, utc=True)))
+            query = f'SELECT timestamp, price, volume FROM "{str(crypto)}" WHERE timestamp <= {end} ORDER BY timestamp'
+
+        elif start_time != None and end_time != None:
+            start = int(datetime.timestamp(pd.to_datetime(start_time, utc=True)))
+            end = int(datetime.timestamp(pd.to_datetime(end_time, utc=True)))
+            query = f'SELECT timestamp, price, volume FROM "{str(crypto)}" WHERE timestamp >= {start} AND timestamp <= {end} ORDER BY timestamp'
+
+        else:
+            query = f'SELECT timestamp, price, volume FROM "{str(crypto)}" ORDER BY timestamp'
+
+        # check to make sure that there was trade activity in the time period chosen for any particular crypto
+        # if not, it needs to be skipped as the resample will throw an error on a blank df
+        last_trade_time = self._last_timestamp(conn, crypto) or 0
+
+        if last_trade_time < start:
+            # if there is only one crypto being analyzed, then we must gracefully throw an error because the ohlcv won't be created
+            # if len(pair) <= 1:
+            #     raise Exception(f'{crypto} has no trade activity since {start_time} and therefore cannot create an OHLCV.  Please try a different asset or a different start time')
+                
+            print(f'WARNING: {crypto} not included in dataframe since there have been no trades since {start_time}')
+            conn.close()
+            return None
+
+        try:
+            crypto = pd.read_sql(query, conn, index_col='timestamp')
+            conn.close()
+
+        except Exception as e:
+            conn.close()
+            raise e
+
+        return crypto
 
     def trades_df(self, db_path, pair=None, start_time=None):
         # takes a crypto trading pair and returns an trades dataframe on a tick by tick basis
@@ -2486,18 +6187,24 @@ class KrakenData:
             pair = PublicKraken(pair).pair_matching()
             pair = PublicKraken(pair).get_pair_info()['altname']
 
-        # establish a sqlite3 connection to the database provided by db_path
-        conn = sqlite3.connect(db_path)
-
         if start_time is not None:
             start_time = int(datetime.timestamp(pd.to_datetime(start_time, utc=True)))
-            query = f'SELECT * FROM "{str(pair)}" WHERE timestamp >= {start_time}'
+
+        if self._parquet(db_path):
+            data = _read_parquet_trades(db_path, str(pair), start_time)
+
         else:
-            query = f'SELECT * FROM "{str(pair)}"'        
+            # establish a sqlite3 connection to the database provided by db_path
+            conn = sqlite3.connect(db_path)
+
+            if start_time is not None:
+                query = f'SELECT timestamp, price, volume FROM "{str(pair)}" WHERE timestamp >= {start_time} ORDER BY timestamp'
+            else:
+                query = f'SELECT timestamp, price, volume FROM "{str(pair)}" ORDER BY timestamp'        
 
-        data = pd.read_sql(query, conn, index_col='timestamp')
+            data = pd.read_sql(query, conn, index_col='timestamp')
 
-        conn.close()
+            conn.close()
 
         data['date'] = pd.to_datetime(data.index, unit='s')
 
@@ -2505,135 +6212,1008 @@ class KrakenData:
 
         return data
 
-    def update_db(self, db_path):
+    def volume_profile(self, db_path, duration, slices, start_time=None, lookback_days=30):
+        # builds the intraday volume profile used by KrakenExecution to size 'vwap' child orders
+        '''
+        args:
+            - db_path = path to the KrakenData sqlite database (or Parquet dataset)
+            - duration = number of seconds the schedule covers
+            - slices = number of slices to split the duration into
+            * Optional: start_time = unix timestamp the schedule starts at
+                - Default is set to 'None' which starts the schedule now
+            * Optional: lookback_days = number of days of trade history used to build the profile
+                - Default is set to 30
 
-        conn = sqlite3.connect(db_path)
+        returns:
+            - A list of weights (one per slice) that add up to 1.  If there is no trade history a flat (twap) profile is returned.
+        '''
+        if start_time is None:
+            start_time = time.time()
+
+        trades = self.trades_df(db_path, start_time=pd.to_datetime(start_time - (lookback_days * 86400), unit='s'))
+
+        if trades.empty:
+            return [1 / slices] * slices
+
+        # find which slice of the day every historical trade falls in, relative to the schedule's start time of day
+        step = duration / slices
+        time_of_day = (trades.index.values.astype('float') - start_time) % 86400
+        slice_number = (time_of_day // step).astype('int')
+
+        volume = trades['volume'].values.astype('float')
+        in_schedule = slice_number < slices
+        profile = pd.Series(volume[in_schedule]).groupby(slice_number[in_schedule]).sum().reindex(range(slices), fill_value=0)
+
+        if profile.sum() <= 0:
+            return [1 / slices] * slices
+
+        return list(profile / profile.sum())
+
+    def update_db(self, db_path, parquet_rows=500000, workers=4, batch_pages=50):
+        '''
+        Brings every trade table up to date from the REST 'Trades' endpoint.  The pairs are paged concurrently in three stages:
+        'workers' fetcher threads (sharing the public rate limiter), one parser thread that turns the pages into typed numpy arrays
+        and the calling thread, which is the only writer.
+
+        args:
+            - db_path = path to the sqlite database or Parquet dataset folder
+            * Optional: parquet_rows = number of trades buffered before they are written out as a Parquet file (Parquet only)
+                - Default is set to 500000
+            * Optional: workers = number of pairs fetched at the same time
+                - Default is set to 4
+            * Optional: batch_pages = maximum number of pages written in one transaction
+                - Default is set to 50
+
+        returns:
+            - A dictionary of {table_name: {'trades', 'requests', 'seconds', 'trades_per_second'}} for every pair that was updated
+        '''
+        if workers < 1:
+            raise Exception({'input_error': 'workers must be at least 1.'})
+
+        parquet = self._parquet(db_path)
+
+        if parquet:
+            conn = None
+            catalog = self._parquet_catalog(db_path)
+        else:
+            conn = sqlite3.connect(db_path)
+            self._create_catalog(conn)
         
         # pull in all the available pairs on Kraken (unless just one asset is provided in instantiation of KrakenData)
+        # one AssetPairs call gives the altname (table name) of every pair, rather than one call per pair
         if self.asset != None:
-            pair_list = PublicKraken(self.asset).pair_matching()
+            pair_info = self._pair_info(PublicKraken(self.asset).pair_matching())
         else:
-            pair_list = PublicKraken().get_asset_pairs()
-            for pair in  pair_list:
-                if '.d' in pair:
-                    pair_list.remove(pair)
+            pair_info = self._pair_info()
 
-        # we need to initiate a new call time.  this is to help track the number of Kraken API calls - for every three seconds after this, we add 1 more call to the call counter
-        call_time = time.time()
-
-        # loop through all the pairs and update the missing data from the sqlite database
-        pbar = tqdm(pair_list)
-        for pair in pbar:
+        # work out where each pair picks up from before any thread starts, so only this thread ever touches the database
+        pairs = queue.Queue()
+        for pair, info in pair_info.items():
+            if '.d' in pair:
+                continue
 
             # Find the table name to update, which is the pair's altname (if you used the .create_kraken_db() function above).
-            table_name = str(PublicKraken(pair).get_pair_info()['altname'])
-            
-            pbar.set_description(f'Current Asset: {table_name}   Overall Progress: ')
+            table_name = str(info['altname'])
+
+            # only the last timestamp is needed, which the catalog (or the timestamp index) answers without reading the table
+            if parquet:
+                entry = catalog.get(table_name)
+                # files written after the last checkpoint (i.e.- the run was killed before the catalog was saved) are fetched again
+                _discard_uncommitted_parquet(db_path, table_name, entry)
+                last_timestamp = entry['last_timestamp'] if entry is not None else _parquet_last_timestamp(db_path, table_name)
+            else:
+                try:
+                    last_timestamp = self._last_timestamp(conn, table_name)
+                except sqlite3.OperationalError:
+                    self._create_trade_table(conn, table_name)
+                    last_timestamp = None
+                self._upgrade_trade_table(conn, table_name)
+                conn.commit()
+
+                entry = self._catalog_entry(conn, table_name)
+
+            # last_time must be unix time with nanosecond resolution (default is second resolution)
+            # the REST 'last' cursor is checkpointed in the same transaction as the trades, so it picks up exactly where the previous run left off
+            resume = None
+            if entry is not None and entry['last_cursor'] is not None and last_timestamp is not None:
+                last_time = entry['last_cursor']
+            elif last_timestamp is not None:
+                # without a cursor (i.e.- tables from .create_kraken_db() or .live_ingest()), go back to the start of the second of the last trade,
+                # since last_timestamp * 1e9 is not exact.  The fetcher then drops the trades that are already stored, including the ones
+                # that share the last timestamp (counted here with one index lookup)
+                last_time = int(last_timestamp) * 1000000000
+                if parquet:
+                    resume = (last_timestamp, _parquet_count_at(db_path, table_name, last_timestamp))
+                else:
+                    resume = (last_timestamp, conn.execute(f'SELECT COUNT(*) FROM "{table_name}" WHERE "timestamp" = ?', (last_timestamp,)).fetchone()[0])
+            else:
+                # if the table is empty, then start from the very first trade
+                last_time = 0
 
-            # use a try/except to skip over the data that might not have any current data and create a new table if one doesn't exist yet
-            try:
-                df = self.trades_df(db_path, pair=pair)
+            pairs.put((pair, table_name, last_time, resume))
+
+        # the queues are bounded so the fetchers wait for the writer instead of holding the whole backlog in memory
+        pages = queue.Queue(maxsize=workers * 4)
+        parsed = queue.Queue(maxsize=workers * 4)
+        stop = threading.Event()
+        errors = []
+        pbar = tqdm(total=pairs.qsize(), desc='Overall Progress')
+
+        threads = [threading.Thread(target=self._fetch_trade_pages, args=(pairs, pages, stop, errors), daemon=True) for _ in range(workers)]
+        threads.append(threading.Thread(target=self._parse_trade_pages, args=(pages, parsed, workers, stop, errors), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        stats = {}
+        pending = {}
+        total = 0
+        start = time.time()
+
+        try:
+            finished = False
+            while not finished:
+                # wait for one page and then take whatever else is already parsed, so a busy writer commits bigger transactions
+                try:
+                    batch = [parsed.get(timeout=1)]
+                except queue.Empty:
+                    if errors:
+                        break
+                    continue
+                while len(batch) < batch_pages:
+                    try:
+                        batch.append(parsed.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if batch[-1] is None:
+                    batch.pop()
+                    finished = True
+
+                # send the new trades to the database, and keep the catalog current in the same transaction
+                if parquet:
+                    for table_name, rows, cursor, done, requests_made, seconds in batch:
+                        # trades are written to Parquet in big batches rather than one file per call
+                        buffered = pending.setdefault(table_name, [[], None])
+                        buffered[0].extend(rows)
+                        buffered[1] = cursor
+                        if len(buffered[0]) >= parquet_rows or done:
+                            self._write_parquet_batch(db_path, table_name, *pending.pop(table_name))
+                elif batch:
+                    with conn:
+                        for table_name, rows, cursor, done, requests_made, seconds in batch:
+                            added = self._write_trades(conn, table_name, rows)
+                            self._update_catalog(conn, table_name, added, cursor=cursor)
+                            self._update_rollup(conn, table_name, added)
+
+                # per pair throughput, reported as each pair is caught up
+                for table_name, rows, cursor, done, requests_made, seconds in batch:
+                    total += len(rows)
+                    stat = stats.setdefault(table_name, {'trades': 0, 'requests': 0, 'seconds': 0, 'trades_per_second': 0})
+                    stat['trades'] += len(rows)
+                    stat['requests'] = requests_made
+                    stat['seconds'] = seconds
+                    stat['trades_per_second'] = stat['trades'] / seconds if seconds > 0 else 0
+                    if done:
+                        pbar.update(1)
+                        tqdm.write(f"{table_name}: {stat['trades']} trades in {stat['requests']} calls ({stat['trades_per_second']:.0f} trades/sec)")
+
+                elapsed = time.time() - start
+                pbar.set_postfix_str(f'{total} trades ({total / elapsed if elapsed > 0 else 0:.0f} trades/sec)')
+
+        finally:
+            stop.set()
+            pbar.close()
+            # flush the Parquet trades of pairs that were still being fetched, along with the cursor of their last page
+            for table_name, (rows, cursor) in pending.items():
+                self._write_parquet_batch(db_path, table_name, rows, cursor)
+            if conn is not None:
+                conn.close()
+
+        if errors:
+            raise errors[0]
+
+        return stats
 
-                # last_time must be unix time with nanosecond resolution (default is second resolution)
+    def _fetch_trade_pages(self, pairs, pages, stop, errors):
+        # fetcher stage of .update_db(): takes pairs off the 'pairs' queue and pages through their trades, one pair at a time
+        # every fetcher shares public_rate_limiter, so adding fetchers only hides the latency of each call and never raises the call rate
+        # one keep-alive connection per thread instead of a new TLS handshake for every page
+        session = requests.Session()
+
+        try:
+            while not stop.is_set():
                 try:
-                    # if the table is empty, there will be an error with calculating last_time below
-                    last_time  = int(df.iloc[-1].name * 1000000000)
-                    time_init = int(df.iloc[-1].name)
-                except:
-                    # if the table is empty, then just set last_time to 0 and time_init to the earliest time for that asset
-                    last_time = 0
-                    time_init = PublicKraken(pair).get_ohlc_dataframe('D', since=0).index[0]
-
-
-            except:
-                df = pd.DataFrame(columns=['timestamp', 'price', 'volume'])
-                df.set_index('timestamp', inplace=True)
-                table_create = f'CREATE TABLE "{table_name}" ("timestamp" INTEGER,"price" REAL,"volume" REAL)'
-                cur = conn.cursor()
-                cur.execute(table_create)
-                time_init = PublicKraken(pair).get_ohlc_dataframe('D', since=0).index[0]
-                last_time = 0
-                df_length = 'new'
-                
+                    pair, table_name, last_time, resume = pairs.get_nowait()
+                except queue.Empty:
+                    break
+
+                requests_made = 0
+                start = time.time()
+
+                # since we only get back the last 1000 trades, if the page has fewer than 1000 then the pair is up to date
+                done = False
+                while not done and not stop.is_set():
+                    page = self._get_trades_page(session, pair, last_time, stop)
+                    if page is None:
+                        break
+                    trades, last_time, calls = page
+                    requests_made += calls
+                    done = len(trades) < 1000
+
+                    # resuming from a timestamp: skip the trades that are already stored until the first newer one shows up
+                    if resume is not None:
+                        trades, resume = _skip_stored_trades(trades, *resume)
+                    _put_until_stopped(pages, (table_name, trades, last_time, done, requests_made, time.time() - start), stop)
+
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+        finally:
+            session.close()
+            # one None per fetcher tells the parser that this fetcher is finished
+            _put_until_stopped(pages, None, stop)
+
+    def _get_trades_page(self, session, pair, since, stop=None):
+        # one page (up to 1000 trades) of the REST 'Trades' endpoint, retried until it comes back or 'stop' is set
+        # returns (trades, last cursor, number of calls made), or 'None' if it was stopped
+        url = 'https://api.kraken.com/0/public/Trades'
+        calls = 0
 
-            # for Public Kraken API calls, you get a maximum of 15 calls (which is increased by 1 every 3 seconds until 15 is refilled again)
-            max_calls = 15
-            call_add_rate = 3 # 3 = 1 call every 3 seconds
-            
-            # since we already called the API twice in the message call, we need to start our counter at 13 (plus this builds in a little leeway to guarantee we don't break the rules)
-            call_count = max_calls - 2
+        while stop is None or not stop.is_set():
+            public_rate_limiter.acquire()
+            try:
+                message = session.get(url, params=PublicKraken().make_api_data(pair=pair, since=since), timeout=30).json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print('Connection Issue:', e)
+                continue
+            calls += 1
+
+            if not message['error']:
+                trades = [trades for key, trades in message['result'].items() if key != 'last'][0]
+                return trades, int(message['result']['last']), calls
+            elif message['error'] == ['EService:Unavailable'] or message['error'] == ['EService:Busy'] or message['error'] == ['EGeneral:Internal error']:
+                print("Server connection issue...retrying...")
+                PublicKraken().guarantee_cancel()
+            else:
+                raise Exception({'kraken_error': f'Error Message: {message["error"]}'})
+
+        return None
+
+    def _trade_rows(self, trades):
+        # REST trades ([price, volume, time, side, ordertype, misc, trade_id]) to (timestamp, price, volume, side, ordertype, trade_id) rows
+        # they have the same leading fields as the websocket ones, so trades_to_array() does the parsing
+        array = trades_to_array(trades)
+        trade_ids = np.array([trade[6] for trade in trades], dtype='i8')
+        return list(zip(array['time'].tolist(), array['price'].tolist(), array['volume'].tolist(),
+                        array['side'].tolist(), array['ordertype'].tolist(), trade_ids.tolist()))
+
+    def _parse_trade_pages(self, pages, parsed, workers, stop, errors):
+        # parser stage of .update_db(): turns the raw pages into (timestamp, price, volume, side, ordertype, trade_id) rows
+        finished = 0
+        try:
+            while finished < workers and not stop.is_set():
+                try:
+                    page = pages.get(timeout=1)
+                except queue.Empty:
+                    continue
 
-            # since we only get back the last 1000 trades, if the length of the df is less than 1000 then we are up to date and we must track this length for the upcoming 'while' loop
-            df_length = len(df)
+                if page is None:
+                    finished += 1
+                    continue
 
-            while df_length >= 1000 or df_length == 'new':
-                # first check to see if more than 3 seconds have passed and add time back to 'call_count' if so, otherwise subtract one from the 'call_count'
-                if (time.time() - call_add_rate) > call_time:
-                    call_time = time.time()
-                    call_count += 1
-                else:
-                    call_count -= 1
-
-                # if the 'call_count' is greater than 0, then make the call, otherwise wait enough time for the call count to reload
-                if call_count > 0:
-                    # subscribe to the 'Trades' endpoint and make a new dataframe
-                    url = 'https://api.kraken.com/0/public/Trades'
-                    data = PublicKraken().make_api_data(pair=pair, since=last_time)
-                    message = requests.post(url, data).json()
-                    call_count -= 1 # reduce the call counter after making the request
-                    try:
-                        message
-                    except TimeoutError as t:
-                        print('Connection Issue:', t)
-                        continue
+                table_name, trades, cursor, done, requests_made, seconds = page
+                _put_until_stopped(parsed, (table_name, self._trade_rows(trades), cursor, done, requests_made, seconds), stop)
 
-                    if not message['error']:
-                        df2 = pd.DataFrame(message['result'][pair], columns=['price', 'volume', 'timestamp', 'buy/sell', 'ordertype', 'misc', 'trade_id'])
-                        df2.set_index('timestamp', inplace=True)
-                        df2 = df2[['price', 'volume']]
-                    elif message['error'] == ['EService:Unavailable'] or message['error'] == ['EService:Busy'] or message['error'] == ['EGeneral:Internal error']:
-                        print("Server connection issue...retrying...")
-                        PublicKraken().guarantee_cancel()
-                    else:
-                        raise Exception({'kraken_error': f'Error Message: {message["error"]}'})
-                    
-                    # send the new dataframe to the sqlite3 database
-                    df2.to_sql(table_name, conn, if_exists='append')   
+        except Exception as e:
+            errors.append(e)
+            stop.set()
 
-                    # update df_length to see if it is time to exit the loop
-                    df_length = len(df2)
+        finally:
+            # tells the writer that every page has been parsed
+            _put_until_stopped(parsed, None, stop)
 
-                    # set the last_time parameters for tracking purposes
-                    last_time = int(message['result']['last'])
-                    last_date = pd.to_datetime((last_time / 1000000000), unit='s')
-                
-                # else, wait until the 'call_count' resets
+    def find_gaps(self, db_path, pair=None, factor=20, window=1000, min_gap=60, chunk_rows=1000000):
+        # looks for the holes and overlaps that .repair_gaps() fixes, i.e.- at the boundary between the .csv files from .create_kraken_db()
+        # and the REST trades from .update_db(), or left behind by a run that crashed
+        '''
+        args:
+            - db_path = path to the sqlite database
+            * Optional: pair = pair in any naming format
+                - Default is set to 'None' which uses the asset provided in instantiation, or every pair in the database if there isn't one
+            * Optional: factor = trades without a trade_id count as a gap when they are more than 'factor' times further apart than the average
+                                 spacing of the 'window' trades before them
+                - Default is set to 20
+            * Optional: window = number of trades the average spacing is taken over
+                - Default is set to 1000
+            * Optional: min_gap = shortest spacing (in seconds) between trades without a trade_id that can be a gap
+                - Default is set to 60
+            * Optional: chunk_rows = number of trades read at a time when checking the spacing
+                - Default is set to 1000000
+
+        returns:
+            - A dataframe with one row per problem, with the columns:
+                - pair = table name
+                - kind = 'trade_id' (trade_ids are missing), 'spacing' (unusually long time without trades) or 'overlap' (seconds stored both
+                         as .csv rows and as REST trades, so they are counted twice)
+                - start/end = unix timestamps of the trades on either side of the gap, or the first and last second of the overlap
+                - trades = number of missing trade_ids for 'trade_id', number of duplicated .csv rows for 'overlap' and NaN for 'spacing'
+        '''
+        if self._parquet(db_path):
+            raise Exception({'input_error': 'find_gaps() is only for sqlite databases.'})
+
+        conn = sqlite3.connect(db_path)
+
+        try:
+            if pair is not None or self.asset is not None:
+                tables = [str(PublicKraken(pair if pair is not None else self.asset).get_pair_info()['altname'])]
+            else:
+                tables = [table for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'kraken_%'")]
+
+            gaps = []
+            pbar = tqdm(tables)
+            for table_name in pbar:
+                pbar.set_description(f'Current Asset: {table_name}   Overall Progress: ')
+
+                columns = [column[1] for column in conn.execute(f'PRAGMA table_info("{table_name}")')]
+                if 'timestamp' not in columns:
+                    continue
+
+                # Kraken numbers each pair's trades one after the other, so where there are trade_ids a hole is exact
+                # the trades before the first trade_id and after the last one (.csv and websocket rows) can only be judged by their spacing
+                if 'trade_id' in columns:
+                    first = conn.execute(f'SELECT "timestamp" FROM "{table_name}" WHERE "trade_id" IS NOT NULL ORDER BY "trade_id" LIMIT 1').fetchone()
+                    last = conn.execute(f'SELECT "timestamp" FROM "{table_name}" WHERE "trade_id" IS NOT NULL ORDER BY "trade_id" DESC LIMIT 1').fetchone()
                 else:
-                    # reset call count (set to 14 just build in some safety that you don't accidentally get to 15)
-                    call_count = max_calls - 1
-                    # wait for the appropriate time for the Kraken counter to reset
-                    time.sleep(max_calls * call_add_rate)
-
-                # update the asset progress tracker based on the amount of time from the last data point to now.
-                if df_length < 1000:
-                    asset_progress = 1
+                    first = last = None
+
+                if first is None:
+                    spans = [(None, None)]
                 else:
-                    time_now = int(time.time())
-                    init_time_diff = time_now - time_init
-                    current_time_diff = time_now - int((last_time / 1000000000))
-                    asset_progress = 1 - (current_time_diff / init_time_diff)
-                
-                # print of progress tracking  
-                barLength = 30
-                status = ""
-                if asset_progress >= 1:
-                    asset_progress == 1, status == 'Done...', "\r\n"
-                block = int(round(barLength * asset_progress))
-                text = "\r{} [{}] {:.0f}% {} {}".format(f'{table_name} Progress: ', "#" * block + "-" * (barLength - block), round(asset_progress * 100, 0), status, format(last_date, '%Y-%m-%d'))        
-                sys.stdout.write(text)
+                    spans = [(None, first[0]), (last[0], None)]
+                    gaps += [(table_name, 'trade_id', start, end, missing) for start, end, missing in self._trade_id_gaps(conn, table_name)]
+                    gaps += [(table_name, 'overlap', start, end, rows) for start, end, rows in self._overlaps(conn, table_name, first[0])]
+
+                for start, end in spans:
+                    gaps += [(table_name, 'spacing', gap_start, gap_end, np.nan)
+                             for gap_start, gap_end in self._spacing_gaps(db_path, table_name, start, end, factor, window, min_gap, chunk_rows)]
+
+        finally:
+            conn.close()
+
+        return pd.DataFrame(gaps, columns=['pair', 'kind', 'start', 'end', 'trades']).sort_values(['pair', 'start'], ignore_index=True)
+
+    def _trade_id_gaps(self, conn, table_name):
+        # (start, end, missing) for every jump in the trade_ids, read in trade_id order straight off the trade_id key
+        jumps = conn.execute(
+            'SELECT "previous_time", "timestamp", "trade_id" - "previous_id" - 1 FROM ('
+            'SELECT "trade_id", "timestamp", LAG("trade_id") OVER (ORDER BY "trade_id") AS "previous_id", LAG("timestamp") OVER (ORDER BY "trade_id") AS "previous_time" '
+            f'FROM "{table_name}" WHERE "trade_id" IS NOT NULL) WHERE "trade_id" - "previous_id" > 1').fetchall()
+
+        # trades stored without a trade_id (.csv and websocket rows) fill in some or all of a jump
+        gaps = []
+        for start, end, missing in jumps:
+            missing -= conn.execute(f'SELECT COUNT(*) FROM "{table_name}" WHERE "timestamp" BETWEEN ? AND ? AND "trade_id" IS NULL', (math.floor(start), end)).fetchone()[0]
+            if missing > 0:
+                gaps.append((start, end, missing))
+        return gaps
+
+    def _overlaps(self, conn, table_name, first_id_time):
+        # .csv rows (no side, timestamps cut to the second) in the same seconds as REST trades, which are the same trades stored twice
+        # consecutive seconds are merged into one (start, end, rows) window
+        seconds = conn.execute(
+            f'SELECT CAST("timestamp" AS INTEGER) AS "second", COUNT(*) FROM "{table_name}" AS "csv" WHERE "timestamp" >= ? AND "side" IS NULL '
+            f'AND EXISTS (SELECT 1 FROM "{table_name}" WHERE "timestamp" >= CAST("csv"."timestamp" AS INTEGER) AND "timestamp" < CAST("csv"."timestamp" AS INTEGER) + 1 '
+            'AND "trade_id" IS NOT NULL) GROUP BY "second" ORDER BY "second"', (int(first_id_time),)).fetchall()
+
+        windows = []
+        for second, rows in seconds:
+            if windows and second <= windows[-1][1] + 1:
+                windows[-1] = (windows[-1][0], second, windows[-1][2] + rows)
+            else:
+                windows.append((second, second, rows))
+        return windows
+
+    def _spacing_gaps(self, db_path, table_name, start, end, factor, window, min_gap, chunk_rows):
+        # (start, end) of every spacing between trades that is at least min_gap seconds and more than 'factor' times the average of the
+        # 'window' spacings before it.  The trades are streamed, carrying the last 'window' spacings over from one chunk to the next
+        gaps = []
+        history = np.empty(0)
+        previous = None
+
+        for chunk in KrakenTradeIterator(db_path, table_name, start=start, end=end, chunk_rows=chunk_rows, as_array=True):
+            timestamps = chunk['timestamp'] if previous is None else np.r_[previous, chunk['timestamp']]
+            spacing = np.diff(timestamps)
+            previous = timestamps[-1]
+            if not len(spacing):
+                continue
+
+            carried = len(history)
+            history = np.r_[history, spacing]
+            sums = np.r_[0, np.cumsum(history)]
+            positions = np.arange(carried, len(history))
+            counts = positions - np.maximum(positions - window, 0)
+            # the first trade has nothing to compare to
+            average = np.divide(sums[positions] - sums[positions - counts], counts, out=np.full(len(positions), np.inf), where=counts > 0)
+
+            for i in np.flatnonzero((spacing >= min_gap) & (spacing > factor * average)):
+                gaps.append((float(timestamps[i]), float(timestamps[i + 1])))
+
+            history = history[-window:]
+
+        return gaps
+
+    def repair_gaps(self, db_path, gaps=None, pair=None):
+        # refetches only the windows that .find_gaps() found from the REST 'Trades' endpoint (with the shared public rate limiter), which takes
+        # a call or two per gap instead of a full .update_db() from scratch
+        '''
+        args:
+            - db_path = path to the sqlite database
+            * Optional: gaps = dataframe from .find_gaps() (i.e.- with the gaps that are expected, like exchange outages, filtered out)
+                - Default is set to 'None' which runs .find_gaps() with its default settings
+            * Optional: pair = pair in any naming format, passed on to .find_gaps() when gaps is 'None'
+                - Default is set to 'None'
+
+        returns:
+            - The gaps dataframe with the columns 'added' (trades fetched into the window), 'removed' (duplicated .csv rows deleted),
+              'unmatched' (.csv rows in an overlap that no fetched trade accounts for, which are left in place) and 'calls' (REST calls it took)
+        '''
+        if self._parquet(db_path):
+            raise Exception({'input_error': 'repair_gaps() is only for sqlite databases.'})
+
+        if gaps is None:
+            gaps = self.find_gaps(db_path, pair)
+        gaps = gaps.copy()
+        gaps['added'] = 0
+        gaps['removed'] = 0
+        gaps['unmatched'] = 0
+        gaps['calls'] = 0
+        if gaps.empty:
+            return gaps
+
+        # the REST name of each table, from one AssetPairs call
+        rest_pairs = {str(info['altname']): rest_pair for rest_pair, info in self._pair_info().items()}
+
+        conn = sqlite3.connect(db_path)
+        session = requests.Session()
+
+        try:
+            pbar = tqdm(gaps.index)
+            for i in pbar:
+                table_name, kind, start, end = gaps.loc[i, ['pair', 'kind', 'start', 'end']]
+                pbar.set_description(f'Current Asset: {table_name}   Overall Progress: ')
+
+                # whole seconds, since .csv rows only have the second.  The trades that are already stored (including the ones on either
+                # side of the gap and the .csv copies of the overlapping seconds) are matched up by ._write_trades() rather than added again
+                low, high = int(start), int(end) + 1
+
+                # page from the start of the window until a trade at or after its end shows up
+                trades = []
+                since = int(start) * 1000000000
+                while True:
+                    page, last, calls = self._get_trades_page(session, rest_pairs[table_name], since)
+                    gaps.loc[i, 'calls'] += calls
+                    trades += [trade for trade in page if low <= float(trade[2]) < high]
+                    if len(page) < 1000 or float(page[-1][2]) >= high or last <= since:
+                        break
+                    since = last
+
+                rows = self._trade_rows(trades)
+                with conn:
+                    # the .csv rows of the overlap before the fetched trades claim any of them
+                    csv_rows = set()
+                    if kind == 'overlap':
+                        csv_rows = {rowid for (rowid,) in conn.execute(f'SELECT rowid FROM "{table_name}" WHERE "timestamp" >= ? AND "timestamp" < ? AND "side" IS NULL', (low, high))}
+
+                    added = self._write_trades(conn, table_name, rows)
+                    self._update_catalog(conn, table_name, added)
+                    self._update_rollup(conn, table_name, added)
+
+                    removed, unmatched = 0, 0
+                    if kind == 'overlap':
+                        duplicates, unmatched = self._csv_duplicates(conn, table_name, low, high, rows, csv_rows)
+                        if duplicates:
+                            conn.executemany(f'DELETE FROM "{table_name}" WHERE rowid = ?', [(rowid,) for rowid in duplicates])
+                            removed = len(duplicates)
+                            conn.execute('UPDATE "kraken_catalog" SET "row_count" = "row_count" - ?, "updated" = ? WHERE "pair" = ?', (removed, time.time(), table_name))
+                            self._rebuild_rollup_minutes(conn, table_name, low, high)
+
+                gaps.loc[i, 'added'] = len(added)
+                gaps.loc[i, 'removed'] = removed
+                gaps.loc[i, 'unmatched'] = unmatched
+                if unmatched:
+                    print(f'WARNING: {unmatched} .csv rows of {table_name} between {low} and {high} did not match a fetched trade and were kept')
+
+        finally:
+            session.close()
+            conn.close()
+
+        return gaps
+
+    def _csv_duplicates(self, conn, table_name, low, high, rows, csv_rows):
+        # the .csv rows of an overlap that are positively copies of a fetched trade stored under its own row, as (rowids, unmatched count)
+        # rows = the fetched (timestamp, price, volume, side, ordertype, trade_id) rows, csv_rows = rowids of the .csv rows before they were written
+        # a fetched trade that claimed one of the .csv rows already has its copy, so it can't account for another one.  Prices and volumes
+        # only have to be close, since the .csv export and the REST API can round them differently
+        claimed_ids = {trade_id for rowid, trade_id in conn.execute(
+            f'SELECT rowid, "trade_id" FROM "{table_name}" WHERE "timestamp" >= ? AND "timestamp" < ? AND "side" IS NOT NULL', (low, high)) if rowid in csv_rows}
+
+        available = {}
+        for timestamp, price, volume, side, ordertype, trade_id in rows:
+            if trade_id not in claimed_ids:
+                available.setdefault(math.floor(timestamp), []).append((price, volume))
+
+        duplicates, unmatched = [], 0
+        for rowid, timestamp, price, volume in conn.execute(
+                f'SELECT rowid, "timestamp", "price", "volume" FROM "{table_name}" WHERE "timestamp" >= ? AND "timestamp" < ? AND "side" IS NULL ORDER BY "timestamp", rowid', (low, high)):
+            candidates = available.get(math.floor(timestamp), [])
+            for j, (trade_price, trade_volume) in enumerate(candidates):
+                if math.isclose(price, trade_price, rel_tol=1e-8) and math.isclose(volume, trade_volume, rel_tol=1e-8):
+                    duplicates.append(rowid)
+                    candidates.pop(j)
+                    break
+            else:
+                unmatched += 1
+
+        return duplicates, unmatched
+
+    def _rebuild_rollup_minutes(self, conn, table_name, start, end):
+        # recomputes the 1 minute rollup bars between start and end from the ticks, after trades were deleted (only if the pair has rollups)
+        entry = self._catalog_entry(conn, table_name)
+        if entry is None or entry['rollup_built'] is None:
+            return
+
+        first, last = int(start // 60 * 60), int(-(-end // 60) * 60)
+        conn.execute('DELETE FROM "kraken_ohlcv_1m" WHERE "pair" = ? AND "time" >= ? AND "time" < ?', (table_name, first, last))
+        rows = conn.execute(f'SELECT "timestamp", "price", "volume" FROM "{table_name}" WHERE "timestamp" >= ? AND "timestamp" < ?', (first, last)).fetchall()
+        self._update_rollup(conn, table_name, rows, force=True)
+
+    def live_ingest(self, db_path, batch_seconds=1, backfill=True, run_for=None):
+        # keeps the sqlite database current from the websocket 'trade' channel instead of paging the REST API
+        # it is recommended to run KrakenData().update_db() first so the tables are caught up before the live feed takes over
+        '''
+        args:
+            - db_path = path to the sqlite database (the same one made by .create_kraken_db() and .update_db())
+            * Optional: batch_seconds = how often the buffered trades are written to the database, in one transaction
+                - Default is set to 1
+            * Optional: backfill = use the REST 'Trades' endpoint to fill the trades missed while the websocket was reconnecting
+                - Default is set to True
+            * Optional: run_for = number of seconds to run for
+                - Default is set to 'None' which runs until interrupted (Ctrl+C)
+
+        returns:
+            - The total number of trades written
+        '''
+        if self._parquet(db_path):
+            raise Exception({'input_error': 'live_ingest() writes one small batch every second, which only suits the sqlite backend.  Use .update_db() for Parquet datasets.'})
+
+        # pull in all the available pairs on Kraken (unless assets are provided in instantiation of KrakenData)
+        if self.asset != None:
+            pair_info = self._pair_info(PublicKraken(self.asset).pair_matching())
+        else:
+            pair_info = self._pair_info()
+
+        # the websocket names the pairs by wsname, while the tables are named by altname
+        tables = {}
+        for pair, info in pair_info.items():
+            if '.d' in pair or 'wsname' not in info:
+                continue
+            tables[info['wsname']] = str(info['altname'])
+
+        conn = sqlite3.connect(db_path)
+        # WAL lets other connections (i.e.- .ohlcv_df()) read the database while trades are being written
+        conn.execute('PRAGMA journal_mode=WAL')
+        self._create_catalog(conn)
+        for table_name in tables.values():
+            self._create_trade_table(conn, table_name)
+            self._upgrade_trade_table(conn, table_name)
+        conn.commit()
+
+        # the websocket thread only appends to this buffer, all of the database work happens in this thread
+        pending = []
+        pending_lock = threading.Lock()
+        last_trade = [None]
+
+        def buffer_trades(channel_name, wsname, data):
+            # the websocket trades have no trade_id
+            rows = [(float(trade[2]), float(trade[0]), float(trade[1]), 1 if trade[3] == 'b' else -1, 0 if trade[4] == 'm' else 1, None) for trade in data]
+            with pending_lock:
+                pending.append((tables[wsname], rows))
+            last_trade[0] = rows[-1][0]
+
+        ws = KrakenWS(backfill=backfill)
+        ws.subscribe('trade', list(tables), handler=buffer_trades)
+        ws.start()
+
+        written = 0
+        start = time.time()
+        try:
+            while run_for is None or time.time() - start < run_for:
+                time.sleep(batch_seconds)
+
+                with pending_lock:
+                    batch = pending[:]
+                    pending.clear()
+
+                written += self._write_batch(conn, batch)
+
+                # print of progress tracking
+                lag = time.time() - last_trade[0] if last_trade[0] is not None else 0
+                sys.stdout.write(f'\rLive Ingest: {written} trades written, last trade {lag:.1f} seconds ago, {ws.reconnects} reconnects')
                 sys.stdout.flush()
 
-        conn.close()
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            ws.stop()
+            # write whatever came in before the connection was closed
+            written += self._write_batch(conn, pending)
+            conn.close()
+
+        return written
+
+    def _write_parquet_batch(self, root, table_name, rows, cursor):
+        # rows = list of (timestamp, price, volume, side, ordertype, trade_id), written as one file per month and then recorded in the catalog with the cursor
+        # trade_ids that are already in the dataset (or earlier in rows) are dropped, so a page can be written more than once
+        if rows:
+            stored = _parquet_trade_ids(root, table_name, min(row[0] for row in rows), max(row[0] for row in rows))
+            unique = []
+            for row in rows:
+                if row[5] is None or row[5] not in stored:
+                    unique.append(row)
+                    if row[5] is not None:
+                        stored.add(row[5])
+            rows = unique
+
+        if rows:
+            timestamps, prices, volumes, sides, ordertypes, trade_ids = zip(*rows)
+            files = _write_parquet_trades(root, table_name, timestamps, prices, volumes, sides, ordertypes, trade_ids)
+        else:
+            timestamps, files = [], []
+        self._update_parquet_catalog(root, table_name, timestamps, cursor, files)
+
+    def _pair_info(self, pairs=None):
+        # one AssetPairs call for every pair, rather than one (or two) per pair
+        url = 'https://api.kraken.com/0/public/AssetPairs'
+        params = {'pair': ','.join(pairs)} if pairs else {}
+
+        public_rate_limiter.acquire()
+        message = requests.get(url, params).json()
+
+        if not message['error']:
+            return message['result']
+        else:
+            raise Exception({'kraken_error': f'Error Message: {message["error"]}'})
+
+    def _create_trade_table(self, conn, table_name, index=True, covering=False):
+        # side is 1 for buys and -1 for sells and ordertype is 0 for market and 1 for limit orders (the same as TRADE_DTYPE), so both
+        # are stored in a single byte.  The .csv files from Kraken have neither, nor a trade_id, so those rows leave them NULL
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" ("timestamp" INTEGER,"price" REAL,"volume" REAL,"side" INTEGER,"ordertype" INTEGER,"trade_id" INTEGER)')
+        if index:
+            self._create_trade_index(conn, table_name, covering)
+
+    def _upgrade_trade_table(self, conn, table_name):
+        # adds the side/ordertype/trade_id columns (and the trade_id key) to tables made by older versions
+        columns = [column[1] for column in conn.execute(f'PRAGMA table_info("{table_name}")')]
+        for column in ('side', 'ordertype', 'trade_id'):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{column}" INTEGER')
+        self._create_trade_key(conn, table_name)
+
+    def _create_trade_key(self, conn, table_name):
+        # a trade_id is only ever stored once, which makes writing the same REST page twice harmless
+        # (tables made by older versions get the column from ._upgrade_trade_table() first, otherwise "trade_id" would be read as a string)
+        if 'trade_id' not in [column[1] for column in conn.execute(f'PRAGMA table_info("{table_name}")')]:
+            return
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "ux_{table_name}_trade_id" ON "{table_name}" ("trade_id") WHERE "trade_id" IS NOT NULL')
+
+    def _create_trade_index(self, conn, table_name, covering=False):
+        # every query on the trade tables is a timestamp range, so they all need this index
+        # the plain index has the same name pandas .to_sql() gives it, so databases made by older versions already have it
+        if covering:
+            # the covering index holds the price and volume too, so range queries never touch the table (at the cost of storing the trades twice)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{table_name}_timestamp_price_volume" ON "{table_name}" ("timestamp", "price", "volume")')
+            conn.execute(f'DROP INDEX IF EXISTS "ix_{table_name}_timestamp"')
+        else:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{table_name}_timestamp" ON "{table_name}" ("timestamp")')
+        self._create_trade_key(conn, table_name)
+
+    def _last_timestamp(self, conn, table_name):
+        # read it from the catalog, falling back to MAX() (a single index lookup) for tables the catalog doesn't know about
+        entry = self._catalog_entry(conn, table_name)
+        if entry is not None and entry['last_timestamp'] is not None:
+            return entry['last_timestamp']
+        return conn.execute(f'SELECT MAX("timestamp") FROM "{table_name}"').fetchone()[0]
+
+    def _insert_trades(self, conn, table_name, rows):
+        # rows = list of (timestamp, price, volume), appended as they are (only for filling new tables, i.e.- .create_kraken_db())
+        conn.executemany(f'INSERT INTO "{table_name}" ("timestamp", "price", "volume") VALUES (?, ?, ?)', rows)
+
+    def _write_trades(self, conn, table_name, rows):
+        # rows = list of (timestamp, price, volume, side, ordertype, trade_id), where trade_id is 'None' for websocket trades
+        # trades that are already stored are skipped, so pages can be written again and the REST and websocket writers can overlap:
+        #   - a trade_id that is already in the table is skipped (and the unique key makes sure of it)
+        #   - a trade without a trade_id is skipped if the same trade (time, price, volume, side and ordertype) is already stored
+        #   - a trade that matches a stored trade without a trade_id fills in its trade_id (and side/ordertype) instead of adding a second row.
+        #     .csv rows have their timestamps cut to the second, so they match on the second, price and volume and get the exact timestamp
+        # the websocket sends timestamps with 6 decimals and the REST API with 7 (the websocket one is cut, not rounded), so everything
+        # else matches within a microsecond
+        # returns the rows that were actually added, which are the only ones that should go into the catalog and rollups
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return rows
+
+        # take the write lock before looking for the stored trades, so no other connection can add them in between
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+
+        # everything stored in the time range of the new trades (a single range on the timestamp index), from the start of the first second,
+        # grouped by second, price and volume
+        stored = {}
+        for rowid, timestamp, price, volume, side, ordertype, trade_id in conn.execute(
+                f'SELECT rowid, "timestamp", "price", "volume", "side", "ordertype", "trade_id" FROM "{table_name}" WHERE "timestamp" BETWEEN ? AND ?',
+                (math.floor(min(row[0] for row in rows)), max(row[0] for row in rows) + 0.000002)):
+            stored.setdefault((math.floor(timestamp), price, volume), []).append((rowid, timestamp, side, ordertype, trade_id))
+
+        added = []
+        claimed = []
+        used = set()
+        for row in rows:
+            timestamp, price, volume, side, ordertype, trade_id = row
+            candidates = stored.get((math.floor(timestamp), price, volume), [])
+            # the closest stored trade first, so a .csv row is only used once there is nothing closer
+            for rowid, stored_time, stored_side, stored_ordertype, stored_id in sorted(candidates, key=lambda candidate: abs(candidate[1] - timestamp)):
+                same_time = abs(stored_time - timestamp) < 0.0000015 or (stored_side is None and float(stored_time).is_integer())
+                # .csv rows have no side or ordertype, so those match anything
+                if (rowid not in used and same_time and (trade_id is None or stored_id is None or stored_id == trade_id)
+                        and stored_side in (None, side) and stored_ordertype in (None, ordertype)):
+                    used.add(rowid)
+                    if stored_id is None and (trade_id is not None or stored_side is None):
+                        claimed.append((trade_id, side, ordertype, timestamp, rowid))
+                    break
+            else:
+                added.append(row)
+
+        conn.executemany(f'UPDATE OR IGNORE "{table_name}" SET "trade_id" = COALESCE(?, "trade_id"), "side" = COALESCE("side", ?), '
+                         '"ordertype" = COALESCE("ordertype", ?), "timestamp" = ? WHERE rowid = ?', claimed)
+        conn.executemany(f'INSERT OR IGNORE INTO "{table_name}" ("timestamp", "price", "volume", "side", "ordertype", "trade_id") VALUES (?, ?, ?, ?, ?, ?)', added)
+
+        # a claimed .csv row moves from its whole second to the exact time, which can be after the last trade in the catalog
+        if claimed:
+            try:
+                conn.execute('UPDATE "kraken_catalog" SET "last_timestamp" = MAX("last_timestamp", ?) WHERE "pair" = ?', (max(claim[3] for claim in claimed), table_name))
+            except sqlite3.OperationalError:
+                # databases made by older versions don't have a catalog (see .migrate_db())
+                pass
+
+        return added
+
+    def _write_batch(self, conn, batch):
+        # batch = list of (table_name, rows), all written in one transaction
+        count = 0
+        with conn:
+            for table_name, rows in batch:
+                rows = self._write_trades(conn, table_name, rows)
+                self._update_catalog(conn, table_name, rows)
+                self._update_rollup(conn, table_name, rows)
+                count += len(rows)
+        return count
+
+    def _create_catalog(self, conn):
+        # one row per trade table, kept current by every writer so the first/last trade and row count never need a table scan
+        # last_cursor is the REST 'Trades' 'last' value (nanoseconds) that .update_db() continues from
+        # rollup_built is when .build_rollups() was run for the pair, and 'None' if it has no 1 minute rollups
+        conn.execute('CREATE TABLE IF NOT EXISTS "kraken_catalog" ("pair" TEXT PRIMARY KEY, "first_timestamp" REAL, "last_timestamp" REAL, "last_cursor" INTEGER, "row_count" INTEGER NOT NULL DEFAULT 0, "updated" REAL, "rollup_built" REAL)')
+        # catalogs made before the rollups existed
+        if 'rollup_built' not in [column[1] for column in conn.execute('PRAGMA table_info("kraken_catalog")')]:
+            conn.execute('ALTER TABLE "kraken_catalog" ADD COLUMN "rollup_built" REAL')
+
+    def _update_catalog(self, conn, table_name, rows, cursor=None):
+        # rows = list of (timestamp, price, volume, ...) that were just written to table_name
+        # the cursor is still saved when every trade was already stored
+        if not rows:
+            if cursor is not None:
+                conn.execute('UPDATE "kraken_catalog" SET "last_cursor" = ?, "updated" = ? WHERE "pair" = ?', (cursor, time.time(), table_name))
+            return
+
+        timestamps = [row[0] for row in rows]
+        conn.execute(
+            'INSERT INTO "kraken_catalog" ("pair", "first_timestamp", "last_timestamp", "last_cursor", "row_count", "updated") VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT("pair") DO UPDATE SET '
+            '"first_timestamp" = COALESCE(MIN("first_timestamp", excluded."first_timestamp"), excluded."first_timestamp", "first_timestamp"), '
+            '"last_timestamp" = COALESCE(MAX("last_timestamp", excluded."last_timestamp"), excluded."last_timestamp", "last_timestamp"), '
+            # trades written without a cursor (i.e.- from the websocket) that are newer than the cursor make it stale, so it is dropped
+            '"last_cursor" = CASE WHEN excluded."last_cursor" IS NOT NULL THEN excluded."last_cursor" '
+            'WHEN excluded."last_timestamp" > "last_timestamp" THEN NULL ELSE "last_cursor" END, '
+            '"row_count" = "row_count" + excluded."row_count", '
+            '"updated" = excluded."updated"',
+            (table_name, min(timestamps), max(timestamps), cursor, len(rows), time.time()))
+
+    def _rebuild_catalog(self, conn, table_name):
+        # recount a table from scratch (MIN/MAX come straight from the timestamp index, COUNT reads the whole index once)
+        count, first, last = conn.execute(f'SELECT COUNT(*), MIN("timestamp"), MAX("timestamp") FROM "{table_name}"').fetchone()
+        conn.execute(
+            'INSERT INTO "kraken_catalog" ("pair", "first_timestamp", "last_timestamp", "last_cursor", "row_count", "updated") VALUES (?, ?, ?, NULL, ?, ?) '
+            'ON CONFLICT("pair") DO UPDATE SET "first_timestamp" = excluded."first_timestamp", "last_timestamp" = excluded."last_timestamp", '
+            '"row_count" = excluded."row_count", "updated" = excluded."updated"',
+            (table_name, first, last, count, time.time()))
+
+    def _catalog_entry(self, conn, table_name):
+        try:
+            row = conn.execute('SELECT "first_timestamp", "last_timestamp", "last_cursor", "row_count", "updated", "rollup_built" FROM "kraken_catalog" WHERE "pair" = ?', (table_name,)).fetchone()
+        except sqlite3.OperationalError:
+            # databases made by older versions don't have a catalog (see .migrate_db())
+            return None
+
+        if row is None:
+            return None
+        return dict(zip(['first_timestamp', 'last_timestamp', 'last_cursor', 'row_count', 'updated', 'rollup_built'], row))
+
+
+# columns of a KrakenTickStore pair, as returned by KrakenTickStore.read()
+TickColumns = collections.namedtuple('TickColumns', ['timestamp', 'price', 'volume'])
+
+
+class KrakenTickStore:
+    '''
+    Append-only, memory-mapped store of the trade history, one folder per pair with a fixed width float64 file for each of
+    the timestamp, price and volume columns (see KrakenData.build_tick_store to fill it from a database).
+
+    Reads return numpy views straight onto the mapped files, so nothing is copied or parsed, and every process that opens the
+    same store shares the same pages through the OS file cache.  A sparse index (the timestamp of every 'block'th trade) keeps
+    time range lookups to a couple of page reads no matter how long the history is.
+        ex.:
+            store = KrakenTickStore('ticks')
+            ticks = store.read('XBTUSD', start_time='2023-01-01', end_time='2023-01-08')
+            vwap = (ticks.price * ticks.volume).sum() / ticks.volume.sum()
+        *NOTICE: views are read-only and only cover the trades that were in the store when .read() was called
+
+    args:
+        - root = folder the store is kept in (created if it doesn't exist)
+        * Optional: block = number of trades between sparse index entries
+            - Default is set to 4096
+    '''
+
+    columns = ('timestamp', 'price', 'volume')
+
+    def __init__(self, root, block=4096):
+        self.root = Path(root)
+        self.block = block
+        self.root.mkdir(parents=True, exist_ok=True)
+        # open maps: {pair: (count, TickColumns of np.memmap)} -- remapped whenever the files have grown
+        self._maps = {}
+
+    def pairs(self):
+        '''
+        returns:
+            - A list of the pairs in the store
+        '''
+        return sorted(folder.name for folder in self.root.iterdir() if (folder / 'timestamp.f8').exists())
+
+    def count(self, pair):
+        '''
+        returns:
+            - The number of trades stored for that pair
+        '''
+        # columns are appended one after the other, so only the rows that made it into every column count
+        sizes = [(self.root / pair / f'{column}.f8').stat().st_size if (self.root / pair / f'{column}.f8').exists() else 0 for column in self.columns]
+        return min(sizes) // 8
+
+    def last_timestamp(self, pair):
+        '''
+        returns:
+            - The timestamp of the newest trade stored for that pair, or 'None' if there are none
+        '''
+        columns = self._map(pair)
+        if columns is None:
+            return None
+        return float(columns.timestamp[-1])
+
+    def append(self, pair, timestamps, prices, volumes):
+        '''
+        args:
+            - pair = table name of the pair (i.e.- 'XBTUSD')
+            - timestamps, prices, volumes = equal length arrays of trades in time order, all newer than the last stored trade
+
+        returns:
+            - The number of trades stored for that pair
+        '''
+        timestamps = np.ascontiguousarray(timestamps, dtype='f8')
+        prices = np.ascontiguousarray(prices, dtype='f8')
+        volumes = np.ascontiguousarray(volumes, dtype='f8')
+
+        if not len(timestamps):
+            return self.count(pair)
+
+        if len(prices) != len(timestamps) or len(volumes) != len(timestamps):
+            raise Exception({'input_error': 'timestamps, prices and volumes must be the same length'})
+        if np.any(np.diff(timestamps) < 0):
+            raise Exception({'input_error': 'trades must be appended in time order'})
+
+        folder = self.root / pair
+        folder.mkdir(exist_ok=True)
+
+        start = self.count(pair)
+        last = self.last_timestamp(pair)
+        if last is not None and timestamps[0] < last:
+            raise Exception({'input_error': f'{pair} trades must be newer than the last stored trade ({last})'})
+
+        # a partly written append (i.e.- from a crash) is cut back to the last complete row before writing
+        for column, values in zip(self.columns, (timestamps, prices, volumes)):
+            with open(folder / f'{column}.f8', 'r+b' if (folder / f'{column}.f8').exists() else 'wb') as f:
+                f.truncate(start * 8)
+                f.seek(start * 8)
+                values.tofile(f)
+
+        # add an index entry for every block that starts inside the new rows
+        first_block = -(-start // self.block) * self.block
+        positions = np.arange(first_block, start + len(timestamps), self.block)
+        with open(folder / 'index.f8', 'r+b' if (folder / 'index.f8').exists() else 'wb') as f:
+            f.truncate((first_block // self.block) * 8)
+            f.seek((first_block // self.block) * 8)
+            timestamps[positions - start].tofile(f)
+
+        return start + len(timestamps)
+
+    def read(self, pair, start_time=None, end_time=None):
+        '''
+        args:
+            - pair = table name of the pair (i.e.- 'XBTUSD')
+            * Optional: start_time = anything pd.to_datetime understands, or a unix timestamp
+                - Default is set to 'None' which starts at the first trade
+            * Optional: end_time = anything pd.to_datetime understands, or a unix timestamp (inclusive)
+                - Default is set to 'None' which ends at the last trade
+
+        returns:
+            - TickColumns(timestamp, price, volume) of zero-copy numpy views for the trades in the range
+        '''
+        columns = self._map(pair)
+        if columns is None:
+            empty = np.empty(0, dtype='f8')
+            return TickColumns(empty, empty, empty)
+
+        first = 0 if start_time is None else self._search(pair, columns.timestamp, self._unix(start_time), 'left')
+        last = len(columns.timestamp) if end_time is None else self._search(pair, columns.timestamp, self._unix(end_time), 'right')
+
+        return TickColumns(*(column[first:last] for column in columns))
+
+    def read_df(self, pair, start_time=None, end_time=None):
+        '''
+        returns:
+            - The same trades as .read() as a dataframe in the KrakenData.trades_df() format (this one copies)
+        '''
+        ticks = self.read(pair, start_time, end_time)
+        data = pd.DataFrame({'price': ticks.price, 'volume': ticks.volume}, index=pd.Index(ticks.timestamp, name='timestamp'))
+        data.insert(0, 'date', pd.to_datetime(data.index, unit='s'))
+        return data
+
+    def _unix(self, value):
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            return float(value)
+        return datetime.timestamp(pd.to_datetime(value, utc=True))
+
+    def _search(self, pair, timestamps, value, side):
+        # find the block from the sparse index, then search only inside that block of the mapped column
+        index = np.fromfile(self.root / pair / 'index.f8', dtype='f8')
+        index = index[:-(-len(timestamps) // self.block)]
+        block = int(np.searchsorted(index, value, side))
+
+        low = max(block - 1, 0) * self.block
+        high = min(block * self.block + 1, len(timestamps))
+        return low + int(np.searchsorted(timestamps[low:high], value, side))
+
+    def _map(self, pair):
+        count = self.count(pair)
+        if count == 0:
+            return None
+
+        mapped = self._maps.get(pair)
+        if mapped is None or mapped[0] != count:
+            columns = TickColumns(*(np.memmap(self.root / pair / f'{column}.f8', dtype='f8', mode='r', shape=(count,)) for column in self.columns))
+            self._maps[pair] = (count, columns)
+
+        return self._maps[pair][1]
 
 
 class Math:
@@ -2649,4 +7229,47 @@ class Math:
     def round_up(number, decimals):
         number = float(number)
         multiplier = 10 ** decimals
-        return math.ceil(number * multiplier) / multiplier
\ No newline at end of file
+        return math.ceil(number * multiplier) / multiplier
+
+
+class RateLimiter:
+    '''
+    Thread safe call counter used to keep requests under the Kraken REST API rate limits.
+    The counter starts full at 'max_calls' and one call is added back every 'call_add_rate' seconds.
+
+    args:
+        * Optional: max_calls = maximum number of calls in the counter
+            - Default is set to 15
+        * Optional: call_add_rate = number of seconds it takes for one call to be added back to the counter
+            - Default is set to 3
+    '''
+
+    def __init__(self, max_calls=15, call_add_rate=3):
+        self.max_calls = max_calls
+        self.call_add_rate = call_add_rate
+        self._calls = float(max_calls)
+        self._call_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        '''
+        Blocks until 'cost' calls are available in the counter and then takes them.
+        '''
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._calls = min(self.max_calls, self._calls + ((now - self._call_time) / self.call_add_rate))
+                self._call_time = now
+
+                if self._calls >= cost:
+                    self._calls -= cost
+                    return
+
+                wait = (cost - self._calls) * self.call_add_rate
+
+            time.sleep(wait)
+
+
+# shared rate limiters for the public and private REST endpoints so concurrent code does not break Kraken's rate limits
+public_rate_limiter = RateLimiter(max_calls=15, call_add_rate=3)
+private_rate_limiter = RateLimiter(max_calls=15, call_add_rate=3)
@@ -0,0 +1,56 @@
+import math
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import kraken
+
+# midnight UTC, bars line up from here
+DAY = 86400 * 19000
+
+
+def test_bar_closes_when_a_trade_rolls_into_the_next_interval():
+    closed = []
+    builder = kraken.OHLCVBarBuilder(['1min'], on_bar=closed.append)
+
+    builder.update('ETH/USD', DAY + 5, 100.0, 1.0)
+    builder.update('ETH/USD', DAY + 20, 103.0, 2.0)
+    builder.update('ETH/USD', DAY + 59.999, 99.0, 0.5)
+    assert closed == []
+
+    # the end of the bar belongs to the next one
+    builder.update('ETH/USD', DAY + 60, 101.0, 1.0)
+
+    assert closed == [kraken.BarRecord('ETH/USD', '1min', DAY, 100.0, 103.0, 99.0, 99.0, 3.5, 3)]
+    assert builder.current('ETH/USD', '1min') == kraken.BarRecord('ETH/USD', '1min', DAY + 60, 101.0, 101.0, 101.0, 101.0, 1.0, 1)
+
+
+def test_intervals_without_trades_become_empty_bars():
+    closed = []
+    builder = kraken.OHLCVBarBuilder(['1min'], on_bar=closed.append)
+
+    builder.update('ETH/USD', DAY + 10, 100.0, 1.0)
+    builder.update('ETH/USD', DAY + 190, 102.0, 1.0)
+
+    assert [bar.time for bar in closed] == [DAY, DAY + 60, DAY + 120]
+    for bar in closed[1:]:
+        assert math.isnan(bar.open) and math.isnan(bar.close)
+        assert bar.volume == 0 and bar.trade_count == 0
+
+
+def test_flush_closes_bars_once_their_end_has_passed_and_late_trades_are_counted():
+    closed = []
+    builder = kraken.OHLCVBarBuilder(['1min', '5min'], on_bar=closed.append)
+
+    builder.update('ETH/USD', DAY + 30, 100.0, 1.0)
+    builder.flush(now=DAY + 59)
+    assert closed == []
+
+    builder.flush(now=DAY + 60)
+    assert [(bar.interval, bar.time) for bar in closed] == [('1min', DAY)]
+
+    # the 1min bar is closed, the 5min bar is still open and takes the trade
+    builder.update('ETH/USD', DAY + 45, 98.0, 1.0)
+    assert builder.late_trades == 1
+    assert builder.current('ETH/USD', '5min').trade_count == 2
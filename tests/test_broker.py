@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import kraken
+
+
+class FakeWS:
+    # just enough of KrakenWS for the broker to open subscriptions without a connection
+    _books = {}
+
+    def channel_name(self, channel, interval=None, depth=None):
+        return channel
+
+    def subscription_pairs(self, pair):
+        return pair if isinstance(pair, list) else [pair]
+
+    def subscribe(self, channel, pairs, handler=None, interval=None):
+        pass
+
+
+def test_late_joiners_get_state_but_not_the_last_trade():
+    broker = kraken.KrakenBroker(address=None, ws=FakeWS())
+    broker.subscribe('ticker', 'ETH/USD', handler=lambda *args: None)
+    broker.subscribe('trade', 'ETH/USD', handler=lambda *args: None)
+
+    ticker = {'c': ['100.0', '1.0']}
+    trade = [['100.0', '1.0', '1.000000', 'b', 'l', '']]
+    broker._publish('ticker', 'ETH/USD', ticker)
+    broker._publish('trade', 'ETH/USD', trade)
+
+    received = []
+    broker.subscribe('ticker', 'ETH/USD', handler=lambda *args: received.append(args))
+    broker.subscribe('trade', 'ETH/USD', handler=lambda *args: received.append(args))
+
+    assert received == [('ticker', 'ETH/USD', ticker)]
+    assert broker.latest('trade', 'ETH/USD') is None
+
+    # trades that come in after joining are still delivered
+    broker._publish('trade', 'ETH/USD', trade)
+    assert received[-1] == ('trade', 'ETH/USD', trade)
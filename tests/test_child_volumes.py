@@ -0,0 +1,44 @@
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import kraken
+
+
+child_volumes = kraken.KrakenExecution.child_volumes
+
+
+def lots(volumes, lot_decimals):
+    return sum(round(volume * 10 ** lot_decimals) for volume in volumes)
+
+
+def test_children_add_up_to_the_parent():
+    assert child_volumes(0.3, [1] * 3, 1, 0) == [0.1, 0.1, 0.1]
+
+
+def test_small_slices_roll_into_the_next_valid_child():
+    children = child_volumes(1, [1] * 10, 2, 0.25)
+
+    assert all(child == 0 or child >= 0.25 for child in children)
+    assert lots(children, 2) == 100
+
+
+def test_parent_below_the_minimum_is_one_child():
+    assert child_volumes(0.05, [1] * 3, 2, 0.1) == [0.0, 0.0, 0.05]
+
+
+def test_no_lots_lost_for_any_split():
+    rng = random.Random(7)
+    for _ in range(5000):
+        lot_decimals = rng.choice([1, 2, 4, 8])
+        total = rng.randint(1, 10 ** 6)
+        slices = rng.randint(1, 30)
+        weights = [rng.random() for _ in range(slices)] if rng.random() < 0.5 else [1] * slices
+        base_min = rng.choice([0, rng.randint(1, 50) / 10 ** lot_decimals])
+
+        children = child_volumes(total / 10 ** lot_decimals, weights, lot_decimals, base_min)
+
+        assert len(children) == slices
+        assert lots(children, lot_decimals) == total
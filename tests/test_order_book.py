@@ -0,0 +1,62 @@
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import kraken
+
+
+def crc(text):
+    return zlib.crc32(text.encode()) & 0xffffffff
+
+
+def snapshot():
+    return {
+        'as': [['0.05005', '0.00000500', '1582905487.684110'], ['0.05010', '0.00000500', '1582905486.187983']],
+        'bs': [['0.05000', '0.00000500', '1582905487.439814'], ['0.04995', '0.00010000', '1582905485.520347']],
+    }
+
+
+def test_checksum_uses_kraken_string_format():
+    book = kraken.KrakenOrderBook('ETH/XBT')
+    assert book.apply(snapshot())
+
+    # asks best first, then bids best first, each level as price + volume with the '.' and leading zeros removed
+    expected = crc('5005' + '500' + '5010' + '500' + '5000' + '500' + '4995' + '10000')
+    assert book.checksum() == expected
+
+
+def test_update_with_matching_checksum_keeps_the_book_valid():
+    book = kraken.KrakenOrderBook('ETH/XBT')
+    book.apply(snapshot())
+
+    # the best ask is removed, so the checksum now starts at the second ask
+    expected = crc('5010' + '500' + '5000' + '500' + '4995' + '10000')
+    update = {'a': [['0.05005', '0.00000000', '1582905488.000000']], 'c': str(expected)}
+
+    assert book.apply(update) is True
+    assert book.best_ask() == [0.0501, 0.000005]
+    assert book.checksum_failures == 0
+
+
+def test_checksum_mismatch_invalidates_the_book():
+    book = kraken.KrakenOrderBook('ETH/XBT')
+    book.apply(snapshot())
+
+    update = {'b': [['0.05001', '0.00000100', '1582905488.000000']], 'c': '12345'}
+
+    assert book.apply(update) is False
+    assert not book.valid
+    assert book.checksum_failures == 1
+    # updates are ignored until the next snapshot
+    assert book.apply({'a': [['0.05020', '0.00000100', '1582905489.000000']]}) is None
+    assert book.apply(snapshot()) is True
+
+
+def test_levels_past_the_depth_are_dropped():
+    book = kraken.KrakenOrderBook('ETH/XBT', depth=2)
+    book.apply(snapshot())
+    book.apply({'a': [['0.05001', '0.00000100', '1582905488.000000']]})
+
+    assert [price for price, _ in book.levels('ask')] == [0.05001, 0.05005]
@@ -0,0 +1,91 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import kraken
+
+
+def make_db(tmp_path, csv_rows, rest_rows=()):
+    db_path = str(tmp_path / 'kraken.db')
+    conn = sqlite3.connect(db_path)
+    data = kraken.KrakenData()
+    data._create_catalog(conn)
+    data._create_trade_table(conn, 'XBTUSD')
+    # the REST trades first, so the .csv rows land next to them as duplicates instead of being claimed
+    with conn:
+        data._write_trades(conn, 'XBTUSD', list(rest_rows))
+        data._insert_trades(conn, 'XBTUSD', csv_rows)
+        data._rebuild_catalog(conn, 'XBTUSD')
+    conn.close()
+    return data, db_path
+
+
+def repair(data, db_path, monkeypatch, trades, start=100, end=101):
+    # the REST 'Trades' endpoint returns 'trades' for the window, in the REST format [price, volume, time, side, ordertype, misc, trade_id]
+    monkeypatch.setattr(kraken.KrakenData, '_pair_info', lambda self, pairs=None: {'XXBTZUSD': {'altname': 'XBTUSD'}})
+    monkeypatch.setattr(kraken.KrakenData, '_get_trades_page', lambda self, session, pair, since, stop=None: (trades, since + 1, 1))
+
+    gaps = pd.DataFrame({'pair': ['XBTUSD'], 'kind': ['overlap'], 'start': [start], 'end': [end], 'trades': [0]})
+    return data.repair_gaps(db_path, gaps).iloc[0]
+
+
+def rest(timestamp, price, volume, trade_id):
+    return [str(price), str(volume), timestamp, 'b', 'l', '', trade_id]
+
+
+def rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT "timestamp", "price", "volume", "trade_id" FROM "XBTUSD" ORDER BY "timestamp", rowid').fetchall()
+    finally:
+        conn.close()
+
+
+def test_csv_copies_of_stored_trades_are_removed(tmp_path, monkeypatch):
+    trades = [rest(100.25, 10.0, 1.0, 1), rest(100.5, 11.0, 2.0, 2), rest(101.75, 12.0, 3.0, 3)]
+    data, db_path = make_db(tmp_path, [(100, 10.0, 1.0), (100, 11.0, 2.0), (101, 12.0, 3.0)],
+                            [(trade[2], float(trade[0]), float(trade[1]), 1, 1, trade[6]) for trade in trades])
+
+    result = repair(data, db_path, monkeypatch, trades)
+
+    assert (result['removed'], result['unmatched']) == (3, 0)
+    assert [row[3] for row in rows(db_path)] == [1, 2, 3]
+
+
+def test_csv_rows_without_a_fetched_trade_are_kept(tmp_path, monkeypatch):
+    # the page only came back with one of the two trades, so the other .csv row can't be shown to be a copy
+    trades = [rest(100.25, 10.0, 1.0, 1), rest(100.5, 11.0, 2.0, 2)]
+    data, db_path = make_db(tmp_path, [(100, 10.0, 1.0), (100, 11.0, 2.0)],
+                            [(trade[2], float(trade[0]), float(trade[1]), 1, 1, trade[6]) for trade in trades])
+
+    result = repair(data, db_path, monkeypatch, trades[:1])
+
+    assert (result['removed'], result['unmatched']) == (1, 1)
+    assert len(rows(db_path)) == 3
+
+
+def test_rounding_differences_still_match(tmp_path, monkeypatch):
+    trades = [rest(100.25, 30250.1, 0.0125, 1)]
+    data, db_path = make_db(tmp_path, [(100, 30250.100000001, 0.0125)],
+                            [(100.25, 30250.1, 0.0125, 1, 1, 1)])
+
+    result = repair(data, db_path, monkeypatch, trades)
+
+    assert (result['removed'], result['unmatched']) == (1, 0)
+    assert rows(db_path) == [(100.25, 30250.1, 0.0125, 1)]
+
+
+def test_claimed_csv_row_moves_the_catalog(tmp_path, monkeypatch):
+    data, db_path = make_db(tmp_path, [(100, 10.0, 1.0), (101, 11.0, 2.0)])
+
+    result = repair(data, db_path, monkeypatch, [rest(100.25, 10.0, 1.0, 1), rest(101.1, 11.0, 2.0, 2)])
+
+    assert (result['added'], result['removed'], result['unmatched']) == (0, 0, 0)
+    conn = sqlite3.connect(db_path)
+    entry = data._catalog_entry(conn, 'XBTUSD')
+    conn.close()
+    assert (entry['last_timestamp'], entry['row_count']) == (101.1, 2)
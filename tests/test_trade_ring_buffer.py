@@ -0,0 +1,59 @@
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import kraken
+
+
+def trades(times, price=100.0):
+    return kraken.trades_to_array([[str(price), '1.0', str(t), 'b', 'l', ''] for t in times])
+
+
+def test_wraps_around_and_keeps_the_newest():
+    buffer = kraken.TradeRingBuffer(capacity=4)
+    buffer.extend(trades([1, 2, 3]))
+    buffer.extend(trades([4, 5, 6]))
+
+    assert buffer.last()['time'].tolist() == [3, 4, 5, 6]
+    assert buffer.since(5)['time'].tolist() == [5, 6]
+
+
+def test_older_trades_are_merged_in_time_order():
+    buffer = kraken.TradeRingBuffer(capacity=5)
+    buffer.extend(trades([10, 11, 14, 15]))
+    # backfilled trades from before the newest live trade
+    buffer.extend(trades([12, 13], price=50.0))
+
+    assert buffer.last()['time'].tolist() == [11, 12, 13, 14, 15]
+    assert buffer.since(12)['time'].tolist() == [12, 13, 14, 15]
+    assert buffer.window(2.5, now=15)['price'].tolist() == [50.0, 100.0, 100.0]
+
+    # and the buffer keeps going from there
+    buffer.append(16, 100.0, 1.0)
+    assert buffer.last(3)['time'].tolist() == [14, 15, 16]
+    assert len(buffer) == 5
+
+
+def test_copies_are_consistent_while_writing():
+    buffer = kraken.TradeRingBuffer(capacity=100)
+    stop = threading.Event()
+
+    def write():
+        t = 0
+        while not stop.is_set():
+            buffer.extend(trades(np.arange(t, t + 7)))
+            t += 7
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(2000):
+            times = buffer.last(copy=True)['time']
+            assert np.all(np.diff(times) == 1)
+    finally:
+        stop.set()
+        writer.join()
@@ -0,0 +1,58 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import kraken
+
+
+def make_db():
+    conn = sqlite3.connect(':memory:')
+    data = kraken.KrakenData()
+    data._create_catalog(conn)
+    data._create_trade_table(conn, 'XBTUSD')
+    conn.commit()
+    return data, conn
+
+
+def test_rest_trade_matches_websocket_trade():
+    data, conn = make_db()
+
+    # the same trade from live_ingest() (websocket, 6 decimals, no trade_id) and then from update_db() (REST, 7 decimals)
+    websocket_row = (float('1688669597.827736'), 30250.1, 0.0125, 1, 0, None)
+    rest_row = (float('1688669597.8277369'), 30250.1, 0.0125, 1, 0, 61234567)
+
+    with conn:
+        assert data._write_trades(conn, 'XBTUSD', [websocket_row]) == [websocket_row]
+    with conn:
+        assert data._write_trades(conn, 'XBTUSD', [rest_row]) == []
+
+    # one row, which now has the REST trade_id and timestamp
+    assert conn.execute('SELECT "timestamp", "trade_id" FROM "XBTUSD"').fetchall() == [(rest_row[0], rest_row[5])]
+
+
+def test_websocket_trade_matches_rest_trade():
+    data, conn = make_db()
+
+    rest_row = (float('1688669597.8277369'), 30250.1, 0.0125, -1, 1, 61234567)
+    websocket_row = (float('1688669597.827736'), 30250.1, 0.0125, -1, 1, None)
+
+    with conn:
+        data._write_trades(conn, 'XBTUSD', [rest_row])
+    with conn:
+        assert data._write_trades(conn, 'XBTUSD', [websocket_row]) == []
+
+    assert conn.execute('SELECT COUNT(*) FROM "XBTUSD"').fetchone()[0] == 1
+
+
+def test_different_trades_in_the_same_microsecond_window_are_kept():
+    data, conn = make_db()
+
+    rows = [(1688669597.8277, 30250.1, 0.0125, 1, 0, 1), (1688669597.8277, 30250.1, 0.0125, 1, 0, 2)]
+    with conn:
+        assert data._write_trades(conn, 'XBTUSD', rows) == rows
+    with conn:
+        assert data._write_trades(conn, 'XBTUSD', rows) == []
+
+    assert conn.execute('SELECT COUNT(*) FROM "XBTUSD"').fetchone()[0] == 2